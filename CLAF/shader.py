@@ -1,4 +1,5 @@
 import os
+import hashlib
 import numpy as np
 
 import glm
@@ -9,27 +10,68 @@ from OpenGL.GL import *
 # - reference: https://gist.github.com/deepankarsharma/3494203  #
 #################################################################
 
+# process-wide cache of the linked programs
+# : key (hash of the shader sources and defines) -> [program id, reference count]
+#   a program is compiled and linked once per session, and deleted when no Shader uses it anymore
+program_cache = {}
+program_cache_stats = {"hits": 0, "misses": 0}
+
+def program_key(vtx_src_code, frag_src_code, defines=None):
+    key = hashlib.sha1()
+    key.update(vtx_src_code.encode())
+    key.update(b"\0")
+    key.update(frag_src_code.encode())
+    for name, value in sorted((defines or {}).items()):
+        key.update(("\0%s=%s" % (name, value)).encode())
+    return key.hexdigest()
+
+def add_defines(code, defines):
+    # insert '#define name value' lines right after the '#version' line
+    if not defines:
+        return code
+
+    define_lines = "".join("#define %s %s\n" % (name, value) for name, value in sorted(defines.items()))
+    if code.lstrip().startswith("#version"):
+        version_line, _, body = code.lstrip().partition("\n")
+        return version_line + "\n" + define_lines + body
+    return define_lines + code
+
+
 class Shader:
-    def __init__(self, vertex_path, fragment_path):
+    def __init__(self, vertex_path, fragment_path, defines=None):
         # open vertex shader and fragment shader code files
         abs_path = os.path.dirname(os.path.abspath(__file__))
 
         vtx_src_code   = open(os.path.join(abs_path, vertex_path), 'r').read()
         frag_src_code  = open(os.path.join(abs_path, fragment_path), 'r').read()
 
+        # reuse the program if the same sources (and defines) are already linked
+        self.key = program_key(vtx_src_code, frag_src_code, defines)
+        if self.key in program_cache:
+            program_cache[self.key][1] += 1
+            program_cache_stats["hits"] += 1
+        else:
+            program_id = self.link_program(add_defines(vtx_src_code, defines),
+                                           add_defines(frag_src_code, defines))
+            program_cache[self.key] = [program_id, 1]
+            program_cache_stats["misses"] += 1
+
+        self.id = program_cache[self.key][0]
+
+    def link_program(self, vtx_src_code, frag_src_code):
         # vertex shader and fragment shader
         vtx_shader   = self.add_shader(vtx_src_code, GL_VERTEX_SHADER)
         frag_shader  = self.add_shader(frag_src_code, GL_FRAGMENT_SHADER)
 
         # shader program
-        self.id = glCreateProgram()
-        glAttachShader(self.id, vtx_shader)
-        glAttachShader(self.id, frag_shader)
-        glLinkProgram(self.id)
-
-        if glGetProgramiv(self.id, GL_LINK_STATUS) != GL_TRUE:
-            info_log = glGetProgramInfoLog(self.id)
-            glDeleteProgram(self.id)
+        program_id = glCreateProgram()
+        glAttachShader(program_id, vtx_shader)
+        glAttachShader(program_id, frag_shader)
+        glLinkProgram(program_id)
+
+        if glGetProgramiv(program_id, GL_LINK_STATUS) != GL_TRUE:
+            info_log = glGetProgramInfoLog(program_id)
+            glDeleteProgram(program_id)
             glDeleteShader(vtx_shader)
             glDeleteShader(frag_shader)
             raise RuntimeError("ERROR::SHADER::PROGRAM::LINKING_FAILED %s ", info_log)
@@ -38,6 +80,8 @@ class Shader:
         glDeleteShader(vtx_shader)
         glDeleteShader(frag_shader)
 
+        return program_id
+
     def add_shader(self, code, shader_type):
         try:
             shader_id = glCreateShader(shader_type)
@@ -54,6 +98,17 @@ class Shader:
     def use(self):
         glUseProgram(self.id)
 
+    def release(self):
+        # the program is deleted when the last Shader using it is released
+        if self.key is None:
+            return
+
+        program_cache[self.key][1] -= 1
+        if program_cache[self.key][1] == 0:
+            glDeleteProgram(self.id)
+            del program_cache[self.key]
+        self.key = None
+
     def set_bool(self, name, value):
         glUniform1i(glGetUniformLocation(self.id, name), int(value))
     
@@ -44,6 +44,14 @@ def main(args):
                         glm.vec3(-1.3,  1.0,  -1.5),
                     ]
 
+    # shader program (linked once, not every frame)
+    shader_program = Shader(args.vtx_shader, args.frag_shader)
+
+    # textures (decoded and uploaded once, not every frame)
+    texture_list = []
+    for i in range(np.size(args.img_file_path)):
+        texture_list.append([load_texture(args.img_file_path[i]), "texture" + str(i + 1)])
+
 
     # render loop
     while not glfw.window_should_close(window):
@@ -110,8 +118,6 @@ def main(args):
         # opengl render
         gl.glEnable(GL_DEPTH_TEST)
 
-        shader_program = Shader(args.vtx_shader, args.frag_shader)
-
         primitive_program = Primitive()
         vertices, indices = primitive_program.get_primitive(primitive_type)
         if (vertices is None) and (indices is None):
@@ -130,12 +136,6 @@ def main(args):
 
 
         # textures
-        # load and create a texture
-        # bind textures on corresponding texture units        
-        texture_list = []
-        for i in range(np.size(args.img_file_path)):
-            texture_list.append([load_texture(args.img_file_path[i]), "texture" + str(i + 1)])
-
         # tell opengl for each sampler to which texture unit it belongs to (only has to be done once)
         shader_program.use()    # don't forget to activate/use the shader before setting uniforms!
         for i in range(0, len(texture_list)):
@@ -195,6 +195,10 @@ def main(args):
         impl.render(imgui.get_draw_data())
         glfw.swap_buffers(window)
 
+    shader_program.release()
+    for texture, _ in texture_list:
+        glDeleteTextures(1, texture)
+
     impl.shutdown()
     glfw.terminate()
 
@@ -5,7 +5,9 @@ from OpenGL.GL import *
 import imgui
 
 from visualizer.primitives import Primitive
+from visualizer.geometry   import index_type, upload_mesh
 from visualizer.utils      import *
+from visualizer.vertex_layout import vertex_arrays
 from viewer                import GLContent
 
 
@@ -77,51 +79,59 @@ class Content(GLContent):
         
         self.primitive = 0
 
+        self.shader = None
+        self.VAO, self.VBO, self.EBO = None, None, None
+
     def inspector(self):
         imgui.begin_group()
 
         imgui.push_item_width(100)
-        clicked, self.primitive = imgui.combo(
+        changed_primitive, self.primitive = imgui.combo(
             " Primitive", self.primitive, ["tri", "rect"]
         )
+        if changed_primitive:
+            self.request_rebuild()
         imgui.pop_item_width()
 
         imgui.end_group()
 
-    ### main
-    def render(self):
+    def setup(self):
         # set shader program
         self.shader = set_shader_program()
 
+        self.set_geometry()
+
+    def rebuild(self):
+        # only the geometry depends on the inspector setting
+        self.delete_geometry()
+        self.set_geometry()
+
+    def set_geometry(self):
         # select primitive type
         if self.primitive == 0:
-            vertices, indices = Primitive.triangle()
+            shape = "triangle"
         elif self.primitive == 1:
-            vertices, indices = Primitive.rectangle()
+            shape = "rectangle"
         else:
             print("Please write target primitive ('triangle', 'rect')")
             exit()
-        
-        self.VAO = glGenVertexArrays(1)
-        self.VBO = glGenBuffers(1)
-        self.EBO = glGenBuffers(1) if indices is not None else None
-
-        # bind the Vertex Array Object first, then bind and set vertex buffer(s),
-        # and then configure vertex attribute(s)
-        glBindVertexArray(self.VAO)
+        vertices, indices, layout = Primitive.geometry(shape)     # : compact vertex formats (visualizer.vertex_format)
 
-        # copy vertices array in a buffer for OpenGL to use
-        glBindBuffer(GL_ARRAY_BUFFER, self.VBO)
-        glBufferData(GL_ARRAY_BUFFER, vertices, GL_STATIC_DRAW)
+        # copy the vertices and the indices in buffers for OpenGL to use
+        self.VBO, self.EBO = upload_mesh(vertices, indices)
+        self.index_count, self.index_type = len(indices), index_type(indices)
 
-        if self.EBO is not None:
-            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.EBO)
-            glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices, GL_STATIC_DRAW)
+        # the vertex array configures the attributes of the shape's layout the program reads (aPos only here)
+        self.VAO = vertex_arrays.get(self.shader, layout, self.VBO, self.EBO)
 
-        # set the vertex attributes pointers
-        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 5 * sizeof(GLfloat), ctypes.c_void_p(0))
-        glEnableVertexAttribArray(0)    # specify the index of the vertex attribute to be enabled
+    def delete_geometry(self):
+        if self.VBO is not None:
+            vertex_arrays.release_buffers(self.VBO, self.EBO)     # : the VAO goes with its buffers
+            glDeleteBuffers(2, [self.VBO, self.EBO])
+        self.VAO, self.VBO, self.EBO = None, None, None
 
+    ### main
+    def render(self):
         # render
         glClearColor(0.2, 0.3, 0.3, 1.0)
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
@@ -130,16 +140,12 @@ class Content(GLContent):
         glUseProgram(self.shader)
 
         glBindVertexArray(self.VAO)
-        if self.EBO is None:
-            glDrawArrays(GL_TRIANGLES, 0, 3)
-        if self.EBO is not None:
-            glDrawElements(GL_TRIANGLES, 6, GL_UNSIGNED_INT, ctypes.c_void_p(0)) # last argument is indices that specifies an offset in a buffer
-                                                                                    # or a pointer to the location where the indices are stored
+        glDrawElements(GL_TRIANGLES, self.index_count, self.index_type, ctypes.c_void_p(0)) # last argument is indices that specifies an offset in a buffer
+                                                                                            # or a pointer to the location where the indices are stored
 
     def destroy(self):
-        glDeleteVertexArrays(1, self.VAO)
-        glDeleteBuffers(1, self.VBO)
-        if self.EBO is not None:
-            glDeleteBuffers(1, self.EBO)
+        self.delete_geometry()
 
-        glDeleteProgram(self.shader)
\ No newline at end of file
+        if self.shader is not None:
+            glDeleteProgram(self.shader)
+            self.shader = None
@@ -45,8 +45,9 @@ class Content(GLContent):
         self.folder_path = ['0301_shaders_uniform_variable', '0301_shaders_uniform_variable', '0302_shaders_color_vertex_array']
         self.vtx_path    = ['0301_vtx_shader.vs', '0301_vtx_shader.vs', '0302_vtx_shader.vs']
         self.frag_path   = ['0301_frag_shader.fs', '0301_uniform_frag_shader.fs', '0302_frag_shader.fs']
-        self.shader = Shader(os.path.join(file_path, self.folder_path[0], self.vtx_path[0]),
-                             os.path.join(file_path, self.folder_path[0], self.frag_path[0]))
+
+        self.shader = None
+        self.VAO, self.VBO, self.EBO = None, None, None
     
     def inspector(self):
         imgui.begin_group()
@@ -55,19 +56,16 @@ class Content(GLContent):
             " Task", self.task, ["1", "2", "3"]
         )
         if changed_task:
-            self.shader = Shader(os.path.join(self.file_path,
-                                              self.folder_path[self.task],
-                                              self.vtx_path[self.task]),
-                                 os.path.join(self.file_path,
-                                              self.folder_path[self.task],
-                                              self.frag_path[self.task]))
+            self.request_rebuild()
         imgui.pop_item_width()
 
         imgui.dummy(0, 5)
         imgui.push_item_width(100)
-        _, self.primitive = imgui.combo(
+        changed_primitive, self.primitive = imgui.combo(
             " Primitive", self.primitive, ["tri", "rect"]
         )
+        if changed_primitive:
+            self.request_rebuild()
         imgui.pop_item_width()
 
 
@@ -77,7 +75,15 @@ class Content(GLContent):
 
         imgui.end_group()
 
-    def render(self):
+    def setup(self):
+        # the shader program and the vertex attributes depend on the task
+        self.shader = Shader(os.path.join(self.file_path,
+                                          self.folder_path[self.task],
+                                          self.vtx_path[self.task]),
+                             os.path.join(self.file_path,
+                                          self.folder_path[self.task],
+                                          self.frag_path[self.task]))
+
         # select primitive type
         if self.primitive == 0:
             vertices, indices = set_triangle()
@@ -128,7 +134,7 @@ class Content(GLContent):
         #  So, we don't need to use glBindVertexArray function here and in the while loop to run this simple triangle example.
         glBindVertexArray(0)
 
-
+    def render(self):
         # render
         glClearColor(0.2, 0.3, 0.3, 1.0)
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
@@ -154,7 +160,13 @@ class Content(GLContent):
 
     
     def destroy(self):
-        glDeleteVertexArrays(1, self.VAO)
-        glDeleteBuffers(1, self.VBO)
+        if self.VAO is not None:
+            glDeleteVertexArrays(1, self.VAO)
+            glDeleteBuffers(1, self.VBO)
         if self.EBO is not None:
-            glDeleteBuffers(1, self.EBO)
\ No newline at end of file
+            glDeleteBuffers(1, self.EBO)
+        self.VAO, self.VBO, self.EBO = None, None, None
+
+        if self.shader is not None:
+            self.shader.release()
+            self.shader = None
@@ -7,30 +7,7 @@ from PIL import Image
 from viewer import GLContent
 from visualizer.shader     import Shader
 from visualizer.utils      import *
-
-def load_texture(file_path):
-    texture = glGenTextures(1)
-
-    glBindTexture(GL_TEXTURE_2D, texture)   # all upcoming GL_TEXTURE_2D operations now have effect on this texture object
-    
-    # set the texture wrapping parameters
-    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)    # set texture wrapping to GL_REPEAT (default wrapping method)
-    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
-
-    # set texture filtering parameters
-    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR_MIPMAP_LINEAR)
-    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
-
-    img = Image.open(file_path)
-    img_w, img_h, img_data = img.size[0], img.size[1], img.tobytes("raw", "RGBA", 0, -1)
-    if(img_data):
-        # Note that 7th parameter(color type) is same as the img's color type
-        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, img_w, img_h, 0, GL_RGBA, GL_UNSIGNED_BYTE, img_data)
-        glGenerateMipmap(GL_TEXTURE_2D)
-    else:
-        print("Failed to load texture")
-    
-    return texture
+from visualizer.texture    import texture_manager
 
 # vertices, indices setting
 def set_triangle():
@@ -70,6 +47,10 @@ class Content(GLContent):
         self.img_path_list, self.img_name_list = get_img_list(self.file_path)
         self.texture_img_list = []
 
+        self.shader = None
+        self.VAO, self.VBO, self.EBO = None, None, None
+        self.texture_list = []
+
     
     def inspector(self):
         imgui.begin_group()
@@ -83,6 +64,7 @@ class Content(GLContent):
                 self.texture_img_list = []
             else:
                 self.texture_img_list = [self.img_path_list[self.img1-1]]
+            self.request_rebuild()
 
         if (self.img1 != 0):
             changed_img2, self.img2 = imgui.combo(
@@ -94,23 +76,37 @@ class Content(GLContent):
                     self.texture_img_list = [self.img_path_list[self.img1-1]]
                 else:
                     self.texture_img_list.append(self.img_path_list[self.img2-1])
+                self.request_rebuild()
         else:
             self.img2 = 0
 
 
         imgui.dummy(0, 5)
         imgui.push_item_width(100)
-        _, self.primitive = imgui.combo(
+        changed_primitive, self.primitive = imgui.combo(
             " Primitive", self.primitive, ["tri", "rect"]
         )
+        if changed_primitive:
+            self.request_rebuild()
         imgui.pop_item_width()
 
         imgui.end_group()
 
-    def render(self):
+    def setup(self):
         self.shader = Shader(os.path.join(self.file_path, '04_vtx_shader.vs'),
                              os.path.join(self.file_path, '04_frag_shader.fs'))
-        
+
+        self.set_geometry()
+        self.set_textures()
+
+    def rebuild(self):
+        # the shader program does not depend on the inspector setting
+        self.delete_geometry()
+        self.delete_textures()
+        self.set_geometry()
+        self.set_textures()
+
+    def set_geometry(self):
         # select primitive type
         if self.primitive == 0:
             vertices, indices = set_triangle()
@@ -148,38 +144,53 @@ class Content(GLContent):
         glVertexAttribPointer(2, 2, GL_FLOAT, GL_FALSE, 8 * sizeof(GLfloat), ctypes.c_void_p(6 * sizeof(GLfloat)))
         glEnableVertexAttribArray(2)
 
+        # Binding 0 as a buffer resets the currently bound buffer to a NULL-like state
+        # note that this is allowed, the call to glVertexAttribPointer registered self.VBO
+        # as the vertex attribute's bound vertex bound object so afterwards we can safely unbind
+        # glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glBindVertexArray(0)
+
+    def set_textures(self):
         # load and create a texture
-        texture_list = []
+        self.texture_list = []
         for i in range(np.size(self.texture_img_list)):
-            texture_list.append([load_texture(self.texture_img_list[i]), "texture" + str(i + 1)])
+            self.texture_list.append([texture_manager.load(self.texture_img_list[i], min_filter=GL_LINEAR_MIPMAP_LINEAR), "texture" + str(i + 1)])
         # texture1 = load_texture(self.texture_img_list[0])
         # texture2 = load_texture(self.texture_img_list[1])
 
         # tell opengl for each sampler to which texture unit it belongs to (only has to be done once)
         self.shader.use()    # don't forget to activate/use the shader before setting uniforms!
-        self.shader.set_int("textureNum", len(texture_list))
-        for i in range(0, len(texture_list)):
-            self.shader.set_int(texture_list[i][1], i)
+        self.shader.set_int("textureNum", len(self.texture_list))
+        for i in range(0, len(self.texture_list)):
+            self.shader.set_int(self.texture_list[i][1], i)
         # either set it manually like so:
         # glUniform1i(glGetUniformLocation(self.shader.id, "texture1"), 0)
         # self.shader.set_int("texture1", 0)
         # # or set it via the texture class
         # self.shader.set_int("texture2", 1)
 
-        # Binding 0 as a buffer resets the currently bound buffer to a NULL-like state
-        # note that this is allowed, the call to glVertexAttribPointer registered self.VBO
-        # as the vertex attribute's bound vertex bound object so afterwards we can safely unbind
-        # glBindBuffer(GL_ARRAY_BUFFER, 0)
-        
+    def delete_geometry(self):
+        if self.VAO is not None:
+            glDeleteVertexArrays(1, self.VAO)
+            glDeleteBuffers(1, self.VBO)
+        if self.EBO is not None:
+            glDeleteBuffers(1, self.EBO)
+        self.VAO, self.VBO, self.EBO = None, None, None
+
+    def delete_textures(self):
+        for texture, _ in self.texture_list:
+            texture_manager.release(texture)
+        self.texture_list = []
 
+    def render(self):
         # render
         glClearColor(0.2, 0.3, 0.3, 1.0)
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
 
         # bind texture
-        for i in range(len(texture_list)):
+        for i in range(len(self.texture_list)):
             glActiveTexture(GL_TEXTURE0 + i)
-            glBindTexture(GL_TEXTURE_2D, texture_list[i][0])
+            glBindTexture(GL_TEXTURE_2D, self.texture_list[i][0])
         # glActiveTexture(GL_TEXTURE0)
         # glBindTexture(GL_TEXTURE_2D, texture_list[0][0])
         # glActiveTexture(GL_TEXTURE1)
@@ -195,7 +206,9 @@ class Content(GLContent):
                                                                                  # or a pointer to the location where the indices are stored
     
     def destroy(self):
-        glDeleteVertexArrays(1, self.VAO)
-        glDeleteBuffers(1, self.VBO)
-        if self.EBO is not None:
-            glDeleteBuffers(1, self.EBO)
\ No newline at end of file
+        self.delete_geometry()
+        self.delete_textures()
+
+        if self.shader is not None:
+            self.shader.release()
+            self.shader = None
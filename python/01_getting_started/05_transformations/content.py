@@ -8,7 +8,10 @@ from PIL import Image
 from viewer import GLContent
 from visualizer.shader     import Shader
 from visualizer.primitives import Primitive
+from visualizer.geometry   import index_type, upload_mesh
 from visualizer.utils      import *
+from visualizer.vertex_layout import vertex_arrays
+from visualizer.texture    import texture_manager
 
 
 class Content(GLContent):
@@ -24,6 +27,10 @@ class Content(GLContent):
         self.img_path_list, self.img_name_list = get_img_list(img_path)
         self.texture_img_list = [self.img_path_list[self.img1-1], self.img_path_list[self.img2-1]]
 
+        self.shader = None
+        self.VAO, self.VBO, self.EBO = None, None, None
+        self.texture_list = []
+
     def inspector(self):
         imgui.begin_group()
 
@@ -36,6 +43,7 @@ class Content(GLContent):
                 self.texture_img_list = []
             else:
                 self.texture_img_list = [self.img_path_list[self.img1-1]]
+            self.request_rebuild()
         if (self.img1 != 0):
             changed_img2, self.img2 = imgui.combo(
                 " Image 2", self.img2, self.img_name_list
@@ -45,6 +53,7 @@ class Content(GLContent):
                     self.texture_img_list = [self.img_path_list[self.img1-1]]
                 else:
                     self.texture_img_list.append(self.img_path_list[self.img2-1])
+                self.request_rebuild()
         else:
             self.img2 = 0
         
@@ -55,75 +64,81 @@ class Content(GLContent):
         imgui.pop_item_width()
 
         imgui.push_item_width(100)
-        _, self.primitive = imgui.combo(
+        changed_primitive, self.primitive = imgui.combo(
             " Primitive", self.primitive, ["tri", "rect"]
         )
+        if changed_primitive:
+            self.request_rebuild()
         imgui.pop_item_width()
 
         imgui.end_group()
 
 
-    def render(self):
+    def setup(self):
         # set shader program
-        shader = Shader(os.path.join(self.file_path, '05_vtx_shader.vs'),
-                        os.path.join(self.file_path, '05_frag_shader.fs'))
+        self.shader = Shader(os.path.join(self.file_path, '05_vtx_shader.vs'),
+                             os.path.join(self.file_path, '05_frag_shader.fs'))
 
+        self.set_geometry()
+        self.set_textures()
 
+    def rebuild(self):
+        # the shader program does not depend on the inspector setting
+        self.delete_geometry()
+        self.delete_textures()
+        self.set_geometry()
+        self.set_textures()
+
+    def set_geometry(self):
         # select primitive type
         if self.primitive == 0:
-            vertices, indices = Primitive.triangle()
+            shape = "triangle"
         elif self.primitive == 1:
-            vertices, indices = Primitive.rectangle()
+            shape = "rectangle"
         else:
             print("Please write target primitive ('triangle', 'rect')")
             exit()
+        vertices, indices, layout = Primitive.geometry(shape)     # : compact vertex formats (visualizer.vertex_format)
 
-        # set up vertex data (and buffer(s)) and configure vertex attributes
-        self.VAO = glGenVertexArrays(1)
-        self.VBO = glGenBuffers(1)
-        self.EBO = glGenBuffers(1) if indices is not None else None
-
-        # bind the Vertex Array Object first, then bind and set vertex buffer(s),
-        # and then configure vertex attribute(s)
-        glBindVertexArray(self.VAO)
-
-        # copy vertices array in a buffer for OpenGL to use
-        glBindBuffer(GL_ARRAY_BUFFER, self.VBO)
-        glBufferData(GL_ARRAY_BUFFER, vertices, GL_STATIC_DRAW)
-
-        if self.EBO is not None:
-            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.EBO)
-            glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices, GL_STATIC_DRAW)
-
-        
-        # position attribute
-        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 5 * sizeof(GLfloat), ctypes.c_void_p(0))
-        glEnableVertexAttribArray(0)
-        # texture coord attribute
-        glVertexAttribPointer(1, 2, GL_FLOAT, GL_FALSE, 5 * sizeof(GLfloat), ctypes.c_void_p(3 * sizeof(GLfloat)))
-        glEnableVertexAttribArray(1)
+        # copy the vertices and the indices in buffers for OpenGL to use
+        self.VBO, self.EBO = upload_mesh(vertices, indices)
+        self.index_count, self.index_type = len(indices), index_type(indices)
 
+        # the vertex array configures the attributes of the shape's layout the shader reads
+        self.VAO = vertex_arrays.get(self.shader.id, layout, self.VBO, self.EBO)
 
+    def set_textures(self):
         # load and create a texture
-        texture_list = []
+        self.texture_list = []
         for i in range(np.size(self.texture_img_list)):
-            texture_list.append([load_texture(self.texture_img_list[i]), "texture" + str(i + 1)])
+            self.texture_list.append([texture_manager.load(self.texture_img_list[i]), "texture" + str(i + 1)])
 
         # tell opengl for each sampler to which texture unit it belongs to (only has to be done once)
-        shader.use()    # don't forget to activate/use the shader before setting uniforms!
-        shader.set_int("textureNum", len(texture_list))
-        for i in range(0, len(texture_list)):
-            shader.set_int(texture_list[i][1], i)
+        self.shader.use()    # don't forget to activate/use the shader before setting uniforms!
+        self.shader.set_int("textureNum", len(self.texture_list))
+        for i in range(0, len(self.texture_list)):
+            self.shader.set_int(self.texture_list[i][1], i)
+
+    def delete_geometry(self):
+        if self.VBO is not None:
+            vertex_arrays.release_buffers(self.VBO, self.EBO)     # : the VAO goes with its buffers
+            glDeleteBuffers(2, [self.VBO, self.EBO])
+        self.VAO, self.VBO, self.EBO = None, None, None
+
+    def delete_textures(self):
+        for texture, _ in self.texture_list:
+            texture_manager.release(texture)
+        self.texture_list = []
 
-        
+    def render(self):
         # render
         glClearColor(0.2, 0.3, 0.3, 1.0)
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
 
         # bind textures on corresponding texture units
-        for i in range(len(texture_list)):
+        for i in range(len(self.texture_list)):
             glActiveTexture(GL_TEXTURE0 + i)
-            glBindTexture(GL_TEXTURE_2D, texture_list[i][0])
+            glBindTexture(GL_TEXTURE_2D, self.texture_list[i][0])
 
         # create transformations
         trf_mat = glm.mat4(1.0)   # make sure to initialize matrix to identity matrix first
@@ -141,16 +156,14 @@ class Content(GLContent):
             trf_mat = glm.rotate(trf_mat, float(glfw.get_time()), glm.vec3(0.0, 0.0, 1.0))
 
         # draw
-        trf_location = glGetUniformLocation(shader.id, "transform")
+        self.shader.use()
+        trf_location = glGetUniformLocation(self.shader.id, "transform")
         glUniformMatrix4fv(trf_location, 1, GL_FALSE, glm.value_ptr(trf_mat))
 
         # render container
         glBindVertexArray(self.VAO)
-        if self.EBO is None:
-            glDrawArrays(GL_TRIANGLES, 0, 3)
-        else:
-            glDrawElements(GL_TRIANGLES, 6, GL_UNSIGNED_INT, ctypes.c_void_p(0)) # last argument is indices that specifies an offset in a buffer
-                                                                                    # or a pointer to the location where the indices are stored
+        glDrawElements(GL_TRIANGLES, self.index_count, self.index_type, ctypes.c_void_p(0)) # last argument is indices that specifies an offset in a buffer
+                                                                                            # or a pointer to the location where the indices are stored
 
         if self.task == 3:
             # second transform
@@ -160,15 +173,14 @@ class Content(GLContent):
             trf_mat = glm.scale(trf_mat, glm.vec3(scale_amount, scale_amount, scale_amount))
             glUniformMatrix4fv(trf_location, 1, GL_FALSE, glm.value_ptr(trf_mat))
 
-            if self.EBO is None:
-                glDrawArrays(GL_TRIANGLES, 0, 3)
-            else:
-                glDrawElements(GL_TRIANGLES, 6, GL_UNSIGNED_INT, ctypes.c_void_p(0)) # last argument is indices that specifies an offset in a buffer
-                                                                                    # or a pointer to the location where the indices are stored
+            glDrawElements(GL_TRIANGLES, self.index_count, self.index_type, ctypes.c_void_p(0)) # last argument is indices that specifies an offset in a buffer
+                                                                                                # or a pointer to the location where the indices are stored
 
 
     def destroy(self):
-        glDeleteVertexArrays(1, self.VAO)
-        glDeleteBuffers(1, self.VBO)
-        if self.EBO is not None:
-            glDeleteBuffers(1, self.EBO)
\ No newline at end of file
+        self.delete_geometry()
+        self.delete_textures()
+
+        if self.shader is not None:
+            self.shader.release()
+            self.shader = None
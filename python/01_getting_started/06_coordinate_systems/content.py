@@ -9,6 +9,12 @@ from viewer import GLContent
 from visualizer.shader     import Shader
 from visualizer.primitives import Primitive
 from visualizer.utils      import *
+from visualizer.mesh_arena import mesh_arenas
+from visualizer.texture    import texture_manager
+from visualizer.render_queue import render_queue, view_depth
+from visualizer.uniform_buffer import camera_buffer
+from visualizer.instancing import InstanceBuffer, InstanceStream, cube_model_matrices, spawn_cube_positions
+from visualizer.multi_draw import DrawBatcher
 
 
 class Content(GLContent):
@@ -37,6 +43,23 @@ class Content(GLContent):
                                 glm.vec3(-1.3,  1.0,  -1.5),
                               ]
 
+        # instanced mode of task 3: one draw call for all the cubes, also for many more cubes
+        self.instanced       = False
+        self.cube_count      = 0
+        self.cube_count_list = [len(self.cube_positions), 10000, 100000, 1000000]
+        self.animate         = False     # : rotating cubes, their matrices streamed every frame
+        self.instance_positions = None
+
+        # batched mode of task 3: as many objects, each a triangle, a rectangle or a box, grouped in a few multi-draws
+        self.batched = False
+        self.batcher = None
+        self.batch_meshes, self.batch_mesh_ids, self.batch_model_mats = [], None, None
+
+        self.shader = None
+        self.VAO, self.mesh = None, None
+        self.instances = None
+        self.texture_list = []
+
     def inspector(self):
         imgui.begin_group()
 
@@ -49,6 +72,7 @@ class Content(GLContent):
                 self.texture_img_list = []
             else:
                 self.texture_img_list = [self.img_path_list[self.img1-1]]
+            self.request_rebuild()
         if (self.img1 != 0):
             changed_img2, self.img2 = imgui.combo(
                 " Image 2", self.img2, self.img_name_list
@@ -58,114 +82,168 @@ class Content(GLContent):
                     self.texture_img_list = [self.img_path_list[self.img1-1]]
                 else:
                     self.texture_img_list.append(self.img_path_list[self.img2-1])
+                self.request_rebuild()
         else:
             self.img2 = 0
         
         imgui.push_item_width(100)
-        _, self.task = imgui.combo(
+        changed_task, self.task = imgui.combo(
             " Task", self.task, ["1", "2", "3"]
         )
+        if changed_task and (self.instanced or self.batched):
+            self.request_rebuild()
         imgui.pop_item_width()
 
+        if self.task == 2:
+            changed_instanced, self.instanced = imgui.checkbox("Instanced", self.instanced)
+            changed_batched = False
+            if not self.instanced:
+                changed_batched, self.batched = imgui.checkbox("Batched", self.batched)
+            changed_count = False
+            if self.instanced or self.batched:
+                imgui.push_item_width(100)
+                changed_count, self.cube_count = imgui.combo(
+                    " Cubes", self.cube_count, ["10", "10k", "100k", "1M"]
+                )
+                imgui.pop_item_width()
+                changed_animate, self.animate = imgui.checkbox("Animate", self.animate)
+                changed_count = changed_count or changed_animate
+            if changed_instanced or changed_batched or changed_count:
+                self.request_rebuild()
+
         imgui.push_item_width(100)
-        _, self.primitive = imgui.combo(
+        changed_primitive, self.primitive = imgui.combo(
             " Primitive", self.primitive, ["tri", "rect", "box"]
         )
+        if changed_primitive:
+            self.request_rebuild()
         imgui.pop_item_width()
 
         imgui.end_group()
 
 
-    def render(self):
-        # set shader program
-        shader = Shader(os.path.join(self.file_path, '06_vtx_shader.vs'),
-                        os.path.join(self.file_path, '06_frag_shader.fs'))
+    def setup(self):
+        self.set_shader()
+        self.set_geometry()
+        self.set_textures()
 
+    def rebuild(self):
+        self.shader.release()
+        self.delete_geometry()
+        self.delete_textures()
+        self.set_shader()
+        self.set_geometry()
+        self.set_textures()
 
+    def is_instanced(self):
+        return self.task == 2 and self.instanced
+
+    def is_batched(self):
+        return self.task == 2 and self.batched and not self.instanced
+
+    def set_shader(self):
+        # set shader program (the instanced one reads the model matrix from a vertex attribute)
+        self.shader = Shader(os.path.join(self.file_path, '06_vtx_shader.vs'),
+                             os.path.join(self.file_path, '06_frag_shader.fs'),
+                             {"INSTANCED": 1} if self.is_instanced() or self.is_batched() else None)
+
+    def set_geometry(self):
         # select primitive type
         if self.primitive == 0:
-            vertices, indices = Primitive.triangle()
+            shape = "triangle"
         elif self.primitive == 1:
-            vertices, indices = Primitive.rectangle()
+            shape = "rectangle"
         elif self.primitive == 2:
-            vertices, indices = Primitive.box()
+            shape = "box"
         else:
             print("Please write target primitive ('triangle', 'rect', 'box)")
             exit()
+        vertices, indices, layout = Primitive.geometry(shape)     # : half floats (and packed normals), half the bytes
 
-        # set up vertex data (and buffer(s)) and configure vertex attributes
-        self.VAO = glGenVertexArrays(1)
-        self.VBO = glGenBuffers(1)
-        self.EBO = glGenBuffers(1) if indices is not None else None
-
-        # bind the Vertex Array Object first, then bind and set vertex buffer(s),
-        # and then configure vertex attribute(s)
-        glBindVertexArray(self.VAO)
-
-        # copy vertices array in a buffer for OpenGL to use
-        glBindBuffer(GL_ARRAY_BUFFER, self.VBO)
-        glBufferData(GL_ARRAY_BUFFER, vertices, GL_STATIC_DRAW)
-
-        if self.EBO is not None:
-            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.EBO)
-            glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices, GL_STATIC_DRAW)
-
-        if self.primitive == 2:
-        # position attribute
-            glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 8 * sizeof(GLfloat), ctypes.c_void_p(0))
-            glEnableVertexAttribArray(0)
-            # texture coord attribute
-            glVertexAttribPointer(1, 2, GL_FLOAT, GL_FALSE, 8 * sizeof(GLfloat), ctypes.c_void_p(6 * sizeof(GLfloat)))
-            glEnableVertexAttribArray(1)
-        else:
-            # position attribute
-            glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 5 * sizeof(GLfloat), ctypes.c_void_p(0))
-            glEnableVertexAttribArray(0)
-            # texture coord attribute
-            glVertexAttribPointer(1, 2, GL_FLOAT, GL_FALSE, 5 * sizeof(GLfloat), ctypes.c_void_p(3 * sizeof(GLfloat)))
-            glEnableVertexAttribArray(1)
+        # copy the vertices and the indices in the shared buffers of the layout (the mesh: its base vertex and first index)
+        self.mesh = mesh_arenas.add(layout, vertices, indices)
 
+        # the vertex array of every mesh in those buffers, configured for the attributes the shader reads
+        self.VAO = self.mesh.arena.vertex_array(self.shader.id)
 
+        # model matrices of all the cubes (location 2-5 of the VAO, disabled again by delete_geometry())
+        # : animated, render() builds them every frame in the stream buffer (no copy, no stall on the frames in flight)
+        if self.is_instanced():
+            self.instance_positions = self.get_cube_positions()
+            if self.animate:
+                self.instances = InstanceStream(self.VAO, 2, len(self.instance_positions))
+            else:
+                self.instances = InstanceBuffer(self.VAO, 2, self.get_cube_model_mats())
+
+        # objects of the three shapes in turn (the meshes in the arenas of their layouts), drawn by the batcher
+        if self.is_batched():
+            self.instance_positions = self.get_cube_positions()
+            for shape in Primitive.SHAPES:
+                vertices, indices, layout = Primitive.geometry(shape)
+                self.batch_meshes.append(mesh_arenas.add(layout, vertices, indices))
+            self.batch_mesh_ids   = np.arange(len(self.instance_positions)) % len(self.batch_meshes)
+            self.batch_model_mats = self.get_cube_model_mats()
+            self.batcher = DrawBatcher(len(self.instance_positions))
+
+    def get_cube_positions(self):
+        count = self.cube_count_list[self.cube_count]
+        if count == len(self.cube_positions):
+            return np.array([list(position) for position in self.cube_positions], dtype=np.float32)
+        return spawn_cube_positions(count)
+
+    def get_cube_model_mats(self, time=0.0, out=None):
+        # cube i rotated by 20 * i degrees (and 50 degrees per second when animated)
+        angles = 20.0 * np.arange(len(self.instance_positions)) + 50.0 * time
+        return cube_model_matrices(self.instance_positions, angles, out=out)
+
+    def set_textures(self):
         # load and create a texture
-        texture_list = []
+        self.texture_list = []
         for i in range(np.size(self.texture_img_list)):
-            texture_list.append([load_texture(self.texture_img_list[i]), "texture" + str(i + 1)])
+            self.texture_list.append([texture_manager.load(self.texture_img_list[i]), "texture" + str(i + 1)])
 
         # tell opengl for each sampler to which texture unit it belongs to (only has to be done once)
-        shader.use()    # don't forget to activate/use the shader before setting uniforms!
-        shader.set_int("textureNum", len(texture_list))
-        for i in range(0, len(texture_list)):
-            shader.set_int(texture_list[i][1], i)
+        self.shader.use()    # don't forget to activate/use the shader before setting uniforms!
+        self.shader.set_int("textureNum", len(self.texture_list))
+        for i in range(0, len(self.texture_list)):
+            self.shader.set_int(self.texture_list[i][1], i)
+
+    def delete_geometry(self):
+        if self.instances is not None:
+            self.instances.delete()
+        if self.batcher is not None:
+            self.batcher.delete()
+        for mesh in self.batch_meshes:
+            mesh.free()
+        if self.mesh is not None:
+            self.mesh.free()     # : its ranges in the shared buffers (the buffers and the VAO stay)
+        self.VAO, self.mesh = None, None
+        self.instances = None
+        self.batcher = None
+        self.batch_meshes, self.batch_mesh_ids, self.batch_model_mats = [], None, None
+
+    def delete_textures(self):
+        for texture, _ in self.texture_list:
+            texture_manager.release(texture)
+        self.texture_list = []
 
-        
+    def render(self):
         # render
         glClearColor(0.2, 0.3, 0.3, 1.0)
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
 
-        # bind textures on corresponding texture units
-        for i in range(len(texture_list)):
-            glActiveTexture(GL_TEXTURE0 + i)
-            glBindTexture(GL_TEXTURE_2D, texture_list[i][0])
-
         view_mat  = glm.mat4(1.0)
         view_mat  = glm.translate(view_mat, glm.vec3(0.0, 0.0, -3.0))
 
         proj_mat  = glm.mat4(1.0)
         proj_mat  = glm.perspective(glm.radians(45.0), self.viewport[0] / self.viewport[1], 0.1, 100.0)
 
-        # retrieve the matrix uniform locations
-        view_location  = glGetUniformLocation(shader.id, "view")
+        # this chapter has its own view: overwrite the shared Camera block the viewer set
+        # (read by every program with the Camera block, uploaded once per frame however many programs use it)
+        camera_buffer.set_matrices(proj_mat, view_mat)
 
-        # note: currently we set the projection matrix each frame,
-        # but since the projection matrix rarely changes,
-        # it's often best practice to set it outside the main loop only once.
-        shader.set_mat4("projection", proj_mat)
-        
-        # pass them to the shaders
-        glUniformMatrix4fv(view_location, 1, GL_FALSE, glm.value_ptr(view_mat))
-
-        # render container
-        glBindVertexArray(self.VAO)
+        # the container is drawn through the render queue: program, VAO and textures on their texture units
+        textures = [(i, self.texture_list[i][0]) for i in range(len(self.texture_list))]
 
         # create transformations
         model_mat_list = []
@@ -181,6 +259,22 @@ class Content(GLContent):
             model_mat = glm.rotate(model_mat, glfw.get_time() * glm.radians(50.0), glm.vec3(0.5, 1.0, 0.0))
             model_mat_list.append(model_mat)
 
+        elif self.task == 2 and self.is_batched():
+            # every object with its own mesh and model matrix: a multi-draw per mesh arena (a draw per mesh on GL 3.3)
+            model_mats = self.batch_model_mats
+            if self.animate:
+                self.get_cube_model_mats(glfw.get_time(), model_mats)     # : rebuilt in place, no new array per frame
+            self.batcher.submit(self.shader, self.batch_meshes, model_mats, self.batch_mesh_ids, textures)
+            self.batcher.flush()
+
+        elif self.task == 2 and self.is_instanced():
+            if self.animate:
+                self.get_cube_model_mats(glfw.get_time(), self.instances.map())
+                self.instances.unmap()
+            # draw every cube with one draw call
+            draw = self.mesh.draw_call(self.instances.count)
+            render_queue.submit(self.shader, self.VAO, draw, textures)
+
         elif self.task == 2:
             for i in range(len(self.cube_positions)):
                 tmp_mat = glm.mat4(1.0)
@@ -190,18 +284,18 @@ class Content(GLContent):
                 model_mat_list.append(tmp_mat)
 
 
-        for i in range(len(model_mat_list)):
-            shader.set_mat4("model", model_mat_list[i])
-            
-            if self.EBO is None:
-                glDrawArrays(GL_TRIANGLES, 0, 36 if self.primitive == 2 else 3)
-            else:
-                glDrawElements(GL_TRIANGLES, 6, GL_UNSIGNED_INT, ctypes.c_void_p(0)) # last argument is indices that specifies an offset in a buffer
-                                                                                    # or a pointer to the location where the indices are stored
+        # one draw item per cube, the nearest first (the farther fragments then fail the depth test)
+        draw = self.mesh.draw_call()    # : glDrawElementsBaseVertex() of the mesh's ranges
+        for model_mat in model_mat_list:
+            render_queue.submit(self.shader, self.VAO, draw, textures, [("set_mat4", "model", model_mat)],
+                                view_depth(view_mat, glm.vec3(model_mat[3])))
+        render_queue.flush()
 
 
     def destroy(self):
-        glDeleteVertexArrays(1, self.VAO)
-        glDeleteBuffers(1, self.VBO)
-        if self.EBO is not None:
-            glDeleteBuffers(1, self.EBO)
\ No newline at end of file
+        self.delete_geometry()
+        self.delete_textures()
+
+        if self.shader is not None:
+            self.shader.release()
+            self.shader = None
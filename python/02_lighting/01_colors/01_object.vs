@@ -5,8 +5,15 @@ layout (location = 1) in vec2 aTexCoord;
 out vec2 TexCoord;
 
 uniform mat4 model;
+#ifdef CAMERA_BLOCK
+layout (std140) uniform Camera {    // shared by every program (visualizer/uniform_buffer.py)
+    mat4 projection;
+    mat4 view;
+};
+#else
 uniform mat4 view;
 uniform mat4 projection;
+#endif
 
 void main() {
     gl_Position = projection * view * model * vec4(aPos, 1.0);
@@ -7,7 +7,10 @@ from OpenGL.GL import *
 from viewer import GLContent
 from visualizer.shader     import Shader
 from visualizer.primitives import Primitive
+from visualizer.geometry   import index_type, upload_mesh
 from visualizer.utils      import *
+from visualizer.vertex_layout import vertex_arrays
+from visualizer.texture    import texture_manager
 
 
 class Content(GLContent):
@@ -16,8 +19,9 @@ class Content(GLContent):
 
         # textures
         self.img1, self.img2 = 0, 0
-        img_file_path = file_path.split(file_path.split("/")[-1])[0] + "test_img"    # chapter name
-        self.texture_list, self.img_name_list = get_texture_list(img_file_path)
+        self.img_file_path = file_path.split(file_path.split("/")[-1])[0] + "test_img"    # chapter name
+        _, self.img_name_list = get_img_list(self.img_file_path)
+        self.texture_list = []
         self.selected_textures = []
 
         # flags
@@ -29,6 +33,10 @@ class Content(GLContent):
         self.light_color    = glm.vec3(1.0, 1.0, 1.0)
         self.light_position = glm.vec3(1.2, 1.0, 2.0)
 
+        self.obj_shader, self.light_shader = None, None
+        self.VBO, self.EBO = None, None
+        self.obj_VAO, self.light_VAO = None, None
+
     def inspector(self):
         imgui.begin_group()
 
@@ -62,9 +70,11 @@ class Content(GLContent):
         imgui.pop_item_width()
 
         imgui.push_item_width(100)
-        _, self.primitive = imgui.combo(
+        changed_primitive, self.primitive = imgui.combo(
             " Primitive", self.primitive, ["tri", "rect", "box"]
         )
+        if changed_primitive:
+            self.request_rebuild()
         imgui.pop_item_width()
 
         imgui.dummy(0, 5)
@@ -79,67 +89,62 @@ class Content(GLContent):
         imgui.end_group()
 
 
-    def render(self):
+    def setup(self):
+        # load and create the textures
+        self.texture_list, _ = get_texture_list(self.img_file_path)
+
         # set shader program
-        obj_shader   = Shader(os.path.join(self.file_path, '01_object.vs'),
-                              os.path.join(self.file_path, '01_object.fs'))
-        light_shader = Shader(os.path.join(self.file_path, '01_light_cube.vs'),
-                              os.path.join(self.file_path, '01_light_cube.fs'))
+        self.obj_shader   = Shader(os.path.join(self.file_path, '01_object.vs'),
+                                   os.path.join(self.file_path, '01_object.fs'))
+        self.light_shader = Shader(os.path.join(self.file_path, '01_light_cube.vs'),
+                                   os.path.join(self.file_path, '01_light_cube.fs'))
+
+        self.set_geometry()
 
+    def rebuild(self):
+        # only the geometry depends on the inspector setting
+        self.delete_geometry()
+        self.set_geometry()
 
+    def set_geometry(self):
         # select primitive type
         if self.primitive == 0:
-            vertices, indices = Primitive.triangle()
+            shape = "triangle"
         elif self.primitive == 1:
-            vertices, indices = Primitive.rectangle()
+            shape = "rectangle"
         elif self.primitive == 2:
-            vertices, indices = Primitive.box()
+            shape = "box"
         else:
             print("Please write target primitive ('triangle', 'rect', 'box)")
             exit()
+        vertices, indices, layout = Primitive.geometry(shape)     # : compact vertex formats (visualizer.vertex_format)
 
+        # copy the vertices and the indices in buffers for OpenGL to use
+        self.VBO, self.EBO = upload_mesh(vertices, indices)
+        self.index_count, self.index_type = len(indices), index_type(indices)
 
-        # configure the VBO and EBO
-        self.VBO = glGenBuffers(1)
-        self.EBO = glGenBuffers(1) if indices is not None else None
-
-        # copy vertices array in a buffer for OpenGL to use
-        glBindBuffer(GL_ARRAY_BUFFER, self.VBO)
-        glBufferData(GL_ARRAY_BUFFER, vertices, GL_STATIC_DRAW)
-        if self.EBO is not None:
-            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.EBO)
-            glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices, GL_STATIC_DRAW)
-
-        # configure the object's VAO
-        self.obj_VAO = glGenVertexArrays(1)
-        glBindVertexArray(self.obj_VAO)
-        # position attribute
-        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 8 * sizeof(GLfloat), ctypes.c_void_p(0))
-        glEnableVertexAttribArray(0)
-        # texture coord attribute
-        glVertexAttribPointer(1, 2, GL_FLOAT, GL_FALSE, 8 * sizeof(GLfloat), ctypes.c_void_p(6 * sizeof(GLfloat)))
-        glEnableVertexAttribArray(1)
-
-        # configure the light's VAO (VBO is the same)
-        self.light_VAO = glGenVertexArrays(1)
-        glBindVertexArray(self.light_VAO)
-
-        glBindBuffer(GL_ARRAY_BUFFER, self.VBO)
-
-        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 8 * sizeof(GLfloat), ctypes.c_void_p(0))
-        glEnableVertexAttribArray(0)
+        # the object's and the light's VAO (the buffers are the same, each shader reads its own attributes of the layout)
+        self.obj_VAO   = vertex_arrays.get(self.obj_shader.id,   layout, self.VBO, self.EBO)
+        self.light_VAO = vertex_arrays.get(self.light_shader.id, layout, self.VBO, self.EBO)
 
+    def delete_geometry(self):
+        if self.VBO is not None:
+            vertex_arrays.release_buffers(self.VBO, self.EBO)     # : the VAOs go with their buffers
+            glDeleteBuffers(2, [self.VBO, self.EBO])
+        self.VBO, self.EBO = None, None
+        self.obj_VAO, self.light_VAO = None, None
 
+    def render(self):
         # load and create a texture
         texture_list = []
         for i in range(np.size(self.selected_textures)):
             texture_list.append([self.selected_textures[i], "texture" + str(i + 1)])
 
         # tell opengl for each sampler to which texture unit it belongs to (only has to be done once)
-        obj_shader.use()    # don't forget to activate/use the shader before setting uniforms!
-        obj_shader.set_int("textureNum", len(texture_list))
+        self.obj_shader.use()    # don't forget to activate/use the shader before setting uniforms!
+        self.obj_shader.set_int("textureNum", len(texture_list))
         for i in range(0, len(texture_list)):
-            obj_shader.set_int(texture_list[i][1], i)
+            self.obj_shader.set_int(texture_list[i][1], i)
 
 
         # camera control
@@ -159,14 +164,11 @@ class Content(GLContent):
             glBindTexture(GL_TEXTURE_2D, texture_list[i][0])
 
         # draw object
-        obj_shader.use()
-        obj_shader.set_vec3("objectColor", *self.obj_color)
-        obj_shader.set_vec3("lightColor", *self.light_color)
+        self.obj_shader.use()
+        self.obj_shader.set_vec3("objectColor", *self.obj_color)
+        self.obj_shader.set_vec3("lightColor", *self.light_color)
         
-        proj_mat = glm.perspective(glm.radians(self.camera.fov), self.viewport[0] / self.viewport[1], 0.1, 100.0)
-        view_mat = self.camera.get_view_matrix()
-        obj_shader.set_mat4("projection", proj_mat)
-        obj_shader.set_mat4("view", view_mat)
+        # projection and view come from the shared Camera block (set by the viewer once per frame)
 
         # render container
         glBindVertexArray(self.obj_VAO)
@@ -187,30 +189,30 @@ class Content(GLContent):
 
         # draw
         for i in range(len(model_mat_list)):
-            obj_shader.set_mat4("model", model_mat_list[i])
+            self.obj_shader.set_mat4("model", model_mat_list[i])
             
-            if self.EBO is None:
-                glDrawArrays(GL_TRIANGLES, 0, 36 if self.primitive == 2 else 3)
-            if self.EBO is not None:
-                glDrawElements(GL_TRIANGLES, 6, GL_UNSIGNED_INT, ctypes.c_void_p(0)) # last argument is indices that specifies an offset in a buffer
-                                                                                        # or a pointer to the location where the indices are stored
+            glDrawElements(GL_TRIANGLES, self.index_count, self.index_type, ctypes.c_void_p(0)) # last argument is indices that specifies an offset in a buffer
+                                                                                                # or a pointer to the location where the indices are stored
         
         # draw light cube
-        light_shader.use()
-        light_shader.set_mat4("projection", proj_mat)
-        light_shader.set_mat4("view", view_mat)
+        self.light_shader.use()
         model_mat = glm.mat4(1.0)
         model_mat = glm.translate(model_mat, self.light_position)
         model_mat = glm.scale(model_mat, glm.vec3(0.2))
-        light_shader.set_mat4("model", model_mat)
+        self.light_shader.set_mat4("model", model_mat)
 
         glBindVertexArray(self.light_VAO)
-        glDrawArrays(GL_TRIANGLES, 0, 36)
+        glDrawElements(GL_TRIANGLES, self.index_count, self.index_type, ctypes.c_void_p(0))
 
 
     def destroy(self):
-        glDeleteVertexArrays(1, self.obj_VAO)
-        glDeleteVertexArrays(1, self.light_VAO)
-        glDeleteBuffers(1, self.VBO)
-        if self.EBO is not None:
-            glDeleteBuffers(1, self.EBO)
\ No newline at end of file
+        self.delete_geometry()
+
+        if self.obj_shader is not None:
+            self.obj_shader.release()
+            self.light_shader.release()
+            self.obj_shader, self.light_shader = None, None
+
+        for texture in self.texture_list:
+            texture_manager.release(texture)
+        self.texture_list = []
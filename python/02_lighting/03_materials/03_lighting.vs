@@ -2,8 +2,15 @@
 layout (location = 0) in vec3 aPos;
 
 uniform mat4 model;
+#ifdef CAMERA_BLOCK
+layout (std140) uniform Camera {    // shared by every program (visualizer/uniform_buffer.py)
+    mat4 projection;
+    mat4 view;
+};
+#else
 uniform mat4 view;
 uniform mat4 projection;
+#endif
 
 void main()
 {
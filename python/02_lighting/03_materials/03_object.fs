@@ -6,6 +6,17 @@ in vec3 FragPos;
 
 in vec2 TexCoord;
 
+#ifdef LIGHTING_BLOCKS
+struct Material {         // std140, MATERIAL_DTYPE in visualizer/uniform_buffer.py
+    vec3  ambient;
+    float shininess;
+    vec3  diffuse;
+    vec3  specular;
+};
+layout (std140) uniform MaterialBlock {
+    Material material;
+};
+#else
 struct Material {
     vec3 ambient;
     vec3 diffuse;
@@ -13,7 +24,25 @@ struct Material {
     float shininess;
 };
 uniform Material material;
+#endif
 
+#ifdef LIGHTING_BLOCKS
+struct Light {            // std140, LIGHT_DTYPE in visualizer/uniform_buffer.py
+    vec3  position;
+    float constant;
+    vec3  direction;
+    float linear;
+    vec3  ambient;
+    float quadratic;
+    vec3  diffuse;
+    float cutOff;
+    vec3  specular;
+    float outerCutOff;
+};
+layout (std140) uniform LightBlock {    // the whole light is uploaded at once
+    Light light;
+};
+#else
 struct Light {
     vec3 position;
 
@@ -22,6 +51,7 @@ struct Light {
     vec3 specular;
 };
 uniform Light light;
+#endif
 
 uniform vec3 viewPos;
 
@@ -8,6 +8,10 @@ from viewer import GLContent
 from visualizer.shader     import Shader
 from visualizer.primitives import Primitive
 from visualizer.utils      import *
+from visualizer.mesh_arena import mesh_arenas
+from visualizer.texture    import texture_manager
+from visualizer.render_queue import render_queue, view_depth
+from visualizer.uniform_buffer import light_buffer
 
 
 class Content(GLContent):
@@ -15,8 +19,9 @@ class Content(GLContent):
         super().__init__(window, viewport, camera, file_path)
 
         # textures
-        img_file_path = file_path.split(file_path.split("/")[-1])[0] + "test_img"    # chapter name
-        self.texture_list, self.img_name_list = get_texture_list(img_file_path)
+        self.img_file_path = file_path.split(file_path.split("/")[-1])[0] + "test_img"    # chapter name
+        _, self.img_name_list = get_img_list(self.img_file_path)
+        self.texture_list = []
         self.diff_map, self.spec_map = 4, 5
 
         # flags
@@ -27,11 +32,9 @@ class Content(GLContent):
         self.light_position   = glm.vec3(1.2, 1.0, 2.0)
 
         # variables for rendering
-        # set shader program
-        self.obj_shader   = Shader(os.path.join(self.file_path, '04_object.vs'),
-                                   os.path.join(self.file_path, '04_object.fs'))
-        self.light_shader = Shader(os.path.join(self.file_path, '04_lighting.vs'),
-                                   os.path.join(self.file_path, '04_lighting.fs'))
+        self.obj_shader, self.light_shader = None, None
+        self.mesh = None
+        self.obj_VAO, self.light_VAO = None, None
 
     def inspector(self):
         imgui.begin_group()
@@ -64,64 +67,44 @@ class Content(GLContent):
         imgui.end_group()
 
 
-    def render(self):
+    def setup(self):
+        # load and create the textures
+        self.texture_list, _ = get_texture_list(self.img_file_path)
+
+        # set shader program
+        self.obj_shader   = Shader(os.path.join(self.file_path, '04_object.vs'),
+                                   os.path.join(self.file_path, '04_object.fs'))
+        self.light_shader = Shader(os.path.join(self.file_path, '04_lighting.vs'),
+                                   os.path.join(self.file_path, '04_lighting.fs'))
+
         # select primitive type
-        vertices, indices = Primitive.box()
-
-        # configure the VBO and EBO
-        self.VBO = glGenBuffers(1)
-        self.EBO = glGenBuffers(1) if indices is not None else None
-        # copy vertices array in a buffer for OpenGL to use
-        glBindBuffer(GL_ARRAY_BUFFER, self.VBO)
-        glBufferData(GL_ARRAY_BUFFER, vertices, GL_STATIC_DRAW)
-        if self.EBO is not None:
-            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.EBO)
-            glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices, GL_STATIC_DRAW)
-
-        # configure the object's VAO
-        self.obj_VAO = glGenVertexArrays(1)
-        glBindVertexArray(self.obj_VAO)
-        # position attribute
-        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 8 * sizeof(GLfloat), ctypes.c_void_p(0))
-        glEnableVertexAttribArray(0)
-        # normal attribute
-        glVertexAttribPointer(1, 3, GL_FLOAT, GL_FALSE, 8 * sizeof(GLfloat), ctypes.c_void_p(3 * sizeof(GLfloat)))
-        glEnableVertexAttribArray(1)
-        # texture coord attribute
-        glVertexAttribPointer(2, 2, GL_FLOAT, GL_FALSE, 8 * sizeof(GLfloat), ctypes.c_void_p(6 * sizeof(GLfloat)))
-        glEnableVertexAttribArray(2)
-
-        # configure the light's VAO (VBO is the same)
-        self.light_VAO = glGenVertexArrays(1)
-        glBindVertexArray(self.light_VAO)
-
-        glBindBuffer(GL_ARRAY_BUFFER, self.VBO)
-
-        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 8 * sizeof(GLfloat), ctypes.c_void_p(0))
-        glEnableVertexAttribArray(0)
+        vertices, indices, layout = Primitive.geometry("box")     # : compact vertex formats (visualizer.vertex_format)
 
+        # copy the vertices and the indices in the shared buffers of the layout (the mesh: its base vertex and first index)
+        self.mesh = mesh_arenas.add(layout, vertices, indices)
 
-        # load and create a texture
-        diffuse_map  = self.texture_list[self.diff_map-1]
-        specular_map = self.texture_list[self.spec_map-1]
+        # the object's and the light's VAO (the buffers are the same, each shader reads its own attributes of the layout)
+        self.obj_VAO   = self.mesh.arena.vertex_array(self.obj_shader.id)
+        self.light_VAO = self.mesh.arena.vertex_array(self.light_shader.id)
 
+        # tell opengl for each sampler to which texture unit it belongs to (only has to be done once)
         self.obj_shader.use()
         self.obj_shader.set_int("material.diffuse",  0)
         self.obj_shader.set_int("material.specular", 1)
 
+    def render(self):
+        # load and create a texture
+        diffuse_map  = self.texture_list[self.diff_map-1]
+        specular_map = self.texture_list[self.spec_map-1]
+
+        # textures on their units (bound with the draw items of the render queue)
         # Task 1: diffuse map texture
         if self.task == 0:
-            # bind diffuse map
-            glActiveTexture(GL_TEXTURE0)
-            glBindTexture(GL_TEXTURE_2D, diffuse_map)
-            glActiveTexture(GL_TEXTURE1)
-            glBindTexture(GL_TEXTURE_2D, diffuse_map)      
+            # diffuse map as specular map too
+            textures = ((0, diffuse_map), (1, diffuse_map))
         # Task 2: diffuse map & specular map
         elif self.task == 1:
-            glActiveTexture(GL_TEXTURE0)
-            glBindTexture(GL_TEXTURE_2D, diffuse_map)
-            glActiveTexture(GL_TEXTURE1)
-            glBindTexture(GL_TEXTURE_2D, specular_map)
+            textures = ((0, diffuse_map), (1, specular_map))
         else:
             raise TypeError("Wrong task number")
        
@@ -136,55 +119,50 @@ class Content(GLContent):
         self.camera.last_frame = current_frame
         self.camera.translate(self.window)
 
-        # render container
-        glBindVertexArray(self.obj_VAO)
-
         # object shader
         self.obj_shader.use()    
         self.obj_shader.set_vec3("viewPos",        *self.camera.position)   # cam properties
-        self.obj_shader.set_vec3("light.position", *self.light_position)    # light properties
-        self.obj_shader.set_vec3("light.ambient",  glm.vec3(0.2))
-        self.obj_shader.set_vec3("light.diffuse",  glm.vec3(0.5))
-        self.obj_shader.set_vec3("light.specular", glm.vec3(1.0))
+        light_buffer.set(position=self.light_position,                      # light properties (one upload)
+                         ambient=glm.vec3(0.2),
+                         diffuse=glm.vec3(0.5),
+                         specular=glm.vec3(1.0))
+        light_buffer.upload()
         self.obj_shader.set_float("material.shininess", pow(self.mat_shininess, 2)) # material properties       
 
         # view properties for object shader     
-        proj_mat = glm.perspective(glm.radians(self.camera.fov), self.viewport[0] / self.viewport[1], 0.1, 100.0)
-        view_mat = self.camera.get_view_matrix()
-        self.obj_shader.set_mat4("projection", proj_mat)
-        self.obj_shader.set_mat4("view", view_mat)
+        # projection and view come from the shared Camera block (set by the viewer once per frame)
 
         
         # create transformations
         model_mat_list = [glm.mat4(1.0)]
 
         # draw
-        for i in range(len(model_mat_list)):
-            self.obj_shader.set_mat4("model", model_mat_list[i])
-            
-            if self.EBO is None:
-                glDrawArrays(GL_TRIANGLES, 0, 36)
-            if self.EBO is not None:
-                glDrawElements(GL_TRIANGLES, 6, GL_UNSIGNED_INT, ctypes.c_void_p(0)) # last argument is indices that specifies an offset in a buffer
-                                                                                        # or a pointer to the location where the indices are stored
+        draw = self.mesh.draw_call()    # : glDrawElementsBaseVertex() of the mesh's ranges
+        view_mat = self.camera.get_view_matrix()
+        for model_mat in model_mat_list:
+            render_queue.submit(self.obj_shader, self.obj_VAO, draw, textures, [("set_mat4", "model", model_mat)],
+                                view_depth(view_mat, glm.vec3(model_mat[3])))
         
         # draw light cube
-        self.light_shader.use()
-        self.light_shader.set_mat4("projection", proj_mat)
-        self.light_shader.set_mat4("view", view_mat)
-        
         model_mat = glm.mat4(1.0)
         model_mat = glm.translate(model_mat, self.light_position)
         model_mat = glm.scale(model_mat, glm.vec3(0.2))
-        self.light_shader.set_mat4("model", model_mat)
-
-        glBindVertexArray(self.light_VAO)
-        glDrawArrays(GL_TRIANGLES, 0, 36)
+        render_queue.submit(self.light_shader, self.light_VAO, draw,
+                            uniforms=[("set_mat4", "model", model_mat)], depth=view_depth(view_mat, self.light_position))
+        render_queue.flush()
 
 
     def destroy(self):
-        glDeleteVertexArrays(1, self.obj_VAO)
-        glDeleteVertexArrays(1, self.light_VAO)
-        glDeleteBuffers(1, self.VBO)
-        if self.EBO is not None:
-            glDeleteBuffers(1, self.EBO)
\ No newline at end of file
+        if self.mesh is not None:
+            self.mesh.free()     # : its ranges in the shared buffers (the buffers and the VAOs stay)
+        self.mesh = None
+        self.obj_VAO, self.light_VAO = None, None
+
+        if self.obj_shader is not None:
+            self.obj_shader.release()
+            self.light_shader.release()
+            self.obj_shader, self.light_shader = None, None
+
+        for texture in self.texture_list:
+            texture_manager.release(texture)
+        self.texture_list = []
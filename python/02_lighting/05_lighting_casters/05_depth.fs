@@ -0,0 +1,6 @@
+#version 330 core
+// depth pre-pass: no color (the color writes are off), the depth test writes the depth
+
+void main()
+{
+}
@@ -0,0 +1,26 @@
+#version 330 core
+// depth pre-pass: only the position, computed exactly as in 05_light.vs (the shading pass tests GL_EQUAL)
+layout (location = 0) in vec3 aPos;
+
+#ifdef INSTANCED
+layout (location = 3) in mat4 aModel;    // model matrix per instance (attribute divisor 1)
+#define model aModel
+#else
+uniform mat4 model;
+#endif
+#ifdef CAMERA_BLOCK
+layout (std140) uniform Camera {    // shared by every program (visualizer/uniform_buffer.py)
+    mat4 projection;
+    mat4 view;
+};
+#else
+uniform mat4 view;
+uniform mat4 projection;
+#endif
+
+invariant gl_Position;
+
+void main() {
+    vec3 FragPos = vec3(model * vec4(aPos, 1.0));
+    gl_Position  = projection * view * vec4(FragPos, 1.0);
+}
@@ -0,0 +1,26 @@
+#version 330 core
+// geometry pass of the deferred path (visualizer/deferred.py): the surface of the fragment, shaded by 05_light_multiple.fs
+layout (location = 0) out vec4 gPosition;
+layout (location = 1) out vec4 gNormal;
+layout (location = 2) out vec4 gAlbedo;
+layout (location = 3) out vec4 gSpecular;
+
+struct Material {
+    sampler2D diffuse;
+    sampler2D specular;
+    float shininess;
+};
+
+in vec3 FragPos;
+in vec3 Normal;
+in vec2 TexCoord;
+
+uniform Material material;
+
+void main()
+{
+    gPosition = vec4(FragPos, 1.0);
+    gNormal   = vec4(normalize(Normal), 0.0);
+    gAlbedo   = vec4(texture(material.diffuse, TexCoord).rgb, 1.0);
+    gSpecular = vec4(texture(material.specular, TexCoord).rgb, 1.0);
+}
@@ -7,9 +7,23 @@ out vec3 FragPos;
 out vec3 Normal;
 out vec2 TexCoord;
 
+#ifdef INSTANCED
+layout (location = 3) in mat4 aModel;    // model matrix per instance (attribute divisor 1)
+#define model aModel
+#else
 uniform mat4 model;
+#endif
+#ifdef CAMERA_BLOCK
+layout (std140) uniform Camera {    // shared by every program (visualizer/uniform_buffer.py)
+    mat4 projection;
+    mat4 view;
+};
+#else
 uniform mat4 view;
 uniform mat4 projection;
+#endif
+
+invariant gl_Position;    // same depth as the pre-pass (05_depth.vs): the shading pass after it tests GL_EQUAL
 
 void main() {
     FragPos  = vec3(model * vec4(aPos, 1.0));
@@ -7,6 +7,23 @@ struct Material {
     float shininess;
 };
 
+#ifdef LIGHTING_BLOCKS
+struct Light {            // std140, LIGHT_DTYPE in visualizer/uniform_buffer.py
+    vec3  position;
+    float constant;
+    vec3  direction;
+    float linear;
+    vec3  ambient;
+    float quadratic;
+    vec3  diffuse;
+    float cutOff;
+    vec3  specular;
+    float outerCutOff;
+};
+layout (std140) uniform LightBlock {    // the whole light is uploaded at once
+    Light light;
+};
+#else
 struct Light {
     vec3 direction;
 
@@ -14,6 +31,8 @@ struct Light {
     vec3 diffuse;
     vec3 specular;
 };
+uniform Light light;
+#endif
 
 in vec3 FragPos;
 in vec3 Normal;
@@ -21,7 +40,6 @@ in vec2 TexCoord;
 
 uniform vec3 viewPos;
 uniform Material material;
-uniform Light light;
 
 void main()
 {
@@ -0,0 +1,169 @@
+#version 330 core
+out vec4 FragColor;
+
+struct Material {
+    sampler2D diffuse;
+    sampler2D specular;
+    float shininess;
+};
+
+struct Light {            // std140, LIGHT_DTYPE in visualizer/uniform_buffer.py
+    vec3  position;
+    float constant;
+    vec3  direction;
+    float linear;
+    vec3  ambient;
+    float quadratic;
+    vec3  diffuse;
+    float cutOff;
+    vec3  specular;
+    float outerCutOff;
+};
+
+#ifdef DEFERRED
+// lighting pass of the deferred path (visualizer/deferred.py): the surface of the pixel comes from the G-buffer
+uniform sampler2D gPosition;
+uniform sampler2D gNormal;
+uniform sampler2D gAlbedo;
+uniform sampler2D gSpecular;
+uniform vec2 gBufferOrigin;
+#define G_BUFFER(name) texelFetch(name, ivec2(gl_FragCoord.xy - gBufferOrigin), 0)
+layout (std140) uniform Camera {
+    mat4 projection;
+    mat4 view;
+};
+vec3 FragPos;
+#else
+in vec3 FragPos;
+in vec3 Normal;
+in vec2 TexCoord;
+#endif
+
+uniform vec3 viewPos;
+uniform Material material;
+
+// directional light
+layout (std140) uniform LightBlock {
+    Light light;
+};
+
+// point and spot lights (visualizer/lighting.py): 5 vec4 per light in every backend
+uniform int lightCount;
+#if LIGHT_BACKEND == 0
+uniform vec4 lightVectors[MAX_LIGHTS * 5];
+#define LIGHT_VEC4(i, k) lightVectors[(i) * 5 + (k)]
+#elif LIGHT_BACKEND == 1
+layout (std140) uniform LightArrayBlock {
+    Light lights[MAX_LIGHTS];
+};
+#else
+uniform samplerBuffer lightTexels;
+#define LIGHT_VEC4(i, k) texelFetch(lightTexels, (i) * 5 + (k))
+#endif
+
+// culling: the draw loops over the 'lightCount' lights listed in lightIndices (4 per ivec4), not over all of them
+// clustered: the fragment loops over the lights of its cluster (LightClusters in visualizer/lighting.py)
+#if defined(LIGHT_CLUSTERS)
+uniform isamplerBuffer clusterRanges;   // (first index, light count) of every cluster
+uniform isamplerBuffer clusterLights;   // light indices of all the clusters
+uniform vec4 clusterViewport;
+uniform vec2 clusterDepth;              // near, far
+#define LIGHT_RANGE    clusterRange()
+#define LIGHT_INDEX(i) texelFetch(clusterLights, (i)).x
+#elif defined(LIGHT_CULLING)
+uniform ivec4 lightIndices[(MAX_LIGHTS + 3) / 4];
+#define LIGHT_RANGE    ivec2(0, lightCount)
+#define LIGHT_INDEX(i) lightIndices[(i) / 4][(i) % 4]
+#else
+#define LIGHT_RANGE    ivec2(0, lightCount)
+#define LIGHT_INDEX(i) (i)
+#endif
+
+Light getLight(int i)
+{
+#if LIGHT_BACKEND == 1
+    return lights[i];
+#else
+    vec4 v0 = LIGHT_VEC4(i, 0);
+    vec4 v1 = LIGHT_VEC4(i, 1);
+    vec4 v2 = LIGHT_VEC4(i, 2);
+    vec4 v3 = LIGHT_VEC4(i, 3);
+    vec4 v4 = LIGHT_VEC4(i, 4);
+    return Light(v0.xyz, v0.w, v1.xyz, v1.w, v2.xyz, v2.w, v3.xyz, v3.w, v4.xyz, v4.w);
+#endif
+}
+
+#ifdef LIGHT_CLUSTERS
+ivec2 clusterRange()
+{
+    // cluster of the fragment: screen tile, and depth slice (exponential between near and far)
+    float near  = clusterDepth.x;
+    float far   = clusterDepth.y;
+#ifdef DEFERRED
+    float depth = -(view * vec4(FragPos, 1.0)).z;
+#else
+    float depth = 2.0 * near * far / (far + near - (2.0 * gl_FragCoord.z - 1.0) * (far - near));
+#endif
+    ivec2 tile  = ivec2((gl_FragCoord.xy - clusterViewport.xy) / clusterViewport.zw * vec2(CLUSTER_GRID.xy));
+    int   slice = int(log(depth / near) / log(far / near) * float(CLUSTER_GRID.z));
+    ivec3 cell  = clamp(ivec3(tile, slice), ivec3(0), CLUSTER_GRID - 1);
+
+    ivec2 range = texelFetch(clusterRanges, (cell.z * CLUSTER_GRID.y + cell.y) * CLUSTER_GRID.x + cell.x).xy;
+    return ivec2(range.x, range.x + range.y);
+}
+#endif
+
+vec3 calcDirLight(Light light, vec3 normal, vec3 viewDir, vec3 diffuseColor, vec3 specularColor)
+{
+    vec3 lightDir   = normalize(-light.direction);
+    float diff      = max(dot(normal, lightDir), 0.0);
+    vec3 reflectDir = reflect(-lightDir, normal);
+    float spec      = pow(max(dot(viewDir, reflectDir), 0.0), material.shininess);
+
+    return light.ambient * diffuseColor + light.diffuse * diff * diffuseColor + light.specular * spec * specularColor;
+}
+
+vec3 calcSpotLight(Light light, vec3 normal, vec3 viewDir, vec3 diffuseColor, vec3 specularColor)
+{
+    // (a point light is a spot light with cutOff -1 and outerCutOff -2: the intensity is always 1)
+    vec3 lightDir   = normalize(light.position - FragPos);
+    float diff      = max(dot(normal, lightDir), 0.0);
+    vec3 reflectDir = reflect(-lightDir, normal);
+    float spec      = pow(max(dot(viewDir, reflectDir), 0.0), material.shininess);
+
+    // spotlight (soft edges)
+    float theta     = dot(lightDir, normalize(-light.direction));
+    float epsillon  = (light.cutOff - light.outerCutOff);
+    float intensity = clamp((theta - light.outerCutOff) / epsillon, 0.0, 1.0);
+
+    // attenuation
+    float distance    = length(light.position - FragPos);
+    float attenuation = 1.0 / (light.constant + light.linear * distance + light.quadratic * (distance * distance));
+
+    return (light.ambient * diffuseColor + (light.diffuse * diff * diffuseColor + light.specular * spec * specularColor) * intensity) * attenuation;
+}
+
+void main()
+{
+#ifdef DEFERRED
+    vec4 position = G_BUFFER(gPosition);
+    if (position.w == 0.0)
+        discard;    // no surface: the background of the target stays
+    FragPos            = position.xyz;
+    vec3 norm          = G_BUFFER(gNormal).xyz;
+    vec3 diffuseColor  = G_BUFFER(gAlbedo).rgb;
+    vec3 specularColor = G_BUFFER(gSpecular).rgb;
+#else
+    vec3 norm          = normalize(Normal);
+    vec3 diffuseColor  = texture(material.diffuse, TexCoord).rgb;
+    vec3 specularColor = texture(material.specular, TexCoord).rgb;
+#endif
+    vec3 viewDir       = normalize(viewPos - FragPos);
+
+    vec3 result = calcDirLight(light, norm, viewDir, diffuseColor, specularColor);
+    ivec2 lightRange = LIGHT_RANGE;     // (first, end)
+    for (int i = lightRange.x; i < lightRange.y; i++) {
+        result += calcSpotLight(getLight(LIGHT_INDEX(i)), norm, viewDir, diffuseColor, specularColor);
+    }
+    FragColor = vec4(result, 1.0);
+}
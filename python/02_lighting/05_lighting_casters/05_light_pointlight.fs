@@ -7,6 +7,23 @@ struct Material {
     float shininess;
 };
 
+#ifdef LIGHTING_BLOCKS
+struct Light {            // std140, LIGHT_DTYPE in visualizer/uniform_buffer.py
+    vec3  position;
+    float constant;
+    vec3  direction;
+    float linear;
+    vec3  ambient;
+    float quadratic;
+    vec3  diffuse;
+    float cutOff;
+    vec3  specular;
+    float outerCutOff;
+};
+layout (std140) uniform LightBlock {    // the whole light is uploaded at once
+    Light light;
+};
+#else
 struct Light {
     vec3 position;
 
@@ -18,6 +35,8 @@ struct Light {
     float linear;     // To reduce the intensity in a linear fashion
     float quadratic;  // To decrease the intensity quadratically
 };
+uniform Light light;
+#endif
 
 in vec3 FragPos;
 in vec3 Normal;
@@ -25,7 +44,6 @@ in vec2 TexCoord;
 
 uniform vec3 viewPos;
 uniform Material material;
-uniform Light light;
 
 void main()
 {
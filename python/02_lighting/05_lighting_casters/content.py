@@ -8,6 +8,22 @@ from viewer import GLContent
 from visualizer.shader     import Shader
 from visualizer.primitives import Primitive
 from visualizer.utils      import *
+from visualizer.mesh_arena import mesh_arenas
+from visualizer.texture    import texture_manager
+from visualizer.uniform_buffer import camera_buffer, light_buffer
+from visualizer.deferred   import GBuffer
+from visualizer.query      import FrameQuery
+from visualizer.render_queue import render_queue, view_depth
+from visualizer.instancing import InstanceBuffer, cube_model_matrices, spawn_cube_positions, cube_field_size, point_model_matrices
+from visualizer.gl_state   import gl_state
+from visualizer.lighting   import LightStorage, LIGHT_BACKENDS, LIGHT_CULLING_MODES, max_lights, spawn_lights, orbit_positions, light_radii, cull_lights
+
+# bounding sphere radius of the unit cube (culling)
+CUBE_RADIUS = np.sqrt(3.0) / 2.0
+# instanced cubes: chunks per axis of the grid over the cube field (culling per draw: a draw per chunk)
+CHUNK_GRID = 4
+# attenuation of the stress scene lights: short range (about 5 units), so each one lights a few cubes of the field
+STRESS_ATTENUATION = (1.0, 1.0, 20.0)
 
 
 class Content(GLContent):
@@ -15,8 +31,9 @@ class Content(GLContent):
         super().__init__(window, viewport, camera, file_path)
 
         # textures
-        img_file_path = file_path.split(file_path.split("/")[-1])[0] + "test_img"    # chapter name
-        self.texture_list, self.img_name_list = get_texture_list(img_file_path)
+        self.img_file_path = file_path.split(file_path.split("/")[-1])[0] + "test_img"    # chapter name
+        _, self.img_name_list = get_img_list(self.img_file_path)
+        self.texture_list = []
         self.diff_map, self.spec_map = 4, 5
 
         # flags
@@ -31,12 +48,10 @@ class Content(GLContent):
 
 
         # variables for rendering
-        self.light_caster_names = ['directionallight', 'pointlight', 'spotlight', 'spotlight']
-        # set shader program
-        self.light_shader= Shader(os.path.join(self.file_path, '05_light.vs'),
-                                  os.path.join(self.file_path, '05_light_{}.fs'.format(self.light_caster_names[self.task])))
-        self.lamp_shader = Shader(os.path.join(self.file_path, '05_lamp.vs'),
-                                  os.path.join(self.file_path, '05_lamp.fs'))
+        self.light_caster_names = ['directionallight', 'pointlight', 'spotlight', 'multiple']
+        self.light_shader, self.lamp_shader = None, None
+        self.mesh = None
+        self.light_VAO, self.lamp_VAO = None, None
 
         self.cube_positions = [ 
                                 glm.vec3( 0.0,  0.0,   0.0),
@@ -51,6 +66,45 @@ class Content(GLContent):
                                 glm.vec3(-1.3,  1.0,  -1.5),
                               ]
 
+        # instanced mode: one draw call for all the cubes, also for many more cubes
+        self.instanced       = False
+        self.cube_count      = 0
+        self.cube_count_list = [len(self.cube_positions), 10000, 100000, 1000000]
+        self.instances       = None
+
+        # many lights (task 4): a directional light and up to light_limit point / spot lights,
+        # stored in the backend selected in the inspector
+        self.light_backend  = 1
+        self.light_count    = 64
+        self.light_limit    = 1024
+        self.light_capacity = self.light_limit     # : of the backend on this driver, known after setup()
+        self.light_storage  = None
+        self.lights         = None
+
+        # light culling (index of LIGHT_CULLING_MODES): per draw, every draw only loops over the lights reaching
+        # the bounding sphere of its cube (instanced: of its chunk of cubes), clustered, every fragment over the lights
+        # reaching its cluster
+        self.light_culling    = 0
+        self.draw_light_count = 0.0     # : lights per draw / per non-empty cluster of the last frame
+
+        # stress scene: the lights spread over the whole instanced cube field
+        self.light_stress = False
+
+        # deferred shading (task 4): the cubes are drawn to a G-buffer, then the lights shade every pixel once
+        # : light_shader is the full-screen lighting pass, gbuffer_shader the geometry pass of the cubes
+        self.deferred       = False
+        self.gbuffer        = None
+        self.gbuffer_shader = None
+
+        # depth pre-pass (forward): the cubes are drawn depth only first, then shaded with GL_EQUAL,
+        # so a pixel is shaded once (by its nearest cube) and not once per overlapping cube
+        # : the queries measure the shaded fragments and the GPU time of both passes
+        self.depth_prepass    = False
+        self.depth_shader     = None
+        self.shaded_fragments = None
+        self.shading_time     = None
+        self.prepass_time     = None
+
     def inspector(self):
         imgui.begin_group()
 
@@ -64,14 +118,29 @@ class Content(GLContent):
         imgui.dummy(0, 5)        
         imgui.push_item_width(100)
         changed_task, self.task = imgui.combo(
-            " Task", self.task, ["1", "2", "3"]
+            " Task", self.task, ["1", "2", "3", "4"]
         )
         if (changed_task):
-            self.light_shader = Shader(os.path.join(self.file_path, '05_light.vs'),
-                                     os.path.join(self.file_path,
-                                                  '05_light_{}.fs'.format(
-                                                  self.light_caster_names[self.task])))
+            self.request_rebuild()
         imgui.pop_item_width()
+
+        changed_instanced, self.instanced = imgui.checkbox("Instanced", self.instanced)
+        changed_count = False
+        if self.instanced:
+            imgui.push_item_width(100)
+            changed_count, self.cube_count = imgui.combo(
+                " Cubes", self.cube_count, ["10", "10k", "100k", "1M"]
+            )
+            imgui.pop_item_width()
+        changed_prepass, self.depth_prepass = imgui.checkbox("Depth pre-pass", self.depth_prepass)
+        if changed_instanced or changed_count or changed_prepass:
+            self.request_rebuild()
+        if self.shaded_fragments is not None and self.shaded_fragments.result is not None:
+            width, height = self.viewport
+            imgui.text("shaded fragments: %.2f per pixel" % (self.shaded_fragments.result / (width * height)))
+            imgui.text("shading: %.2f ms" % (self.shading_time.result / 1e6))
+            if self.depth_shader is not None and self.prepass_time.result is not None:
+                imgui.text("pre-pass: %.2f ms" % (self.prepass_time.result / 1e6))
             
         imgui.dummy(0, 5)
         imgui.text('Material')
@@ -79,7 +148,32 @@ class Content(GLContent):
                                                  min_value=1, max_value=8, format="2^%d")
 
         imgui.text('Light')
-        if self.task != 1:
+        if self.task == 3:
+            imgui.push_item_width(150)
+            changed_backend, self.light_backend = imgui.combo(
+                " Storage", self.light_backend, LIGHT_BACKENDS
+            )
+            if changed_backend:
+                self.request_rebuild()
+            _, self.light_count = imgui.slider_int("lights", self.light_count,
+                                                   min_value=1, max_value=self.light_capacity)
+            imgui.pop_item_width()
+            imgui.push_item_width(150)
+            changed_culling, self.light_culling = imgui.combo(
+                " Culling", self.light_culling, LIGHT_CULLING_MODES
+            )
+            imgui.pop_item_width()
+            if self.light_storage is not None and self.light_storage.culling:
+                imgui.text("lights per %s: %.1f / %d" % (["draw", "cluster"][self.light_storage.culling - 1],
+                                                         self.draw_light_count, self.light_count))
+            changed_stress, self.light_stress = imgui.checkbox("Stress scene", self.light_stress)
+            if changed_stress and self.light_stress:
+                self.instanced  = True
+                self.cube_count = max(self.cube_count, 1)
+            changed_deferred, self.deferred = imgui.checkbox("Deferred shading", self.deferred)
+            if changed_culling or changed_stress or changed_deferred:
+                self.request_rebuild()
+        if self.task != 1 and self.task != 3:
             imgui.text('Light position')
             imgui.push_item_width(250)
             _, self.light_position = imgui.drag_float3('pos', *self.light_position,
@@ -100,48 +194,151 @@ class Content(GLContent):
         imgui.end_group()
 
 
-    def render(self):
-        # select primitive type
-        vertices, _ = Primitive.box()
-
-        # configure the VBO and EBO
-        self.VBO = glGenBuffers(1)
-        # copy vertices array in a buffer for OpenGL to use
-        glBindBuffer(GL_ARRAY_BUFFER, self.VBO)
-        glBufferData(GL_ARRAY_BUFFER, vertices, GL_STATIC_DRAW)
-
-        # configure the object's VAO
-        self.light_VAO = glGenVertexArrays(1)
-        glBindVertexArray(self.light_VAO)
-        # position attribute
-        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 8 * sizeof(GLfloat), ctypes.c_void_p(0))
-        glEnableVertexAttribArray(0)
-        # normal attribute
-        glVertexAttribPointer(1, 3, GL_FLOAT, GL_FALSE, 8 * sizeof(GLfloat), ctypes.c_void_p(3 * sizeof(GLfloat)))
-        glEnableVertexAttribArray(1)
-        # texture coord attribute
-        glVertexAttribPointer(2, 2, GL_FLOAT, GL_FALSE, 8 * sizeof(GLfloat), ctypes.c_void_p(6 * sizeof(GLfloat)))
-        glEnableVertexAttribArray(2)
+    def setup(self):
+        # load and create the textures
+        self.texture_list, _ = get_texture_list(self.img_file_path)
 
-        # configure the light's VAO (VBO is the same)
-        self.lamp_VAO = glGenVertexArrays(1)
-        glBindVertexArray(self.lamp_VAO)
-
-        glBindBuffer(GL_ARRAY_BUFFER, self.VBO)
+        # set shader program
+        self.set_lights()
+        self.set_light_shader()
+        self.lamp_shader = Shader(os.path.join(self.file_path, '05_lamp.vs'),
+                                  os.path.join(self.file_path, '05_lamp.fs'))
 
-        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 8 * sizeof(GLfloat), ctypes.c_void_p(0))
-        glEnableVertexAttribArray(0)
+        # select primitive type
+        vertices, indices, layout = Primitive.geometry("box")     # : half floats and packed normals, half the bytes
+
+        # copy the vertices and the indices in the shared buffers of the layout (the mesh: its base vertex and first index)
+        self.mesh = mesh_arenas.add(layout, vertices, indices)
+
+        # the cubes' and the lamps' VAO (the buffers are the same, each shader reads its own attributes of the layout)
+        # : the cubes' one is configured for the shader drawing them (the light shader is the full-screen pass when deferred),
+        #   every shader of the cubes (05_light.vs, 05_depth.vs) has the same attribute locations
+        cube_shader    = self.gbuffer_shader if self.gbuffer_shader is not None else self.light_shader
+        self.light_VAO = self.mesh.arena.vertex_array(cube_shader.id)
+        self.lamp_VAO  = self.mesh.arena.vertex_array(self.lamp_shader.id)
+
+        self.set_instances()
+
+        self.shaded_fragments = FrameQuery(GL_SAMPLES_PASSED)
+        self.shading_time     = FrameQuery(GL_TIME_ELAPSED)
+        self.prepass_time     = FrameQuery(GL_TIME_ELAPSED)
+
+    def rebuild(self):
+        # only the light shader (light caster of the task, instanced mode) and the instances depend on the inspector setting
+        self.delete_light_shader()
+        self.delete_lights()
+        self.set_lights()
+        self.set_light_shader()
+        if self.instances is not None:
+            self.instances.delete()
+            self.instances = None
+        self.set_instances()
+
+    def set_instances(self):
+        # model matrices of all the cubes (location 3-6 of the object's VAO)
+        if not self.instanced:
+            return
+
+        count = self.cube_count_list[self.cube_count]
+        if count == len(self.cube_positions):
+            positions = np.array([list(position) for position in self.cube_positions], dtype=np.float32)
+        else:
+            positions = spawn_cube_positions(count)
+        angles = 20.0 * np.arange(count)
+
+        # the instances sorted by the chunk of the grid they are in: with culling per draw, every chunk is a draw
+        # with the lights reaching its bounding sphere (one sphere around the whole field lets nearly every light in)
+        low, high = positions.min(axis=0), positions.max(axis=0)
+        cells     = np.clip(((positions - low) / np.maximum(high - low, 1e-6) * CHUNK_GRID).astype(np.int64), 0, CHUNK_GRID - 1)
+        chunks    = (cells[:, 0] * CHUNK_GRID + cells[:, 1]) * CHUNK_GRID + cells[:, 2]
+        order     = np.argsort(chunks, kind="stable")
+        positions, angles, chunks = positions[order], angles[order], chunks[order]
+        self.instances = InstanceBuffer(self.light_VAO, 3, cube_model_matrices(positions, angles))
+
+        # (first instance, instances) and bounding sphere of every chunk
+        starts = np.flatnonzero(np.r_[True, chunks[1:] != chunks[:-1]])
+        counts = np.diff(np.r_[starts, count])
+        self.instance_chunks = list(zip(starts.tolist(), counts.tolist()))
+        self.chunk_centers   = np.add.reduceat(positions, starts, axis=0) / counts[:, None]
+        distances            = np.linalg.norm(positions - np.repeat(self.chunk_centers, counts, axis=0), axis=1)
+        self.chunk_radii     = np.maximum.reduceat(distances, starts) + CUBE_RADIUS
+
+    def set_lights(self):
+        # storage of the point / spot lights of task 4 (the shader is compiled for it)
+        if self.task != 3:
+            return
+
+        # (the deferred lighting pass is one draw: culling per draw has nothing to select)
+        culling = 0 if self.deferred and self.light_culling == 1 else self.light_culling
+        self.light_capacity = min(max_lights(self.light_backend, culling), self.light_limit)
+        self.light_count    = min(self.light_count, self.light_capacity)
+        self.light_storage  = LightStorage(self.light_backend, self.light_capacity, culling)
+
+        # around the cubes, orbiting the center of the scene in render()
+        # : the same lights whatever the capacity of the backend
+        if self.light_stress:
+            self.light_center = np.zeros(3, dtype=np.float32)
+            extent            = np.full(3, cube_field_size(self.cube_count_list[self.cube_count]) / 2.0)
+            self.lights       = spawn_lights(self.light_limit, self.light_center, extent, STRESS_ATTENUATION)[:self.light_capacity]
+        else:
+            self.light_center = np.array([0.0, 1.5, -7.0], dtype=np.float32)
+            self.lights       = spawn_lights(self.light_limit, self.light_center, np.array([5.0, 4.0, 9.0]))[:self.light_capacity]
+        self.light_orbit  = self.lights["position"].copy()
+        self.light_radii  = light_radii(self.lights)
+
+    def delete_lights(self):
+        if self.light_storage is not None:
+            self.light_storage.delete()
+        self.light_storage, self.lights = None, None
+
+    def set_light_shader(self):
+        # the instanced light shader reads the model matrix from a vertex attribute
+        defines = {"INSTANCED": 1} if self.instanced else {}
+        if self.depth_prepass:
+            self.depth_shader = Shader(os.path.join(self.file_path, '05_depth.vs'),
+                                       os.path.join(self.file_path, '05_depth.fs'),
+                                       defines)
+        if self.task == 3 and self.deferred:
+            # geometry pass of the cubes, then the lighting pass (full-screen, the same lights and shading)
+            self.gbuffer        = GBuffer()
+            self.gbuffer_shader = Shader(os.path.join(self.file_path, '05_light.vs'),
+                                         os.path.join(self.file_path, '05_gbuffer.fs'),
+                                         defines)
+            self.gbuffer_shader.use()
+            self.gbuffer_shader.set_int("material.diffuse",  0)
+            self.gbuffer_shader.set_int("material.specular", 1)
+            self.light_shader = Shader(os.path.join(self.file_path, '05_deferred.vs'),
+                                       os.path.join(self.file_path, '05_light_multiple.fs'),
+                                       dict(self.light_storage.defines(), DEFERRED=1))
+            return
+
+        if self.light_storage is not None:
+            defines.update(self.light_storage.defines())
+        self.light_shader = Shader(os.path.join(self.file_path, '05_light.vs'),
+                                   os.path.join(self.file_path, '05_light_{}.fs'.format(self.light_caster_names[self.task])),
+                                   defines)
+
+        # tell opengl for each sampler to which texture unit it belongs to (only has to be done once)
+        self.light_shader.use()
+        self.light_shader.set_int("material.diffuse",  0)
+        self.light_shader.set_int("material.specular", 1)
 
+    def delete_light_shader(self):
+        self.light_shader.release()
+        self.light_shader = None
+        if self.depth_shader is not None:
+            self.depth_shader.release()
+            self.depth_shader = None
+        if self.gbuffer is not None:
+            self.gbuffer.delete()
+            self.gbuffer_shader.release()
+            self.gbuffer, self.gbuffer_shader = None, None
 
+    def render(self):
         # load and create a texture
         diffuse_map  = self.texture_list[self.diff_map-1]
         specular_map = self.texture_list[self.spec_map-1]
 
-        self.light_shader.use()
-        self.light_shader.set_int("material.diffuse",  0)
-        self.light_shader.set_int("material.specular", 1)
-
-        
         # render
         glClearColor(0.1, 0.1, 0.1, 1.0)
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
@@ -158,95 +355,183 @@ class Content(GLContent):
         self.light_shader.set_vec3("viewPos", *self.camera.position)
 
         # material properties
-        self.light_shader.set_float("material.shininess", 32)
+        self.light_shader.set_float("material.shininess", 32)    # (the samplers keep the material out of a uniform block)
 
         # light properties
         # Task 1: Directional light (e.g. sun)
         if self.task == 0:
             # no need to have position because every object has the same light intensity regardless of distance b/w light and itself. 
-            self.light_shader.set_vec3("light.direction", *self.light_direction)
-            
-            self.light_shader.set_vec3("light.ambient",  glm.vec3(0.2))
-            self.light_shader.set_vec3("light.diffuse",  glm.vec3(0.5))
-            self.light_shader.set_vec3("light.specular", glm.vec3(1.0))
+            light_buffer.set(direction=self.light_direction,
+                             ambient=glm.vec3(0.2),
+                             diffuse=glm.vec3(0.5),
+                             specular=glm.vec3(1.0))
         # Task 2: Point light (e.g. light bulbs and torches)
         elif self.task == 1:
-            self.light_shader.set_vec3("light.position", *self.light_position)
-            
-            self.light_shader.set_vec3("light.ambient",  glm.vec3(0.2))
-            self.light_shader.set_vec3("light.diffuse",  glm.vec3(0.5))
-            self.light_shader.set_vec3("light.specular", glm.vec3(1.0))
+            light_buffer.set(position=self.light_position,
+                             ambient=glm.vec3(0.2),
+                             diffuse=glm.vec3(0.5),
+                             specular=glm.vec3(1.0))
 
             # attenuation
-            self.light_shader.set_float("light.constant",  1.0)      # distance of 50
-            self.light_shader.set_float("light.linear",    0.09)
-            self.light_shader.set_float("light.quadratic", 0.032)
+            light_buffer.set(constant=1.0,      # distance of 50
+                             linear=0.09,
+                             quadratic=0.032)
         # Task 3: Spot light (e.g. street lamp and flashlight)
         elif self.task == 2:
-            self.light_shader.set_vec3("light.position",     *self.camera.position)
-            self.light_shader.set_vec3("light.direction",    *self.camera.front)
-            self.light_shader.set_float("light.cutOff",      glm.cos(glm.radians(self.light_cut_off))) # compare cosine values instead of angle
-            self.light_shader.set_float("light.outerCutOff", glm.cos(glm.radians(self.light_outer_cut_off))) # for smooth/soft edges
+            light_buffer.set(position=self.camera.position,
+                             direction=self.camera.front,
+                             cutOff=glm.cos(glm.radians(self.light_cut_off)),                # compare cosine values instead of angle
+                             outerCutOff=glm.cos(glm.radians(self.light_outer_cut_off)))     # for smooth/soft edges
 
             # we configure the diffuse intensity slightly higher
             # the right lighting conditions differ with each lighting method and environment
             # each environment and lighting type requires some tweaking to get the best out of your environment
-            self.light_shader.set_vec3("light.ambient",  glm.vec3(0.1))
-            self.light_shader.set_vec3("light.diffuse",  glm.vec3(0.8))
-            self.light_shader.set_vec3("light.specular", glm.vec3(1.0))
-
-            self.light_shader.set_float("light.constant",  1.0)
-            self.light_shader.set_float("light.linear",    0.09)
-            self.light_shader.set_float("light.quadratic", 0.032)
+            light_buffer.set(ambient=glm.vec3(0.1),
+                             diffuse=glm.vec3(0.8),
+                             specular=glm.vec3(1.0))
+
+            light_buffer.set(constant=1.0,
+                             linear=0.09,
+                             quadratic=0.032)
+        # Task 4: Multiple lights (a dim sun, and colored point / spot lights orbiting the scene)
+        elif self.task == 3:
+            light_buffer.set(direction=self.light_direction,
+                             ambient=glm.vec3(0.05),
+                             diffuse=glm.vec3(0.2),
+                             specular=glm.vec3(0.3))
+
+            lights = self.lights[:self.light_count]
+            lights["position"] = orbit_positions(self.light_orbit[:self.light_count], self.light_center, current_frame * 0.5)
+            self.light_storage.upload(self.light_shader, lights)
+            if self.light_storage.clusters is not None:
+                # (the camera block of this frame is already set)
+                self.light_storage.clusters.update(self.light_shader, lights, self.light_radii[:self.light_count],
+                                                   camera_buffer.proj_mat, camera_buffer.view_mat)
+                self.draw_light_count = self.light_storage.clusters.mean_count
         else:
             raise TypeError("Wrong task number")
+        light_buffer.upload()    # the whole light with one call
 
-        # render container
-        glBindVertexArray(self.light_VAO)        
-
-        # view properties for object shader           
-        proj_mat = glm.perspective(glm.radians(self.camera.fov), self.viewport[0]/self.viewport[1], 0.1, 100.0)
-        view_mat = self.camera.get_view_matrix()
-        self.light_shader.set_mat4("projection", proj_mat)
-        self.light_shader.set_mat4("view", view_mat)
+        # view properties for object shader: projection and view come from the shared Camera block
+        # (set by the viewer once per frame)
 
 
         # objects
-        # texture
-        glActiveTexture(GL_TEXTURE0)
-        glBindTexture(GL_TEXTURE_2D, diffuse_map)
-        glActiveTexture(GL_TEXTURE1)
-        glBindTexture(GL_TEXTURE_2D, specular_map)
+        # textures: bound with each draw item of the render queue
+        material_maps = ((0, diffuse_map), (1, specular_map))
+
+        # lights of each draw (task 4 with culling per draw): (draws, lights) mask
+        draw_lights = None
+        if self.task == 3 and self.light_storage.culling == 1:
+            lights, radii = self.lights[:self.light_count], self.light_radii[:self.light_count]
+            if self.instances is not None:
+                draw_lights = cull_lights(lights, radii, self.chunk_centers, self.chunk_radii)
+            else:
+                draw_lights = cull_lights(lights, radii, [list(position) for position in self.cube_positions], CUBE_RADIUS)
+            self.draw_light_count = draw_lights.sum(axis=1).mean()
+
+        # deferred: the cubes only write their surface, the lights are applied by the full-screen pass below
+        object_shader = self.light_shader
+        if self.gbuffer is not None:
+            self.gbuffer.begin()
+            object_shader = self.gbuffer_shader
+
+        # depth pre-pass: the depth of the nearest cubes, no color
+        prepass = self.depth_shader is not None and self.gbuffer is None
+        if prepass:
+            self.prepass_time.begin()
+            glColorMask(GL_FALSE, GL_FALSE, GL_FALSE, GL_FALSE)
+            self.draw_cubes(self.depth_shader)
+            glColorMask(GL_TRUE, GL_TRUE, GL_TRUE, GL_TRUE)
+            self.prepass_time.end()
+
+            # shade only the fragments of that depth (no depth writes, it is already there)
+            glDepthFunc(GL_EQUAL)
+            glDepthMask(GL_FALSE)
 
         # draw
-        glBindVertexArray(self.light_VAO)
-        for i in range(len(self.cube_positions)):
-            model = glm.mat4(1.0)
-            model = glm.translate(model, self.cube_positions[i])
-            angle = 20.0 * i
-            model = glm.rotate(model, glm.radians(angle), glm.vec3(1.0, 0.3, 0.5))
-            self.light_shader.set_mat4("model", model)
-            
-            glDrawArrays(GL_TRIANGLES, 0, 36)
+        self.shaded_fragments.begin()
+        self.shading_time.begin()
+        self.draw_cubes(object_shader, material_maps, draw_lights)
+        self.shading_time.end()
+        self.shaded_fragments.end()
+
+        if prepass:
+            glDepthFunc(GL_LESS)
+            glDepthMask(GL_TRUE)
+
+        if self.gbuffer is not None:
+            self.light_shader.use()
+            self.gbuffer.resolve(self.light_shader)
       
         # draw light cube
         if self.task == 1:
-            self.lamp_shader.use()
-            self.lamp_shader.set_mat4("projection", proj_mat)
-            self.lamp_shader.set_mat4("view", view_mat)
-
             model_mat = glm.mat4(1.0)
             model_mat = glm.translate(model_mat, self.light_position)
             model_mat = glm.scale(model_mat, glm.vec3(0.2))
-            self.lamp_shader.set_mat4("model", model_mat)
-
-            self.lamp_shader.set_vec3("color", glm.vec3(1.0))
-
-            glBindVertexArray(self.lamp_VAO)
-            glDrawArrays(GL_TRIANGLES, 0, 36)
 
+            render_queue.submit(self.lamp_shader, self.lamp_VAO, self.cube_draw(),
+                                uniforms=[("set_mat4", "model", model_mat), ("set_vec3", "color", glm.vec3(1.0))])
+            render_queue.flush()
+
+
+    def draw_cubes(self, shader, textures=(), draw_lights=None):
+        # all the cubes with the shader through the render queue (nearest first)
+        # draw_lights: (draws, lights) mask of culling per draw
+        if self.instances is not None and draw_lights is None:
+            render_queue.submit(shader, self.light_VAO, (self.draw_instances, (0, self.instances.count)), textures)
+        elif self.instances is not None:
+            view_mat = camera_buffer.view_mat
+            for i, (first, count) in enumerate(self.instance_chunks):
+                uniforms = self.light_storage.draw_light_uniforms(np.flatnonzero(draw_lights[i]))
+                render_queue.submit(shader, self.light_VAO, (self.draw_instances, (first, count)), textures, uniforms,
+                                    view_depth(view_mat, glm.vec3(*self.chunk_centers[i])))
+        else:
+            draw     = self.cube_draw()
+            view_mat = camera_buffer.view_mat
+            for i in range(len(self.cube_positions)):
+                model = glm.mat4(1.0)
+                model = glm.translate(model, self.cube_positions[i])
+                angle = 20.0 * i
+                model = glm.rotate(model, glm.radians(angle), glm.vec3(1.0, 0.3, 0.5))
+                uniforms = [("set_mat4", "model", model)]
+                if draw_lights is not None:
+                    uniforms += self.light_storage.draw_light_uniforms(np.flatnonzero(draw_lights[i]))
+
+                render_queue.submit(shader, self.light_VAO, draw, textures, uniforms,
+                                    view_depth(view_mat, self.cube_positions[i]))
+        render_queue.flush()
+
+    def draw_instances(self, first, count):
+        # instances first .. first + count - 1 of the cubes (the VAO is bound by the render queue)
+        # : GL 3.3 has no base instance, the matrix attribute is moved to the first one
+        gl_state.bind_buffer(GL_ARRAY_BUFFER, self.instances.VBO)
+        point_model_matrices(3, first * 64)
+        self.mesh.draw(count)
+
+    def cube_draw(self, instance_count=None):
+        # draw of the cube (the light / lamp VAO), of instance_count instances when given
+        return self.mesh.draw_call(instance_count)
 
     def destroy(self):
-        glDeleteVertexArrays(1, self.light_VAO)
-        glDeleteVertexArrays(1, self.lamp_VAO)
-        glDeleteBuffers(1, self.VBO)
\ No newline at end of file
+        self.delete_lights()
+        if self.instances is not None:
+            self.instances.delete()
+            self.instances = None
+        if self.shaded_fragments is not None:
+            for query in (self.shaded_fragments, self.shading_time, self.prepass_time):
+                query.delete()
+            self.shaded_fragments, self.shading_time, self.prepass_time = None, None, None
+        if self.mesh is not None:
+            self.mesh.free()     # : its ranges in the shared buffers (the buffers and the VAOs stay)
+        self.mesh = None
+        self.light_VAO, self.lamp_VAO = None, None
+
+        if self.light_shader is not None:
+            self.delete_light_shader()
+            self.lamp_shader.release()
+            self.lamp_shader = None
+
+        for texture in self.texture_list:
+            texture_manager.release(texture)
+        self.texture_list = []
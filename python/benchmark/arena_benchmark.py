@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+# many small meshes: a VBO / EBO / VAO per mesh vs the shared buffers of a mesh arena (visualizer.mesh_arena)
+# : setup - upload the meshes (and the VAOs)
+#   draw  - one draw per mesh: bind its VAO + glDrawElements vs one VAO + glDrawElementsBaseVertex
+#   churn - free a random half of the arena's meshes and add meshes of random sizes: utilization and
+#           fragmentation of the buffers, before and after compact()
+#   usage: python arena_benchmark.py --meshes 1000 10000 --frames 10
+import os, sys
+sys.path.append(os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+import ctypes
+import argparse
+import statistics
+import numpy as np
+
+from OpenGL.GL import *
+
+from visualizer.shader        import Shader
+from visualizer.geometry      import index_type, upload_mesh
+from visualizer.primitives    import Primitive
+from visualizer.vertex_layout import vertex_arrays
+from visualizer.mesh_arena    import MeshArena
+from bench_utils import *
+
+
+def separate_meshes(program, layout, vertices, indices, count):
+    # (VBO, EBO, VAO) of every mesh
+    mesh_list = []
+    for _ in range(count):
+        VBO, EBO = upload_mesh(vertices, indices)
+        mesh_list.append((VBO, EBO, vertex_arrays.get(program, layout, VBO, EBO)))
+    return mesh_list
+
+def draw_separate(mesh_list, index_count, indices_type):
+    for _, _, vao in mesh_list:
+        glBindVertexArray(vao)
+        glDrawElements(GL_TRIANGLES, index_count, indices_type, ctypes.c_void_p(0))
+
+def draw_arena(vao, mesh_list):
+    glBindVertexArray(vao)
+    for mesh in mesh_list:
+        mesh.draw()
+
+def median_ms(func, frames):
+    return statistics.median(measure_ms(func)[0] for _ in range(frames))
+
+def churn(arena, mesh_list, layout, rng):
+    # free a random half, add as many meshes of 4 to 256 random vertices
+    for i in sorted(rng.choice(len(mesh_list), len(mesh_list) // 2, replace=False), reverse=True):
+        mesh_list.pop(i).free()
+    for _ in range(len(mesh_list)):
+        vertex_count = int(rng.integers(4, 257))
+        vertices = rng.integers(0, 255, vertex_count * layout.stride, dtype=np.uint8)
+        indices  = rng.integers(0, vertex_count, 3 * vertex_count, dtype=np.uint16)
+        mesh_list.append(arena.add(vertices, indices))
+
+def fragmentation_row(name, arena):
+    stats = arena.stats()
+    return "%-10s %10.1f KB %9.0f%% %9.0f%% %9.0f%% %9.0f%%" % (name, stats["bytes"] / 1024,
+                                                                 100.0 * stats["vertices"]["utilization"],
+                                                                 100.0 * stats["vertices"]["fragmentation"],
+                                                                 100.0 * stats["indices"]["utilization"],
+                                                                 100.0 * stats["indices"]["fragmentation"])
+
+def main(args):
+    window = create_hidden_window(*args.size)
+    fbo, renderbuffers = create_framebuffer(*args.size)
+    print_driver()
+
+    root   = os.path.dirname(os.path.abspath(os.path.dirname(__file__)))
+    path   = os.path.join(root, "02_lighting", "05_lighting_casters")
+    shader = Shader(os.path.join(path, "05_lamp.vs"), os.path.join(path, "05_lamp.fs"))
+    shader.use()
+    vertices, indices, layout = Primitive.compact("box")
+    rng = np.random.default_rng(0)
+
+    print("\n%8s %22s %22s %22s %22s" % ("meshes", "setup (separate)", "setup (arena)", "draw (separate)", "draw (arena)"))
+    for count in args.meshes:
+        setup_separate, separate_list = measure_ms(lambda: separate_meshes(shader.id, layout, vertices, indices, count))
+        arena = MeshArena(layout, indices.dtype)
+        setup_arena, arena_list = measure_ms(lambda: [arena.add(vertices, indices) for _ in range(count)])
+        vao = arena.vertex_array(shader.id)
+
+        draw_separate_ms = median_ms(lambda: draw_separate(separate_list, len(indices), index_type(indices)), args.frames)
+        draw_arena_ms    = median_ms(lambda: draw_arena(vao, arena_list), args.frames)
+        print("%8d %22s %22s %22s %22s" % (count, "%.1f ms, %d buffers" % (setup_separate, 2 * count),
+                                           "%.1f ms, 2 buffers" % setup_arena,
+                                           "%.2f ms, %d VAOs" % (draw_separate_ms, count), "%.2f ms, 1 VAO" % draw_arena_ms))
+
+        print("\n%-10s %13s %10s %10s %10s %10s" % ("arena", "capacity", "vtx used", "vtx frag", "idx used", "idx frag"))
+        print(fragmentation_row("filled", arena))
+        churn(arena, arena_list, layout, rng)
+        print(fragmentation_row("churned", arena))
+        compact_ms, _ = measure_ms(arena.compact)
+        print(fragmentation_row("compacted", arena) + "   (compact: %.1f ms)\n" % compact_ms)
+
+        buffers = [buffer for VBO, EBO, _ in separate_list for buffer in (VBO, EBO)]
+        vertex_arrays.release_buffers(*buffers)
+        glDeleteBuffers(len(buffers), buffers)
+        arena.delete()
+
+    shader.release()
+    delete_framebuffer(fbo, renderbuffers)
+    destroy_window(window)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mesh arena benchmark")
+    parser.add_argument('--meshes', type=int, nargs='+', default=[1000, 10000], help="small meshes (boxes) per run")
+    parser.add_argument('--frames', type=int, default=10, help="measured frames per configuration")
+    parser.add_argument('--size', type=int, nargs=2, default=[640, 480], help="framebuffer size")
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,69 @@
+import os, sys
+import time
+import glfw
+
+from OpenGL.GL import *
+
+
+# create an invisible window, only to get an OpenGL 3.3 core context for the benchmarks
+def create_hidden_window(width=640, height=480):
+    if not glfw.init():
+        print("Could not initialize OpenGL context")
+        exit(1)
+
+    glfw.window_hint(glfw.CONTEXT_VERSION_MAJOR, 3)
+    glfw.window_hint(glfw.CONTEXT_VERSION_MINOR, 3)
+    glfw.window_hint(glfw.OPENGL_PROFILE, glfw.OPENGL_CORE_PROFILE)
+    if (sys.platform == "darwin"):  # for Mac OS. forward compatibility
+        glfw.window_hint(glfw.OPENGL_FORWARD_COMPAT, GL_TRUE)
+    glfw.window_hint(glfw.VISIBLE, glfw.FALSE)
+
+    window = glfw.create_window(int(width), int(height), "benchmark", None, None)
+    if not window:
+        glfw.terminate()
+        print("Could not initialize Window")
+        exit(1)
+    glfw.make_context_current(window)
+
+    return window
+
+def destroy_window(window):
+    glfw.destroy_window(window)
+    glfw.terminate()
+
+# offscreen color + depth framebuffer to render into
+# : the pixels of an invisible window may not be shaded at all, which would hide the fragment shader cost
+def create_framebuffer(width, height):
+    fbo = glGenFramebuffers(1)
+    glBindFramebuffer(GL_FRAMEBUFFER, fbo)
+
+    color, depth = glGenRenderbuffers(2)
+    glBindRenderbuffer(GL_RENDERBUFFER, color)
+    glRenderbufferStorage(GL_RENDERBUFFER, GL_RGBA8, width, height)
+    glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_RENDERBUFFER, color)
+    glBindRenderbuffer(GL_RENDERBUFFER, depth)
+    glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH24_STENCIL8, width, height)
+    glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_STENCIL_ATTACHMENT, GL_RENDERBUFFER, depth)
+
+    if glCheckFramebufferStatus(GL_FRAMEBUFFER) != GL_FRAMEBUFFER_COMPLETE:
+        raise RuntimeError("ERROR::FRAMEBUFFER:: framebuffer is not complete")
+    glViewport(0, 0, width, height)
+    return fbo, [color, depth]
+
+def delete_framebuffer(fbo, renderbuffers):
+    glBindFramebuffer(GL_FRAMEBUFFER, 0)
+    glDeleteRenderbuffers(len(renderbuffers), renderbuffers)
+    glDeleteFramebuffers(1, [fbo])
+
+def print_driver():
+    print("GL_VENDOR   : %s" % glGetString(GL_VENDOR).decode())
+    print("GL_RENDERER : %s" % glGetString(GL_RENDERER).decode())
+    print("GL_VERSION  : %s" % glGetString(GL_VERSION).decode())
+
+# elapsed milliseconds of func() (glFinish() so the driver work is included)
+def measure_ms(func):
+    glFinish()
+    start = time.perf_counter()
+    result = func()
+    glFinish()
+    return (time.perf_counter() - start) * 1000.0, result
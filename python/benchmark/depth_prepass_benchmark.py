@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+# depth pre-pass of 05_lighting_casters: frame time and shaded fragments per pixel with and without it
+# : the cubes of the instanced cube fields overlap, without the pre-pass every overlapping fragment is shaded
+#   the shaded fragments are counted with a GL_SAMPLES_PASSED query around the shading pass
+#   usage: python depth_prepass_benchmark.py --task 4 --lights 32 --cubes 0 1 2 --frames 10 --size 640 480
+import os, sys
+sys.path.append(os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+import argparse
+import statistics
+
+from OpenGL.GL import *
+
+from visualizer.texture        import texture_manager
+from visualizer.uniform_buffer import camera_buffer, light_buffer
+from bench_utils import *
+from many_lights_benchmark import create_content
+
+
+CUBE_COUNT_NAMES = ["10", "10k", "100k", "1M"]
+
+def measure(content, frames):
+    # (median ms per frame, shaded fragments of the last frame)
+    frame_list = []
+    for _ in range(frames):
+        elapsed, _ = measure_ms(content.render)
+        frame_list.append(elapsed)
+    return statistics.median(frame_list), content.shaded_fragments.result
+
+def main(args):
+    window = create_hidden_window(*args.size)
+    fbo, renderbuffers = create_framebuffer(*args.size)
+    print_driver()
+    glEnable(GL_DEPTH_TEST)
+
+    content = create_content(window, args.size)
+    content.task        = args.task - 1
+    content.light_count = args.lights
+    camera_buffer.set_camera(content.camera, args.size[0] / args.size[1])
+    pixels = args.size[0] * args.size[1]
+
+    print("\n%d x %d, task %d, median of %d frames" % (args.size[0], args.size[1], args.task, args.frames))
+    print("%8s%28s%28s%12s" % ("cubes", "no pre-pass", "pre-pass", "removed"))
+    for cube_count in args.cubes:
+        content.instanced  = cube_count > 0       # : the 10 cubes of the chapter are drawn one by one
+        content.cube_count = cube_count
+        row = "%8s" % CUBE_COUNT_NAMES[cube_count]
+
+        fragment_list = []
+        for prepass in (False, True):
+            content.depth_prepass = prepass
+            content.request_rebuild()
+            content.prepare()
+            texture_manager.wait()     # : the material maps, not the placeholder
+            for _ in range(3):
+                content.render()        # : warm up, and the first query results (read a few frames later)
+
+            ms, fragments = measure(content, args.frames)
+            fragment_list.append(fragments)
+            row += "%28s" % ("%.2f ms, %.2f frag/px" % (ms, fragments / pixels))
+        print(row + "%11.0f%%" % (100.0 * (1.0 - fragment_list[1] / max(fragment_list[0], 1))))
+
+    content.destroy()
+    texture_manager.clear()
+    camera_buffer.delete()
+    light_buffer.delete()
+    delete_framebuffer(fbo, renderbuffers)
+    destroy_window(window)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Depth pre-pass benchmark")
+    parser.add_argument('--task', type=int, default=4, help="task of 05_lighting_casters (4: many lights)")
+    parser.add_argument('--lights', type=int, default=32, help="point / spot lights of task 4")
+    parser.add_argument('--cubes', type=int, nargs='+', default=[0, 1, 2], help="cube fields (0: 10, 1: 10k, 2: 100k, 3: 1M)")
+    parser.add_argument('--frames', type=int, default=10, help="measured frames per configuration")
+    parser.add_argument('--size', type=int, nargs=2, default=[640, 480], help="framebuffer size")
+    args = parser.parse_args()
+
+    main(args)
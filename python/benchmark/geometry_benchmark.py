@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+# expanded vs indexed geometry (visualizer.geometry): vertex memory and vertex shader invocations
+# : the invocations are estimated with a FIFO post-transform cache of the given sizes (ACMR: vertices shaded
+#   per triangle, 3 without indices), the grid is an expanded mesh welded by weld()
+#   'compact' is the indexed mesh in its compact vertex format (visualizer.vertex_format, --error bound)
+#   usage: python geometry_benchmark.py --cache 16 32 --grid 64 256 --error 0.001
+import os, sys
+sys.path.append(os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+import time
+import argparse
+from collections import deque
+import numpy as np
+
+from visualizer.geometry      import weld
+from visualizer.primitives    import Primitive
+from visualizer.vertex_format import compact_vertices
+
+
+def fifo_misses(indices, cache_size):
+    # vertices shaded for the indices with a FIFO cache of the last cache_size vertices
+    cache, cached, misses = deque(), set(), 0
+    for index in indices.tolist():
+        if index in cached:
+            continue
+        misses += 1
+        cache.append(index)
+        cached.add(index)
+        if len(cache) > cache_size:
+            cached.discard(cache.popleft())
+    return misses
+
+def expanded_grid(size):
+    # size x size quads of a unit grid in the xy plane, 2 triangles (6 corners) per quad: position + uv
+    corners = np.array([(0, 0), (1, 0), (1, 1), (1, 1), (0, 1), (0, 0)], dtype=np.float32)
+    y, x    = np.mgrid[0:size, 0:size].astype(np.float32)
+    uv      = (np.stack([x.ravel(), y.ravel()], axis=1)[:, None, :] + corners[None, :, :]).reshape(-1, 2) / size
+    return np.concatenate([uv - 0.5, np.zeros((len(uv), 1), dtype=np.float32), uv], axis=1).ravel()
+
+def report(name, layout, vertices, indices, caches, max_error):
+    stride         = layout.stride // 4
+    expanded_bytes = len(indices) * stride * 4
+    indexed_bytes  = vertices.nbytes + indices.nbytes
+    compact_bytes  = compact_vertices(vertices, layout, max_error)[0].nbytes + indices.nbytes
+    triangles      = len(indices) // 3
+    row = "%-14s %8d %8d %11d %11d %11d %7.0f%%" % (name, len(indices), len(vertices) // stride, expanded_bytes, indexed_bytes,
+                                                     compact_bytes, 100.0 * (1.0 - compact_bytes / expanded_bytes))
+    for cache_size in caches:
+        row += "%10.2f" % (fifo_misses(indices, cache_size) / triangles)
+    print(row)
+
+def main(args):
+    header = "%-14s %8s %8s %11s %11s %11s %8s" % ("mesh", "expanded", "unique", "bytes", "indexed", "compact", "saved")
+    print(header + "".join("%10s" % ("ACMR %d" % size) for size in args.cache))
+
+    for name in Primitive.SHAPES:
+        vertices, indices = Primitive.mesh(name)
+        report(name, Primitive.layout(name), vertices, indices, args.cache, args.error)
+
+    for size in args.grid:
+        expanded = expanded_grid(size)
+        start = time.perf_counter()
+        vertices, indices = weld(expanded, 5)
+        elapsed = (time.perf_counter() - start) * 1000.0
+        report("grid %d" % size, Primitive.layout("rectangle"), vertices, indices, args.cache, args.error)
+        print("%-14s weld: %.1f ms" % ("", elapsed))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Indexed geometry benchmark")
+    parser.add_argument('--cache', type=int, nargs='+', default=[16, 32], help="post-transform cache sizes (vertices)")
+    parser.add_argument('--grid', type=int, nargs='+', default=[64, 256], help="quads per side of the welded grids")
+    parser.add_argument('--error', type=float, default=1e-3, help="error bound of the compact vertex formats")
+    args = parser.parse_args()
+
+    main(args)
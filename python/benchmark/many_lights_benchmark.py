@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+# fps vs light count of the many-lights mode of 05_lighting_casters (task 4), for every light storage backend
+# : uniform array / uniform buffer / texture buffer (visualizer/lighting.py), each without culling (one loop over
+#   all the lights), with culling per draw and clustered, and forward or deferred shading (visualizer/deferred.py)
+#   the lights orbit the scene, so every frame uploads all of them (and culls / bins them again)
+#   usage: python many_lights_benchmark.py --counts 1 16 64 256 800 --frames 10 --size 640 480
+#          python many_lights_benchmark.py --stress --cubes 1 --backends 2 --counts 256 1024 4096
+#          (stress scene: the lights spread over an instanced field of 10 / 10k / 100k / 1M cubes)
+#          python many_lights_benchmark.py --stress --backends 2 --culling 0 --shading 0 1 --counts 1 10 50 100 250 500
+#   ('-' : more lights than the backend can hold on this driver)
+import os, sys
+sys.path.append(os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+import argparse
+import importlib
+import statistics
+
+import glm
+from OpenGL.GL import *
+
+from visualizer.camera         import Camera
+from visualizer.lighting       import LIGHT_BACKENDS, LIGHT_CULLING_MODES, max_lights
+from visualizer.texture        import texture_manager
+from visualizer.uniform_buffer import camera_buffer, light_buffer
+from bench_utils import *
+
+
+def create_content(window, size):
+    root   = os.path.dirname(os.path.abspath(os.path.dirname(__file__)))
+    module = importlib.import_module("02_lighting.05_lighting_casters.content")
+    camera = Camera(size[0], size[1], glm.vec3(0.0, 0.0, 3.0))
+    return module.Content(window, list(size), camera, os.path.join(root, "02_lighting", "05_lighting_casters"))
+
+def measure_frames(content, frames):
+    # median milliseconds of one frame
+    frame_list = []
+    for _ in range(frames):
+        elapsed, _ = measure_ms(content.render)
+        frame_list.append(elapsed)
+    return statistics.median(frame_list)
+
+def main(args):
+    window = create_hidden_window(*args.size)
+    fbo, renderbuffers = create_framebuffer(*args.size)
+    print_driver()
+    glEnable(GL_DEPTH_TEST)
+
+    content = create_content(window, args.size)
+    content.task         = 3
+    content.light_limit  = max(args.counts)
+    content.light_stress = args.stress
+    content.instanced    = args.stress
+    content.cube_count   = args.cubes
+    camera_buffer.set_camera(content.camera, args.size[0] / args.size[1])
+
+    # (backend, culling, deferred) -> [ms per frame of each count, None if over the capacity]
+    configs     = [(backend, culling, deferred) for backend in args.backends for culling in args.culling
+                                                for deferred in args.shading]
+    names       = ["%s, %s%s" % (LIGHT_BACKENDS[backend], LIGHT_CULLING_MODES[culling], ", deferred" if deferred else "")
+                   for backend, culling, deferred in configs]
+    result_list = []
+    loop_list   = []    # : lights of the shader loop (per draw / per non-empty cluster with culling) of each count
+    for backend, culling, deferred in configs:
+        content.light_backend = backend
+        content.light_culling = culling
+        content.deferred      = bool(deferred)
+        content.light_count   = max(args.counts)
+        content.request_rebuild()
+        content.prepare()
+        texture_manager.wait()     # : the material maps, not the placeholder
+
+        ms_list, loops = [], []
+        for count in args.counts:
+            if count > content.light_capacity:
+                ms_list.append(None)
+                loops.append(None)
+                continue
+            content.light_count = count
+            content.render()        # : warm up (first upload, shader variant)
+            ms_list.append(measure_frames(content, args.frames))
+            loops.append(content.draw_light_count if content.light_storage.culling else count)
+        result_list.append(ms_list)
+        loop_list.append(loops)
+        print("%-38s holds up to %d lights" % (names[len(result_list) - 1], max_lights(backend, content.light_storage.culling)))
+
+    print("\n%d x %d, %s, median of %d frames: fps (ms/frame)" % (
+        args.size[0], args.size[1], "stress scene" if args.stress else "10 cubes", args.frames))
+    print("%-38s" % "lights" + "".join("%16d" % count for count in args.counts))
+    for name, ms_list in zip(names, result_list):
+        print("%-38s" % name + "".join("%16s" % ("-" if ms is None else "%.1f (%.2f)" % (1000.0 / ms, ms)) for ms in ms_list))
+
+    print("\nlights of the shader loop (per draw / per non-empty cluster)")
+    for name, loops in zip(names, loop_list):
+        print("%-38s" % name + "".join("%16s" % ("-" if n is None else "%.1f" % n) for n in loops))
+
+    content.destroy()
+    texture_manager.clear()
+    camera_buffer.delete()
+    light_buffer.delete()
+    delete_framebuffer(fbo, renderbuffers)
+    destroy_window(window)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Many lights storage backend benchmark")
+    parser.add_argument('--counts', type=int, nargs='+', default=[1, 16, 64, 256, 800, 2000], help="light counts")
+    parser.add_argument('--frames', type=int, default=10, help="measured frames per light count")
+    parser.add_argument('--size', type=int, nargs=2, default=[640, 480], help="framebuffer size")
+    parser.add_argument('--backends', type=int, nargs='+', default=[0, 1, 2], help="light storage backends (%s)" %
+                        ", ".join("%d: %s" % item for item in enumerate(LIGHT_BACKENDS)))
+    parser.add_argument('--culling', type=int, nargs='+', default=[0, 1, 2], help="culling modes (%s)" %
+                        ", ".join("%d: %s" % item for item in enumerate(LIGHT_CULLING_MODES)))
+    parser.add_argument('--shading', type=int, nargs='+', default=[0], help="0: forward, 1: deferred")
+    parser.add_argument('--stress', action='store_true', help="stress scene: the lights spread over an instanced cube field")
+    parser.add_argument('--cubes', type=int, default=1, help="cube field of the stress scene (0: 10, 1: 10k, 2: 100k, 3: 1M)")
+    args = parser.parse_args()
+
+    main(args)
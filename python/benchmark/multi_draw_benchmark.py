@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+# N objects of 3 shapes (triangle, rectangle, box), each with its own model matrix
+# : per object - glUniformMatrix4fv + glDrawElementsBaseVertex per object (as the chapters' cube loops)
+#   GL 3.3     - DrawBatcher: one glDrawElementsInstancedBaseVertex per mesh, the matrices streamed
+#   indirect   - DrawBatcher: one glMultiDrawElementsIndirect per mesh arena (GL 4.3 / GL_ARB_multi_draw_indirect)
+#   usage: python multi_draw_benchmark.py --objects 1000 10000 --frames 10
+import os, sys
+sys.path.append(os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+import argparse
+import statistics
+import numpy as np
+import glm
+
+from OpenGL.GL import *
+
+from visualizer.shader         import Shader
+from visualizer.primitives     import Primitive
+from visualizer.mesh_arena     import MeshArenas
+from visualizer.gl_state       import gl_state
+from visualizer.uniform_buffer import camera_buffer
+from visualizer.instancing     import cube_model_matrices, spawn_cube_positions
+from visualizer.multi_draw     import DrawBatcher, multi_draw_indirect_supported, reset_batch_stats
+from bench_utils import *
+
+
+def draw_per_object(shader, meshes, mesh_ids, model_mats):
+    shader.use()
+    for mesh_id, model_mat in zip(mesh_ids, model_mats):
+        gl_state.bind_vertex_array(meshes[mesh_id].arena.vertex_array(shader.id))
+        shader.set_mat4("model", model_mat)
+        meshes[mesh_id].draw()
+
+def draw_batched(batcher, shader, meshes, mesh_ids, model_mats):
+    batcher.submit(shader, meshes, model_mats, mesh_ids)
+    batcher.flush()
+
+def median_ms(func, frames):
+    return statistics.median(measure_ms(func)[0] for _ in range(frames))
+
+def main(args):
+    window = create_hidden_window(*args.size)
+    fbo, renderbuffers = create_framebuffer(*args.size)
+    print_driver()
+
+    root = os.path.dirname(os.path.abspath(os.path.dirname(__file__)))
+    path = os.path.join(root, "01_getting_started", "07_camera")
+    vs, fs = os.path.join(path, "07_vtx_shader.vs"), os.path.join(path, "07_frag_shader.fs")
+    shader, instanced_shader = Shader(vs, fs), Shader(vs, fs, {"INSTANCED": 1})
+    camera_buffer.set_matrices(glm.perspective(glm.radians(45.0), args.size[0] / args.size[1], 0.1, 500.0),
+                               glm.lookAt(glm.vec3(0.0, 0.0, 100.0), glm.vec3(0.0), glm.vec3(0.0, 1.0, 0.0)))
+
+    arenas = MeshArenas()
+    meshes = []
+    for shape in Primitive.SHAPES:
+        vertices, indices, layout = Primitive.compact(shape)
+        meshes.append(arenas.add(layout, vertices, indices))
+
+    indirect = multi_draw_indirect_supported()
+    if not indirect:
+        print("GL_ARB_multi_draw_indirect is not supported: no indirect column")
+
+    print("\n%8s %24s %24s %24s" % ("objects", "per object", "batched (GL 3.3)", "batched (indirect)"))
+    for count in args.objects:
+        positions  = spawn_cube_positions(count)
+        model_mats = cube_model_matrices(positions, 20.0 * np.arange(count))
+        glm_mats   = [glm.mat4(*model_mat.ravel()) for model_mat in model_mats]
+        mesh_ids   = np.arange(count) % len(meshes)
+
+        row = "%8d %24s" % (count, "%.2f ms, %d calls" % (median_ms(lambda: draw_per_object(shader, meshes, mesh_ids, glm_mats),
+                                                                     args.frames), count))
+        for use_indirect in ([False, True] if indirect else [False]):
+            batcher = DrawBatcher(count, indirect=use_indirect)
+            draw_batched(batcher, instanced_shader, meshes, mesh_ids, model_mats)     # : warm up (VAOs)
+            reset_batch_stats()
+            elapsed_ms = median_ms(lambda: draw_batched(batcher, instanced_shader, meshes, mesh_ids, model_mats), args.frames)
+            calls = reset_batch_stats()["calls"] // args.frames
+            row += " %24s" % ("%.2f ms, %d calls" % (elapsed_ms, calls))
+            batcher.delete()
+        print(row)
+
+    arenas.clear()
+    camera_buffer.delete()
+    shader.release()
+    instanced_shader.release()
+    delete_framebuffer(fbo, renderbuffers)
+    destroy_window(window)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Multi-draw batching benchmark")
+    parser.add_argument('--objects', type=int, nargs='+', default=[1000, 10000], help="objects (of 3 meshes) per frame")
+    parser.add_argument('--frames', type=int, default=10, help="measured frames per configuration")
+    parser.add_argument('--size', type=int, nargs=2, default=[640, 480], help="framebuffer size")
+    args = parser.parse_args()
+
+    main(args)
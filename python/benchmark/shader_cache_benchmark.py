@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# cold start vs warm start of the chapter shader programs
+# : cold - compile and link the sources (the binaries are saved to an empty cache directory)
+#   warm - load the binaries saved by the cold run (glProgramBinary)
+#   usage: python shader_cache_benchmark.py --repeat 5
+#   (drivers with their own shader cache, e.g. Mesa, make the cold run faster than a real first start)
+import os, sys
+sys.path.append(os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+import glob
+import argparse
+import tempfile
+import statistics
+
+
+from OpenGL.GL import *
+
+import visualizer.shader as shader
+from bench_utils import *
+
+
+# every vertex/fragment shader pair of the chapters that links
+def get_shader_pairs(root):
+    shader.program_binary_dir = None
+
+    pair_list, key_list = [], []
+    for vtx_path in sorted(glob.glob(os.path.join(root, "**", "*.vs"), recursive=True)):
+        for frag_path in sorted(glob.glob(os.path.join(os.path.dirname(vtx_path), "*.fs"))):
+            try:
+                program = shader.Shader(vtx_path, frag_path)
+            except RuntimeError:
+                continue
+            # : pairs with the same sources as another chapter would be in-process cache hits
+            if program.key not in key_list:
+                key_list.append(program.key)
+                pair_list.append((vtx_path, frag_path))
+            program.release()
+    return pair_list
+
+def load_programs(pair_list):
+    shader_list = [shader.Shader(vtx_path, frag_path) for vtx_path, frag_path in pair_list]
+    for program in shader_list:
+        glGetProgramiv(program.id, GL_LINK_STATUS)  # : make sure the program is ready to use
+    return shader_list
+
+def release_programs(shader_list):
+    for program in shader_list:
+        program.release()
+
+def main(args):
+    window = create_hidden_window()
+    print_driver()
+    if not shader.program_binary_supported():
+        print("The driver does not support program binaries (GL_NUM_PROGRAM_BINARY_FORMATS == 0)")
+
+    root = os.path.dirname(os.path.abspath(os.path.dirname(__file__)))
+    pair_list = get_shader_pairs(root)
+    print("%d shader programs\n" % len(pair_list))
+
+    cold_list, warm_list = [], []
+    for _ in range(args.repeat):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            shader.program_binary_dir = cache_dir
+
+            # cold: nothing in the cache directory yet
+            elapsed, shader_list = measure_ms(lambda: load_programs(pair_list))
+            release_programs(shader_list)
+            cold_list.append(elapsed)
+
+            # warm: every program is loaded from its binary
+            elapsed, shader_list = measure_ms(lambda: load_programs(pair_list))
+            release_programs(shader_list)
+            warm_list.append(elapsed)
+
+    cold, warm = statistics.median(cold_list), statistics.median(warm_list)
+    print("%-6s %10s %14s" % ("", "total(ms)", "per program(ms)"))
+    print("%-6s %10.2f %14.3f" % ("cold", cold, cold / len(pair_list)))
+    print("%-6s %10.2f %14.3f" % ("warm", warm, warm / len(pair_list)))
+    print("speedup x%.1f  (median of %d runs)" % (cold / warm, args.repeat))
+    print(shader.program_cache_stats)
+
+    destroy_window(window)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shader program binary cache benchmark")
+    parser.add_argument('--repeat', type=int, default=5, help="number of cold/warm runs")
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+# model matrices of N instances rewritten every frame: upload paths of the per-frame data
+# : bufferData    - glBufferData() of the matrices every frame (new storage per frame)
+#   bufferSubData - glBufferSubData() over the buffer the previous frames draw from (the driver may stall or copy)
+#   orphan        - stream buffer, orphaned once per frame, the matrices built in its mapped range (GL 3.3)
+#   persistent    - stream buffer, mapped once, a ring of 3 frames guarded by fences (GL_ARB_buffer_storage)
+#   every frame builds the matrices (visualizer.transform) and draws the instances, glFinish() only after the
+#   last frame so the frames overlap as in the viewer
+#   usage: python stream_benchmark.py --counts 1000 100000 --frames 100
+import os, sys
+sys.path.append(os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+import ctypes
+import argparse
+import numpy as np
+import glm
+
+from OpenGL.GL import *
+
+from visualizer.shader         import Shader
+from visualizer.geometry       import index_type, upload_mesh
+from visualizer.primitives     import Primitive
+from visualizer.vertex_layout  import vertex_arrays
+from visualizer.gl_state       import gl_state
+from visualizer.uniform_buffer import camera_buffer
+from visualizer.instancing     import InstanceBuffer, InstanceStream, cube_model_matrices, spawn_cube_positions
+from visualizer.stream_buffer  import persistent_mapping_supported, reset_stream_stats
+from bench_utils import *
+
+
+def run_frames(upload, vao, indices, count, frames):
+    for frame in range(frames):
+        upload(frame)
+        gl_state.bind_vertex_array(vao)
+        glDrawElementsInstanced(GL_TRIANGLES, len(indices), index_type(indices), ctypes.c_void_p(0), count)
+
+def main(args):
+    window = create_hidden_window(*args.size)
+    fbo, renderbuffers = create_framebuffer(*args.size)
+    print_driver()
+
+    root   = os.path.dirname(os.path.abspath(os.path.dirname(__file__)))
+    path   = os.path.join(root, "01_getting_started", "07_camera")
+    shader = Shader(os.path.join(path, "07_vtx_shader.vs"), os.path.join(path, "07_frag_shader.fs"), {"INSTANCED": 1})
+    shader.use()
+    gl_state.invalidate()
+    camera_buffer.set_matrices(glm.perspective(glm.radians(45.0), args.size[0] / args.size[1], 0.1, 500.0),
+                               glm.lookAt(glm.vec3(0.0, 0.0, 150.0), glm.vec3(0.0), glm.vec3(0.0, 1.0, 0.0)))
+
+    vertices, indices, layout = Primitive.compact("box")
+    VBO, EBO = upload_mesh(vertices, indices)
+    vao = vertex_arrays.get(shader.id, layout, VBO, EBO)
+
+    methods = ["bufferData", "bufferSubData", "orphan"]
+    if persistent_mapping_supported():
+        methods.append("persistent")
+    else:
+        print("GL_ARB_buffer_storage is not supported: no persistent mapping")
+
+    print("\n%10s" % "instances" + "".join("%16s" % method for method in methods) + "   (ms per frame)")
+    for count in args.counts:
+        positions = spawn_cube_positions(count)
+        angles    = lambda frame: 20.0 * np.arange(count) + 5.0 * frame
+        model_mats = cube_model_matrices(positions, angles(0))
+
+        row = "%10d" % count
+        for method in methods:
+            if method in ("bufferData", "bufferSubData"):
+                instances = InstanceBuffer(vao, 2, model_mats, GL_STREAM_DRAW)
+                def upload(frame):
+                    cube_model_matrices(positions, angles(frame), out=model_mats)
+                    gl_state.bind_buffer(GL_ARRAY_BUFFER, instances.VBO)
+                    if method == "bufferData":
+                        glBufferData(GL_ARRAY_BUFFER, model_mats.nbytes, model_mats, GL_STREAM_DRAW)
+                    else:
+                        glBufferSubData(GL_ARRAY_BUFFER, 0, model_mats.nbytes, model_mats)
+            else:
+                instances = InstanceStream(vao, 2, count, persistent=(method == "persistent"))
+                def upload(frame):
+                    cube_model_matrices(positions, angles(frame), out=instances.map())
+                    instances.unmap()
+            gl_state.invalidate()
+
+            run_frames(upload, vao, indices, count, 3)     # : warm up
+            reset_stream_stats()
+            elapsed_ms, _ = measure_ms(lambda: run_frames(upload, vao, indices, count, args.frames))
+            waits = reset_stream_stats()["waits"]
+            row += "%16s" % ("%.2f" % (elapsed_ms / args.frames) + (" (%d waits)" % waits if waits else ""))
+            instances.delete()
+        print(row)
+
+    vertex_arrays.release_buffers(VBO, EBO)
+    glDeleteBuffers(2, [VBO, EBO])
+    camera_buffer.delete()
+    shader.release()
+    delete_framebuffer(fbo, renderbuffers)
+    destroy_window(window)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-frame instance data streaming benchmark")
+    parser.add_argument('--counts', type=int, nargs='+', default=[1000, 100000], help="instances (model matrices) per frame")
+    parser.add_argument('--frames', type=int, default=100, help="measured frames per configuration")
+    parser.add_argument('--size', type=int, nargs=2, default=[640, 480], help="framebuffer size")
+    args = parser.parse_args()
+
+    main(args)
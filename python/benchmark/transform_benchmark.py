@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# model matrices of N objects: glm loop (as in the chapters) vs vectorized NumPy (visualizer.transform)
+# : both produce the (N, 4, 4) float32 array uploaded as instance data
+#   usage: python transform_benchmark.py --counts 10 1000 100000 1000000
+import os, sys
+sys.path.append(os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+import time
+import argparse
+import numpy as np
+import glm
+
+from visualizer.transform import model_matrices, axis_angle_to_quat
+
+
+def build_glm(positions, axes, angles, scales):
+    model_mats = np.empty((len(positions), 4, 4), dtype=np.float32)
+    for i in range(len(positions)):
+        model_mat = glm.mat4(1.0)
+        model_mat = glm.translate(model_mat, glm.vec3(*positions[i]))
+        model_mat = glm.rotate(model_mat, float(angles[i]), glm.vec3(*axes[i]))
+        model_mat = glm.scale(model_mat, glm.vec3(*scales[i]))
+        model_mats[i] = np.array(model_mat).T     # : glm memory layout (column-major)
+    return model_mats
+
+def build_numpy(positions, axes, angles, scales, out=None):
+    return model_matrices(positions, axis_angle_to_quat(axes, angles), scales, out)
+
+def measure_ms(func, repeat):
+    elapsed_list = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed_list.append((time.perf_counter() - start) * 1000.0)
+    return min(elapsed_list), result
+
+def main(args):
+    rng = np.random.default_rng(0)
+
+    print("%10s %14s %14s %14s %10s" % ("N", "glm loop(ms)", "numpy(ms)", "numpy out(ms)", "speedup"))
+    for count in args.counts:
+        # the positions/axes are converted to python floats once, like the glm.vec3 lists of the chapters
+        positions = rng.uniform(-50, 50, (count, 3)).astype(np.float32)
+        axes      = rng.normal(size=(count, 3)).astype(np.float32)
+        angles    = rng.uniform(0, 2 * np.pi, count).astype(np.float32)
+        scales    = rng.uniform(0.5, 2.0, (count, 3)).astype(np.float32)
+
+        repeat = max(1, min(args.repeat, 100000 // count))   # : a single run of the 1M glm loop takes seconds
+
+        glm_ms, glm_mats = measure_ms(lambda: build_glm(positions.tolist(), axes.tolist(), angles.tolist(), scales.tolist()),
+                                      repeat)
+        numpy_ms, numpy_mats = measure_ms(lambda: build_numpy(positions, axes, angles, scales), args.repeat)
+
+        # reusing the output array (e.g. every frame) saves the allocation
+        out = np.empty((count, 4, 4), dtype=np.float32)
+        out_ms, _ = measure_ms(lambda: build_numpy(positions, axes, angles, scales, out), args.repeat)
+
+        if not np.allclose(glm_mats, numpy_mats, atol=1e-4):
+            print("mismatch between the glm and numpy matrices (N = %d)" % count)
+        print("%10d %14.3f %14.3f %14.3f %9.1fx" % (count, glm_ms, numpy_ms, out_ms, glm_ms / numpy_ms))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Model matrix builder benchmark")
+    parser.add_argument('--counts', type=int, nargs="+", default=[10, 1000, 100000, 1000000], help="numbers of objects")
+    parser.add_argument('--repeat', type=int, default=5, help="runs per count (best is reported)")
+    args = parser.parse_args()
+
+    main(args)
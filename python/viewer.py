@@ -1,6 +1,7 @@
-
 from abc import abstractmethod
 
+from visualizer.gl_state import gl_state
+
 
 class GLContent:
     def __init__(self, window, viewport, camera, file_path):
@@ -9,6 +10,37 @@ class GLContent:
         self.camera    = camera
         self.file_path = file_path
 
+        # state of the GPU resources (shaders, buffers, vertex arrays, textures) of the content
+        # - is_setup     : setup() already created the resources
+        # - need_rebuild : the inspector changed a setting the resources depend on (e.g. primitive)
+        self.is_setup     = False
+        self.need_rebuild = False
+
+    def prepare(self):
+        # called by the viewer every frame before render()
+        # : the resources are created only once, and re-created only when a rebuild is requested
+        if not self.is_setup:
+            self.setup()
+            self.is_setup = True
+            gl_state.invalidate()   # : the resources are created with the plain GL calls
+        elif self.need_rebuild:
+            self.rebuild()
+            gl_state.invalidate()
+        self.need_rebuild = False
+
+    def request_rebuild(self):
+        self.need_rebuild = True
+
+    def setup(self):
+        # create the GPU resources once (not in render())
+        pass
+
+    def rebuild(self):
+        # re-create the resources depending on the inspector setting
+        # (default: re-create everything)
+        self.destroy()
+        self.setup()
+
     @abstractmethod
     def inspector(self):
         pass
@@ -19,4 +51,5 @@ class GLContent:
 
     @abstractmethod
     def destroy(self):
+        # free every resource created in setup() / rebuild()
         pass
@@ -0,0 +1,105 @@
+from OpenGL.GL import *
+
+from visualizer.gl_state import gl_state
+
+#################################################################
+# Deferred shading                                              #
+# - geometry pass: the objects write their surface (position,   #
+#   normal, albedo, specular) to the G-buffer textures          #
+# - lighting pass: one full-screen triangle shades every pixel  #
+#   once from the G-buffer, whatever the overdraw               #
+# - the depth is copied to the target framebuffer after it, so  #
+#   objects drawn forward afterwards are still occluded         #
+#################################################################
+
+GBUFFER_TEXTURE_UNIT = 5    # : 0 - 4 are the material maps, the light texels and the clusters
+# sampler name -> internal format of each color attachment
+# : world positions need float precision, the colors only 8 bits
+GBUFFER_TARGETS = [("gPosition", GL_RGBA32F),   # xyz, w = 1 where a surface was drawn
+                   ("gNormal",   GL_RGBA16F),
+                   ("gAlbedo",   GL_RGBA8),
+                   ("gSpecular", GL_RGBA8)]
+
+class GBuffer:
+    def __init__(self):
+        # the textures are created at the size of the viewport by the first begin()
+        self.FBO      = glGenFramebuffers(1)
+        self.VAO      = glGenVertexArrays(1)   # : the full-screen triangle has no vertex attributes (gl_VertexID)
+        self.textures = []                     # : color attachments
+        self.RBO      = None                   # : depth
+        self.size     = (0, 0)
+        self.target   = 0                      # : framebuffer and viewport the lighting pass draws to
+        self.viewport = (0, 0, 0, 0)
+
+    def resize(self, width, height):
+        if self.textures:
+            glDeleteTextures(len(self.textures), self.textures)
+            glDeleteRenderbuffers(1, [self.RBO])
+            gl_state.forget(*self.textures)
+        self.textures = list(glGenTextures(len(GBUFFER_TARGETS)))
+        self.RBO      = glGenRenderbuffers(1)
+        self.size     = (width, height)
+
+        glBindFramebuffer(GL_FRAMEBUFFER, self.FBO)
+        for i, (_, internal_format) in enumerate(GBUFFER_TARGETS):
+            # (on the unit the lighting pass samples it from)
+            gl_state.bind_texture(GBUFFER_TEXTURE_UNIT + i, GL_TEXTURE_2D, self.textures[i])
+            glTexImage2D(GL_TEXTURE_2D, 0, internal_format, width, height, 0, GL_RGBA, GL_FLOAT, None)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+            glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0 + i, GL_TEXTURE_2D, self.textures[i], 0)
+        glDrawBuffers(len(GBUFFER_TARGETS), [GL_COLOR_ATTACHMENT0 + i for i in range(len(GBUFFER_TARGETS))])
+
+        # depth (and stencil, the format of the usual default framebuffer, so it can be blitted)
+        # : the lighting pass does not read it, the view depth of a pixel comes from its position
+        glBindRenderbuffer(GL_RENDERBUFFER, self.RBO)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH24_STENCIL8, width, height)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_STENCIL_ATTACHMENT, GL_RENDERBUFFER, self.RBO)
+        glBindRenderbuffer(GL_RENDERBUFFER, 0)
+
+        if glCheckFramebufferStatus(GL_FRAMEBUFFER) != GL_FRAMEBUFFER_COMPLETE:
+            raise RuntimeError("ERROR::FRAMEBUFFER:: G-buffer is not complete")
+        glBindFramebuffer(GL_FRAMEBUFFER, self.target)
+
+    def begin(self):
+        # geometry pass: the following draws go to the cleared G-buffer (of the size of the current viewport)
+        self.target   = glGetIntegerv(GL_DRAW_FRAMEBUFFER_BINDING)
+        self.viewport = tuple(int(v) for v in glGetIntegerv(GL_VIEWPORT))
+        if self.size != self.viewport[2:]:
+            self.resize(*self.viewport[2:])
+
+        glBindFramebuffer(GL_FRAMEBUFFER, self.FBO)
+        gl_state.viewport(0, 0, *self.size)
+        glClearColor(0.0, 0.0, 0.0, 0.0)   # : position w = 0, no surface (the lighting pass keeps the target's color)
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+
+    def resolve(self, shader):
+        # lighting pass: one full-screen triangle on the target with the shader (in use, its lights set)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.target)
+        gl_state.viewport(*self.viewport)
+
+        shader.set_vec2("gBufferOrigin", float(self.viewport[0]), float(self.viewport[1]))
+        for i, (name, _) in enumerate(GBUFFER_TARGETS):
+            shader.set_int(name, GBUFFER_TEXTURE_UNIT + i)
+            gl_state.bind_texture(GBUFFER_TEXTURE_UNIT + i, GL_TEXTURE_2D, self.textures[i])
+
+        depth_test = gl_state.is_enabled(GL_DEPTH_TEST)
+        gl_state.disable(GL_DEPTH_TEST)
+        gl_state.bind_vertex_array(self.VAO)
+        glDrawArrays(GL_TRIANGLES, 0, 3)
+        gl_state.enable(GL_DEPTH_TEST, depth_test)
+
+        # depth of the G-buffer surfaces for the forward draws that follow
+        x, y, width, height = self.viewport
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, self.FBO)
+        glBlitFramebuffer(0, 0, width, height, x, y, x + width, y + height, GL_DEPTH_BUFFER_BIT, GL_NEAREST)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.target)
+
+    def delete(self):
+        if self.textures:
+            glDeleteTextures(len(self.textures), self.textures)
+            glDeleteRenderbuffers(1, [self.RBO])
+        glDeleteVertexArrays(1, [self.VAO])
+        glDeleteFramebuffers(1, [self.FBO])
+        gl_state.forget(self.VAO, *self.textures)
+        self.textures, self.RBO, self.size = [], None, (0, 0)
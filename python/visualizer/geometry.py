@@ -0,0 +1,61 @@
+import numpy as np
+
+from OpenGL.GL import *
+
+#################################################################
+# Indexed geometry                                              #
+# - a mesh is its unique vertices and an index buffer (uint16   #
+#   up to 65536 vertices, uint32 above)                         #
+# - weld() builds one from expanded vertices (the 3 corners of  #
+#   every triangle) by attribute equality                       #
+# - the shared meshes are built once and handed out as          #
+#   read-only arrays                                            #
+#################################################################
+
+# name -> (vertices, indices) of the shared meshes
+mesh_cache = {}
+
+def shared_mesh(name, build):
+    # the mesh 'build()' returns, built on the first request only
+    if name not in mesh_cache:
+        vertices, indices = build()
+        vertices.flags.writeable = False
+        indices.flags.writeable  = False
+        mesh_cache[name] = (vertices, indices)
+    return mesh_cache[name]
+
+def index_dtype(vertex_count):
+    # the smallest index type of the mesh (no uint8: slow on most GPUs)
+    return np.uint16 if vertex_count <= 1 << 16 else np.uint32
+
+def index_type(indices):
+    # GL type of an index array, for glDrawElements()
+    return GL_UNSIGNED_SHORT if indices.dtype == np.uint16 else GL_UNSIGNED_INT
+
+def weld(vertices, stride):
+    # (unique vertices, indices) of expanded float vertices with 'stride' floats each
+    # : two vertices are the same when all their attributes are equal (-0.0 and 0.0 too)
+    #   the unique vertices keep the order of their first use, so the indices of neighbouring
+    #   triangles stay close (post-transform cache)
+    rows = np.ascontiguousarray(vertices, dtype=np.float32).reshape(-1, stride) + np.float32(0.0)
+    keys = rows.view(np.dtype((np.void, rows.dtype.itemsize * stride))).ravel()
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+
+    order = np.argsort(first)           # : unique vertices in the order of their first use
+    rank  = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+
+    indices = rank[inverse.ravel()].astype(index_dtype(len(order)))
+    return rows[first[order]].ravel(), indices
+
+def upload_mesh(vertices, indices, usage=GL_STATIC_DRAW):
+    # (VBO, EBO) holding the mesh
+    # : both are filled through GL_ARRAY_BUFFER (a buffer has no type, and binding an element buffer needs a VAO),
+    #   the EBO is bound to the VAOs by vertex_arrays.get()
+    VBO, EBO = (int(buffer) for buffer in glGenBuffers(2))
+    glBindBuffer(GL_ARRAY_BUFFER, VBO)
+    glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, usage)
+    glBindBuffer(GL_ARRAY_BUFFER, EBO)
+    glBufferData(GL_ARRAY_BUFFER, indices.nbytes, indices, usage)
+    glBindBuffer(GL_ARRAY_BUFFER, 0)
+    return VBO, EBO
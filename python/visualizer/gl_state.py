@@ -0,0 +1,131 @@
+from OpenGL.GL import *
+
+#################################################################
+# GL state cache                                                #
+# - remembers the program, VAO, buffer and texture bindings,    #
+#   the viewport / scissor box, the polygon mode and the        #
+#   capabilities set through it, and drops the calls that would #
+#   not change them (each PyOpenGL call costs microseconds)     #
+# - state changed by plain GL calls (resource creation, texture #
+#   uploads, imgui) is unknown to it: invalidate() after them   #
+#################################################################
+
+# calls since the last reset_state_stats() (once per frame)
+state_stats = {"calls": 0, "skipped": 0}
+
+def reset_state_stats():
+    # returns the counts of the frame and starts counting the next one
+    stats = dict(state_stats)
+    state_stats["calls"], state_stats["skipped"] = 0, 0
+    return stats
+
+
+def context_supports(version, extension):
+    # the context is at least version (major, minor) or has the extension (a 3.3 context may have 4.x extensions)
+    if (glGetIntegerv(GL_MAJOR_VERSION), glGetIntegerv(GL_MINOR_VERSION)) >= version:
+        return True
+    return any(glGetStringi(GL_EXTENSIONS, i) == extension.encode() for i in range(glGetIntegerv(GL_NUM_EXTENSIONS)))
+
+
+class GLState:
+    def __init__(self):
+        self.invalidate()
+
+    def invalidate(self):
+        # forget everything: the next call of each state is issued
+        self.program      = None
+        self.vao          = None
+        self.buffers      = {}      # : target -> buffer
+        self.active_unit  = None
+        self.textures     = {}      # : (unit, target) -> texture
+        self.viewport_box = None
+        self.scissor_box  = None
+        self.polygon      = None
+        self.capabilities = {}      # : capability -> enabled
+
+    def forget(self, *names):
+        # the objects are deleted: a new object may get the same name, and deleting a bound object unbinds it
+        names = set(int(name) for name in names)
+        if self.program in names:
+            self.program = None
+        if self.vao in names:
+            self.vao = None
+        self.buffers  = {target: buffer for target, buffer in self.buffers.items() if buffer not in names}
+        self.textures = {key: texture for key, texture in self.textures.items() if texture not in names}
+
+    def changed(self, current, value):
+        # counts the call, True when it has to be issued
+        if current == value:
+            state_stats["skipped"] += 1
+            return False
+        state_stats["calls"] += 1
+        return True
+
+    def use_program(self, program):
+        if self.changed(self.program, program):
+            glUseProgram(program)
+            self.program = program
+
+    def bind_vertex_array(self, vao):
+        if self.changed(self.vao, vao):
+            glBindVertexArray(vao)
+            self.vao = vao
+
+    def bind_buffer(self, target, buffer):
+        # (not GL_ELEMENT_ARRAY_BUFFER: its binding belongs to the bound VAO)
+        if self.changed(self.buffers.get(target), buffer):
+            glBindBuffer(target, buffer)
+            self.buffers[target] = buffer
+
+    def bind_buffer_base(self, target, index, buffer):
+        # indexed binding (always issued), it binds the generic target too
+        glBindBufferBase(target, index, buffer)
+        self.buffers[target] = buffer
+
+    def bind_texture(self, unit, target, texture):
+        # texture on a texture unit (the active unit changes only when the binding does)
+        if self.changed(self.textures.get((unit, target)), texture):
+            if self.active_unit != unit:
+                glActiveTexture(GL_TEXTURE0 + unit)
+                self.active_unit = unit
+            glBindTexture(target, texture)
+            self.textures[(unit, target)] = texture
+
+    def viewport(self, x, y, width, height):
+        box = (int(x), int(y), int(width), int(height))
+        if self.changed(self.viewport_box, box):
+            glViewport(*box)
+            self.viewport_box = box
+
+    def scissor(self, x, y, width, height):
+        box = (int(x), int(y), int(width), int(height))
+        if self.changed(self.scissor_box, box):
+            glScissor(*box)
+            self.scissor_box = box
+
+    def polygon_mode(self, mode):
+        # GL_FRONT_AND_BACK (the only face of the core profile)
+        if self.changed(self.polygon, mode):
+            glPolygonMode(GL_FRONT_AND_BACK, mode)
+            self.polygon = mode
+
+    def enable(self, capability, enabled=True):
+        if self.changed(self.capabilities.get(capability), enabled):
+            if enabled:
+                glEnable(capability)
+            else:
+                glDisable(capability)
+            self.capabilities[capability] = enabled
+
+    def disable(self, capability):
+        self.enable(capability, False)
+
+    def is_enabled(self, capability):
+        # asks OpenGL only when the capability is unknown
+        if capability not in self.capabilities:
+            self.capabilities[capability] = bool(glIsEnabled(capability))
+        return self.capabilities[capability]
+
+
+# state of the viewer's context, shared by the chapters and the visualizer modules
+gl_state = GLState()
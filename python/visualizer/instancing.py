@@ -0,0 +1,104 @@
+import ctypes
+import numpy as np
+
+from OpenGL.GL import *
+
+from visualizer.transform     import model_matrices, axis_angle_to_quat
+from visualizer.gl_state      import gl_state
+from visualizer.stream_buffer import StreamBuffer
+
+#################################################################
+# Instanced rendering                                           #
+# - the model matrices of all instances are packed in a VBO,    #
+#   read as a mat4 attribute (4 x vec4) with divisor 1          #
+# - InstanceStream: matrices rewritten every frame go to a      #
+#   stream buffer, built in place in this frame's range         #
+#################################################################
+
+def point_model_matrices(location, offset=0):
+    # the mat4 attribute at location reads the bound GL_ARRAY_BUFFER from offset, one matrix per instance
+    # : a mat4 attribute takes 4 locations, one per column
+    for i in range(4):
+        glVertexAttribPointer(location + i, 4, GL_FLOAT, GL_FALSE, 16 * sizeof(GLfloat), ctypes.c_void_p(offset + 4 * i * sizeof(GLfloat)))
+        glEnableVertexAttribArray(location + i)
+        glVertexAttribDivisor(location + i, 1)     # : next matrix per instance, not per vertex
+
+def disable_model_matrices(vao, location):
+    # (before the VAO is deleted) the VAO can be drawn without instances again
+    glBindVertexArray(vao)
+    for i in range(4):
+        glDisableVertexAttribArray(location + i)
+    glBindVertexArray(0)
+    gl_state.invalidate()
+
+class InstanceBuffer:
+    def __init__(self, vao, location, model_mats, usage=GL_STATIC_DRAW):
+        # model_mats: (N, 4, 4) float32 in glm (column-major) layout
+        self.vao      = vao
+        self.location = location
+        self.count    = len(model_mats)
+        self.VBO      = glGenBuffers(1)
+
+        glBindVertexArray(vao)
+        glBindBuffer(GL_ARRAY_BUFFER, self.VBO)
+        glBufferData(GL_ARRAY_BUFFER, model_mats.nbytes, model_mats, usage)
+        point_model_matrices(location)
+        glBindVertexArray(0)
+
+    def update(self, model_mats):
+        glBindBuffer(GL_ARRAY_BUFFER, self.VBO)
+        if len(model_mats) == self.count:
+            glBufferSubData(GL_ARRAY_BUFFER, 0, model_mats.nbytes, model_mats)
+        else:
+            glBufferData(GL_ARRAY_BUFFER, model_mats.nbytes, model_mats, GL_DYNAMIC_DRAW)
+            self.count = len(model_mats)
+
+    def delete(self):
+        if self.VBO is not None:
+            disable_model_matrices(self.vao, self.location)
+            glDeleteBuffers(1, [self.VBO])
+            self.VBO = None
+
+
+class InstanceStream:
+    # model matrices of count instances rewritten every frame (e.g. moving instances):
+    #   model_mats = instances.map()     # : (count, 4, 4) float32 view of this frame's range
+    #   ... fill model_mats (e.g. model_matrices(..., out=model_mats)) ...
+    #   instances.unmap()                # : the attribute reads this frame's range
+    def __init__(self, vao, location, count, frames=3, persistent=None):
+        # frames: frames of matrices in the ring (the GPU may be drawing the previous ones)
+        self.vao      = vao
+        self.location = location
+        self.count    = count
+        self.stream   = StreamBuffer(max(frames * count * 64, 64), persistent=persistent)
+
+    def map(self):
+        self.stream.next_frame()
+        return self.stream.map(self.count * 64).view(np.float32).reshape(self.count, 4, 4)
+
+    def unmap(self):
+        offset = self.stream.unmap()
+        gl_state.bind_vertex_array(self.vao)
+        gl_state.bind_buffer(GL_ARRAY_BUFFER, self.stream.buffer)
+        point_model_matrices(self.location, offset)
+
+    def delete(self):
+        if self.stream is not None:
+            disable_model_matrices(self.vao, self.location)
+            self.stream.delete()
+            self.stream = None
+
+
+def cube_model_matrices(positions, angles, axis=(1.0, 0.3, 0.5), out=None):
+    # translate(position) * rotate(angle, axis) of every cube, as in the cube_positions loops
+    # positions: (N, 3), angles: (N,) in degrees -> (N, 4, 4) float32 (column-major, like glm), in out if given
+    return model_matrices(positions, axis_angle_to_quat(axis, np.radians(angles)), out=out)
+
+def cube_field_size(count, spacing=2.0):
+    # side of the box spawn_cube_positions() fills
+    return spacing * np.cbrt(count)
+
+def spawn_cube_positions(count, spacing=2.0, seed=0):
+    # random positions in a box around the origin, about 'spacing' apart
+    side = cube_field_size(count, spacing)
+    return np.random.default_rng(seed).uniform(-side / 2, side / 2, (count, 3)).astype(np.float32)
@@ -0,0 +1,299 @@
+import numpy as np
+
+from OpenGL.GL import *
+
+from visualizer.gl_state       import gl_state
+from visualizer.uniform_buffer import LIGHT_DTYPE, StructBuffer
+
+#################################################################
+# Many lights                                                   #
+# - the point and spot lights are one LIGHT_DTYPE array         #
+#   (std140, 5 vec4 per light) stored in one of the backends:   #
+#   0 uniform array  : vec4 lightVectors[], one glUniform4fv    #
+#   1 uniform buffer : LightArrayBlock { Light lights[]; }      #
+#   2 texture buffer : samplerBuffer lightTexels (RGBA32F)      #
+# - the shader is compiled for the backend (LIGHT_BACKEND) and  #
+#   its capacity (MAX_LIGHTS)                                   #
+# - light culling: each draw only loops over the lights whose   #
+#   sphere / cone (radius from the attenuation) reaches the     #
+#   bounding sphere of what it draws (LIGHT_CULLING)            #
+# - clustered: the lights are binned into the clusters (screen  #
+#   tile x depth slice) of the view frustum every frame, each   #
+#   fragment loops over its cluster's lights (LIGHT_CLUSTERS)   #
+#################################################################
+
+LIGHT_BACKENDS       = ["Uniform array", "Uniform buffer", "Texture buffer"]
+LIGHT_CULLING_MODES  = ["None", "Per draw", "Clustered"]
+VEC4S_PER_LIGHT      = LIGHT_DTYPE.itemsize // 16
+LIGHT_TEXTURE_UNIT   = 2        # : units 0 and 1 are the material maps
+CLUSTER_TEXTURE_UNIT = 3        # : and 4, the ranges and the light indices of the clusters
+CLUSTER_GRID         = (16, 9, 24)     # : tiles across, tiles up, depth slices
+
+def max_lights(backend, culling=0):
+    # the most lights the backend can hold on this driver
+    # : the other uniforms of the fragment shader need a few vectors too
+    #   and with culling per draw, the light indices of a draw take a quarter of a vector per light (ivec4 lightIndices[])
+    culled  = culling == 1
+    vectors = glGetIntegerv(GL_MAX_FRAGMENT_UNIFORM_VECTORS) - 16
+    if backend == 0:
+        return vectors * 4 // (VEC4S_PER_LIGHT * 4 + (1 if culled else 0))
+
+    if backend == 1:
+        count = glGetIntegerv(GL_MAX_UNIFORM_BLOCK_SIZE) // LIGHT_DTYPE.itemsize
+    else:
+        count = glGetIntegerv(GL_MAX_TEXTURE_BUFFER_SIZE) // VEC4S_PER_LIGHT
+    return min(count, vectors * 4) if culled else count
+
+
+class LightStorage:
+    def __init__(self, backend, capacity, culling=0):
+        # culling: index of LIGHT_CULLING_MODES
+        self.backend  = backend
+        self.capacity = capacity
+        self.culling  = culling
+        self.block    = None    # : backend 1
+        self.TBO, self.texture = None, None    # : backend 2
+        self.clusters = LightClusters() if culling == 2 else None
+
+        if backend == 1:
+            self.block = StructBuffer("LightArrayBlock", LIGHT_DTYPE, capacity)
+        elif backend == 2:
+            self.TBO = glGenBuffers(1)
+            glBindBuffer(GL_TEXTURE_BUFFER, self.TBO)
+            glBufferData(GL_TEXTURE_BUFFER, capacity * LIGHT_DTYPE.itemsize, None, GL_DYNAMIC_DRAW)
+            glBindBuffer(GL_TEXTURE_BUFFER, 0)
+
+            # every texel is one vec4 of a light
+            self.texture = glGenTextures(1)
+            glBindTexture(GL_TEXTURE_BUFFER, self.texture)
+            glTexBuffer(GL_TEXTURE_BUFFER, GL_RGBA32F, self.TBO)
+            glBindTexture(GL_TEXTURE_BUFFER, 0)
+
+    def defines(self):
+        defines = {"LIGHT_BACKEND": self.backend, "MAX_LIGHTS": self.capacity}
+        if self.culling == 1:
+            defines["LIGHT_CULLING"] = 1
+        elif self.culling == 2:
+            defines.update(self.clusters.defines())
+        return defines
+
+    def upload(self, shader, lights):
+        # lights: LIGHT_DTYPE array (at most 'capacity' lights), the shader is in use
+        # : without culling every draw uses all of them, with culling draw_light_uniforms() selects them per draw
+        #   and clustered, LightClusters.update() per fragment
+        if len(lights) > self.capacity:
+            raise TypeError("%d lights for a capacity of %d" % (len(lights), self.capacity))
+
+        shader.set_int("lightCount", len(lights))
+        if self.backend == 0:
+            shader.set_vec4_array("lightVectors", lights.view(np.float32))
+        elif self.backend == 1:
+            self.block.update(lights.tobytes())
+        else:
+            gl_state.bind_buffer(GL_TEXTURE_BUFFER, self.TBO)
+            glBufferSubData(GL_TEXTURE_BUFFER, 0, lights.nbytes, lights)
+
+            shader.set_int("lightTexels", LIGHT_TEXTURE_UNIT)
+            gl_state.bind_texture(LIGHT_TEXTURE_UNIT, GL_TEXTURE_BUFFER, self.texture)
+
+    def draw_light_uniforms(self, indices):
+        # indices of the lights the next draw loops over (culling only)
+        # : as uniforms of a render queue item, ((shader setter name, uniform name, value), ...)
+        uniforms = [("set_int", "lightCount", len(indices))]
+        if len(indices):
+            packed = np.zeros((len(indices) + 3) // 4 * 4, dtype=np.int32)
+            packed[:len(indices)] = indices
+            uniforms.append(("set_ivec4_array", "lightIndices", packed))
+        return uniforms
+
+    def delete(self):
+        if self.clusters is not None:
+            self.clusters.delete()
+            self.clusters = None
+        if self.block is not None:
+            self.block.delete()
+            self.block = None
+        if self.TBO is not None:
+            glDeleteTextures(1, [self.texture])
+            glDeleteBuffers(1, [self.TBO])
+            gl_state.forget(self.texture, self.TBO)
+            self.TBO, self.texture = None, None
+
+
+def depth_range(proj_mat):
+    # (near, far) of a glm.perspective() matrix
+    return float(proj_mat[3][2] / (proj_mat[2][2] - 1.0)), float(proj_mat[3][2] / (proj_mat[2][2] + 1.0))
+
+
+class LightClusters:
+    # per-cluster light index lists, rebuilt every frame on the CPU (NumPy) and read by the fragment shader
+    # from two texture buffers: (first index, light count) of every cluster, and the light indices of all of them
+    # : the clusters are CLUSTER_GRID screen tiles x depth slices, exponential in depth (thin near the camera)
+    def __init__(self, grid=CLUSTER_GRID):
+        self.grid       = grid
+        self.count      = int(np.prod(grid))
+        self.capacity   = 4096      # : light indices the index buffer holds, grows when a frame needs more
+        self.item_count = 0         # : light indices of the last frame (the sum over all the clusters)
+        self.mean_count = 0.0       # : lights per non-empty cluster of the last frame
+
+        self.buffers  = glGenBuffers(2)
+        self.textures = glGenTextures(2)
+        for buffer, texture, size, internal_format in zip(self.buffers, self.textures,
+                                                          [self.count * 8, self.capacity * 4], [GL_RG32I, GL_R32I]):
+            glBindBuffer(GL_TEXTURE_BUFFER, buffer)
+            glBufferData(GL_TEXTURE_BUFFER, size, None, GL_STREAM_DRAW)
+            glBindTexture(GL_TEXTURE_BUFFER, texture)
+            glTexBuffer(GL_TEXTURE_BUFFER, internal_format, buffer)
+        glBindTexture(GL_TEXTURE_BUFFER, 0)
+        glBindBuffer(GL_TEXTURE_BUFFER, 0)
+
+    def defines(self):
+        return {"LIGHT_CLUSTERS": 1, "CLUSTER_GRID": "ivec3(%d, %d, %d)" % self.grid}
+
+    def bin_lights(self, lights, radii, proj_mat, view_mat):
+        # (ranges, indices): (first index, light count) of every cluster (int32 (count, 2)), light indices (int32)
+        # : every light covers the clusters of the screen rectangle and depth range of its sphere
+        #   (the projection of its view space bounding box, the whole screen when the sphere crosses the near plane)
+        gx, gy, gz = self.grid
+        proj = np.frombuffer(proj_mat.to_bytes(), dtype=np.float32).reshape(4, 4)   # : proj[column][row]
+        view = np.frombuffer(view_mat.to_bytes(), dtype=np.float32).reshape(4, 4)
+        near, far = depth_range(proj_mat)
+
+        position = lights["position"] @ view[:3, :3] + view[3, :3]
+        depth    = -position[:, 2]
+        d_min, d_max = depth - radii, depth + radii
+        slice_scale  = gz / np.log(far / near)
+        z0 = np.floor(np.log(np.maximum(d_min, near) / near) * slice_scale).astype(np.int64)
+        z1 = np.floor(np.log(np.clip(d_max, near, far) / near) * slice_scale).astype(np.int64)
+
+        # screen rectangle in NDC: x / depth is extreme at the corners of the box
+        front   = d_min > near
+        d_front = np.where(front, d_min, 1.0)
+        ndc_min, ndc_max = [], []
+        for axis in range(2):
+            scale = proj[axis][axis]
+            low, high = position[:, axis] - radii, position[:, axis] + radii
+            ndc_min.append(np.where(front, scale * np.minimum(low / d_front, low / d_max), -1.0))
+            ndc_max.append(np.where(front, scale * np.maximum(high / d_front, high / d_max), 1.0))
+        x0, x1, y0, y1 = [np.floor((np.clip(ndc, -1.0, 1.0) + 1.0) * 0.5 * tiles).astype(np.int64)
+                          for ndc, tiles in ((ndc_min[0], gx), (ndc_max[0], gx), (ndc_min[1], gy), (ndc_max[1], gy))]
+        x0, x1, y0, y1 = np.minimum(x0, gx - 1), np.minimum(x1, gx - 1), np.minimum(y0, gy - 1), np.minimum(y1, gy - 1)
+        z0, z1 = np.clip(z0, 0, gz - 1), np.clip(z1, 0, gz - 1)
+
+        visible = (d_max > near) & (d_min < far) & (ndc_max[0] >= -1.0) & (ndc_min[0] <= 1.0) \
+                                                 & (ndc_max[1] >= -1.0) & (ndc_min[1] <= 1.0)
+        nx, ny, nz = x1 - x0 + 1, y1 - y0 + 1, z1 - z0 + 1
+        sizes      = np.where(visible, nx * ny * nz, 0)
+
+        # one (cluster, light) item per cluster of every light, then sorted by cluster (the lights stay in order)
+        light = np.repeat(np.arange(len(lights)), sizes)
+        local = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        ix = x0[light] + local % nx[light]
+        iy = y0[light] + local // nx[light] % ny[light]
+        iz = z0[light] + local // (nx[light] * ny[light])
+        cluster = (iz * gy + iy) * gx + ix
+        order   = np.argsort(cluster, kind="stable")
+
+        counts = np.bincount(cluster, minlength=self.count)
+        ranges = np.stack([np.cumsum(counts) - counts, counts], axis=1).astype(np.int32)
+        return ranges, light[order].astype(np.int32)
+
+    def update(self, shader, lights, radii, proj_mat, view_mat):
+        # bin the lights (in the storage order) for this frame's camera, the shader is in use
+        ranges, indices = self.bin_lights(lights, radii, proj_mat, view_mat)
+        self.item_count = len(indices)
+        self.mean_count = self.item_count / max(np.count_nonzero(ranges[:, 1]), 1)
+
+        gl_state.bind_buffer(GL_TEXTURE_BUFFER, self.buffers[0])
+        glBufferSubData(GL_TEXTURE_BUFFER, 0, ranges.nbytes, ranges)
+        gl_state.bind_buffer(GL_TEXTURE_BUFFER, self.buffers[1])
+        if len(indices) > self.capacity:
+            self.capacity = 1 << (len(indices) - 1).bit_length()
+            glBufferData(GL_TEXTURE_BUFFER, self.capacity * 4, None, GL_STREAM_DRAW)
+        if len(indices):
+            glBufferSubData(GL_TEXTURE_BUFFER, 0, indices.nbytes, indices)
+
+        # the cluster of gl_FragCoord: the viewport and the depth range of the projection
+        shader.set_vec4("clusterViewport", *[float(v) for v in glGetIntegerv(GL_VIEWPORT)])
+        shader.set_vec2("clusterDepth", *depth_range(proj_mat))
+        for i, name in enumerate(["clusterRanges", "clusterLights"]):
+            shader.set_int(name, CLUSTER_TEXTURE_UNIT + i)
+            gl_state.bind_texture(CLUSTER_TEXTURE_UNIT + i, GL_TEXTURE_BUFFER, self.textures[i])
+
+    def delete(self):
+        glDeleteTextures(2, self.textures)
+        glDeleteBuffers(2, self.buffers)
+        gl_state.forget(*self.textures, *self.buffers)
+
+
+def spawn_lights(count, center, extent, attenuation=(1.0, 0.7, 1.8), spot_every=4, seed=0):
+    # 'count' colored point lights in the box center +- extent, every 'spot_every'-th one a spot light looking down
+    # : a point light is a spot light with a cone wider than the sphere (cutOff -1, outerCutOff -2 -> intensity 1)
+    rng    = np.random.default_rng(seed)
+    lights = np.zeros(count, dtype=LIGHT_DTYPE)
+
+    lights["position"]  = rng.uniform(-1.0, 1.0, (count, 3)) * extent + center
+    lights["direction"] = (0.0, -1.0, 0.0)
+    colors = rng.uniform(0.2, 1.0, (count, 3))
+    lights["ambient"]   = 0.0
+    lights["diffuse"]   = colors
+    lights["specular"]  = colors
+
+    # (constant, linear, quadratic), the default reaches about 10 - 17 units (light_radii)
+    lights["constant"], lights["linear"], lights["quadratic"] = attenuation
+
+    lights["cutOff"]      = -1.0
+    lights["outerCutOff"] = -2.0
+    lights["cutOff"][::spot_every]      = np.cos(np.radians(20.0))
+    lights["outerCutOff"][::spot_every] = np.cos(np.radians(30.0))
+    return lights
+
+def orbit_positions(positions, center, angle):
+    # positions rotated by 'angle' (radians) around the vertical axis through center
+    c, s = np.cos(angle), np.sin(angle)
+    offset  = positions - center
+    rotated = np.empty_like(positions)
+    rotated[:, 0] = c * offset[:, 0] + s * offset[:, 2]
+    rotated[:, 1] = offset[:, 1]
+    rotated[:, 2] = c * offset[:, 2] - s * offset[:, 0]
+    return rotated + center
+
+def light_radii(lights, threshold=1.0 / 256.0):
+    # distance where the attenuated light falls under 'threshold' (of its brightest color channel)
+    # : solves constant + linear * d + quadratic * d^2 = brightness / threshold for d
+    #   (the ambient, diffuse and specular terms can add up on one fragment)
+    #   the default is one step of an 8 bit color: the lights left out of a draw add up to a few steps at most
+    brightness = (lights["ambient"] + lights["diffuse"] + lights["specular"]).max(axis=1)
+    c = lights["constant"] - brightness / threshold
+    l = lights["linear"]
+    q = lights["quadratic"]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        radii = np.where(q > 0.0, (-l + np.sqrt(np.maximum(l * l - 4.0 * q * c, 0.0))) / (2.0 * q),
+                         np.where(l > 0.0, -c / l, np.inf))
+    return np.maximum(radii, 0.0)
+
+def cull_lights(lights, radii, centers, object_radii):
+    # (objects, lights) mask: True where the light can reach the bounding sphere of the object
+    # centers: (N, 3), object_radii: (N,)
+    # : every light is a sphere of its radius, spot lights (cone narrower than a half space) also a cone
+    #   (sphere-cone test: https://bartwronski.com/2017/04/13/cull-that-cone/)
+    centers      = np.asarray(centers, dtype=np.float32).reshape(-1, 3)
+    object_radii = np.broadcast_to(np.asarray(object_radii, dtype=np.float32), (len(centers),))[:, None]
+
+    to_object = centers[:, None, :] - lights["position"][None, :, :]     # : (objects, lights, 3)
+    dist_sq   = np.einsum("olk,olk->ol", to_object, to_object)
+    mask      = dist_sq <= (radii[None, :] + object_radii) ** 2
+
+    spot = lights["outerCutOff"] > 0.0
+    if spot.any():
+        direction = lights["direction"][spot]
+        direction = direction / np.linalg.norm(direction, axis=1, keepdims=True)
+        cos_angle = lights["outerCutOff"][spot]
+        sin_angle = np.sqrt(1.0 - cos_angle * cos_angle)
+
+        along   = np.einsum("olk,lk->ol", to_object[:, spot], direction)
+        across  = np.sqrt(np.maximum(dist_sq[:, spot] - along * along, 0.0))
+        outside = (cos_angle * across - along * sin_angle > object_radii) | (along < -object_radii)
+        mask[:, spot] &= ~outside
+    return mask
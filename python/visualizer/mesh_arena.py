@@ -0,0 +1,258 @@
+import ctypes
+import numpy as np
+
+from OpenGL.GL import *
+
+from visualizer.geometry      import index_type
+from visualizer.gl_state      import gl_state
+from visualizer.vertex_layout import vertex_arrays
+
+#################################################################
+# Mesh arenas                                                   #
+# - the meshes of a vertex layout (and index type) share one    #
+#   VBO and one EBO: a mesh is a range of vertices (its base    #
+#   vertex) and a range of indices, its own indices unchanged   #
+# - one VAO per program serves every mesh of the arena, the     #
+#   draws select the mesh with glDrawElementsBaseVertex()       #
+# - the buffers grow and compact in place (copied through a     #
+#   temporary buffer): their names, the VAOs and the mesh       #
+#   handles stay valid                                          #
+#################################################################
+
+class RangeAllocator:
+    # first-fit ranges of [0, capacity) (in elements), the free ranges merged with their neighbours
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.free     = [(0, capacity)]     # : (offset, size) sorted by offset
+        self.used     = {}                  # : offset -> size
+
+    def allocate(self, size):
+        # offset of a free range of size elements, None when none is large enough
+        for i, (offset, free_size) in enumerate(self.free):
+            if free_size >= size:
+                if free_size == size:
+                    del self.free[i]
+                else:
+                    self.free[i] = (offset + size, free_size - size)
+                self.used[offset] = size
+                return offset
+        return None
+
+    def release(self, offset):
+        size = self.used.pop(offset)
+        i = 0
+        while i < len(self.free) and self.free[i][0] < offset:
+            i += 1
+        if i < len(self.free) and offset + size == self.free[i][0]:         # : merge the next range
+            size += self.free.pop(i)[1]
+        if i > 0 and self.free[i - 1][0] + self.free[i - 1][1] == offset:   # : merge the previous range
+            offset, size = self.free[i - 1][0], self.free[i - 1][1] + size
+            i -= 1
+            del self.free[i]
+        self.free.insert(i, (offset, size))
+
+    def grow(self, capacity):
+        # more elements at the end (they extend the last free range when it reaches the end)
+        if self.free and sum(self.free[-1]) == self.capacity:
+            offset, _ = self.free.pop()
+        else:
+            offset = self.capacity
+        self.free.append((offset, capacity - offset))
+        self.capacity = capacity
+
+    def pack(self):
+        # moves (old offset, new offset, size) that pack the used ranges at the start, in their order
+        moves, offset = [], 0
+        for old_offset in sorted(self.used):
+            moves.append((old_offset, offset, self.used[old_offset]))
+            offset += self.used[old_offset]
+        self.used = {new_offset: size for _, new_offset, size in moves}
+        self.free = [(offset, self.capacity - offset)] if offset < self.capacity else []
+        return moves
+
+    def stats(self):
+        used    = sum(self.used.values())
+        free    = self.capacity - used
+        largest = max([size for _, size in self.free], default=0)
+        # fragmentation: the part of the free elements outside the largest free range
+        return {"capacity": self.capacity, "used": used, "free": free, "largest_free": largest,
+                "utilization": used / self.capacity if self.capacity else 0.0,
+                "fragmentation": 1.0 - largest / free if free else 0.0}
+
+
+class ArenaMesh:
+    # a mesh of an arena: its ranges of vertices and indices (updated in place when the arena compacts)
+    def __init__(self, arena, base_vertex, vertex_count, first_index, index_count):
+        self.arena        = arena
+        self.base_vertex  = base_vertex
+        self.vertex_count = vertex_count
+        self.first_index  = first_index
+        self.index_count  = index_count
+
+    def draw_call(self, instance_count=None):
+        # (gl draw function, its arguments) of the mesh with the arena's VAO bound (e.g. for render_queue.submit)
+        offset = ctypes.c_void_p(self.first_index * self.arena.index_size)
+        if instance_count is None:
+            return glDrawElementsBaseVertex, (GL_TRIANGLES, self.index_count, self.arena.index_type, offset, self.base_vertex)
+        return glDrawElementsInstancedBaseVertex, (GL_TRIANGLES, self.index_count, self.arena.index_type, offset,
+                                                   instance_count, self.base_vertex)
+
+    def draw(self, instance_count=None):
+        function, arguments = self.draw_call(instance_count)
+        function(*arguments)
+
+    def free(self):
+        if self.arena is not None:
+            self.arena.remove(self)
+            self.arena = None
+
+
+class MeshArena:
+    def __init__(self, layout, indices_dtype=np.uint16, vertex_capacity=4096, index_capacity=3 * 4096):
+        self.layout     = layout
+        self.dtype      = np.dtype(indices_dtype)
+        self.index_size = self.dtype.itemsize
+        self.index_type = index_type(np.empty(0, self.dtype))
+        self.vertices   = RangeAllocator(vertex_capacity)
+        self.indices    = RangeAllocator(index_capacity)
+        self.meshes     = {}     # : base vertex -> ArenaMesh
+
+        self.VBO, self.EBO = (int(buffer) for buffer in glGenBuffers(2))
+        for buffer, nbytes in ((self.VBO, vertex_capacity * layout.stride), (self.EBO, index_capacity * self.index_size)):
+            glBindBuffer(GL_ARRAY_BUFFER, buffer)
+            glBufferData(GL_ARRAY_BUFFER, nbytes, None, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        gl_state.invalidate()
+
+    def vertex_array(self, program):
+        # VAO of every mesh of the arena for the attribute locations of program (id)
+        return vertex_arrays.get(program, self.layout, self.VBO, self.EBO)
+
+    def add(self, vertices, indices):
+        # ArenaMesh of the vertices (interleaved as the arena's layout) and their own indices (from 0)
+        vertices     = np.ascontiguousarray(vertices).view(np.uint8).ravel()
+        vertex_count = vertices.nbytes // self.layout.stride
+        if vertex_count > np.iinfo(self.dtype).max + 1:
+            raise TypeError("MeshArena: {} vertices do not fit the {} indices of the arena".format(vertex_count, self.dtype))
+        indices = np.ascontiguousarray(indices, dtype=self.dtype)
+
+        base_vertex = self.allocate(self.vertices, self.VBO, self.layout.stride, vertex_count)
+        first_index = self.allocate(self.indices,  self.EBO, self.index_size, len(indices))
+
+        glBindBuffer(GL_ARRAY_BUFFER, self.VBO)
+        glBufferSubData(GL_ARRAY_BUFFER, base_vertex * self.layout.stride, vertices.nbytes, vertices)
+        glBindBuffer(GL_ARRAY_BUFFER, self.EBO)
+        glBufferSubData(GL_ARRAY_BUFFER, first_index * self.index_size, indices.nbytes, indices)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        gl_state.invalidate()
+
+        mesh = ArenaMesh(self, base_vertex, vertex_count, first_index, len(indices))
+        self.meshes[base_vertex] = mesh
+        return mesh
+
+    def remove(self, mesh):
+        # (the ranges are reused by the next meshes, compact() packs the rest)
+        del self.meshes[mesh.base_vertex]
+        self.vertices.release(mesh.base_vertex)
+        self.indices.release(mesh.first_index)
+
+    def allocate(self, ranges, buffer, element_size, count):
+        # offset of count elements in buffer, its capacity doubled until they fit
+        offset = ranges.allocate(count)
+        if offset is None:
+            tail     = ranges.free[-1][1] if ranges.free and sum(ranges.free[-1]) == ranges.capacity else 0
+            capacity = ranges.capacity * 2
+            while tail + capacity - ranges.capacity < count:
+                capacity *= 2
+            nbytes = ranges.capacity * element_size
+            self.resize(buffer, nbytes, [(0, 0, nbytes)], capacity * element_size)
+            ranges.grow(capacity)
+            offset = ranges.allocate(count)
+        return offset
+
+    def resize(self, buffer, nbytes, moves, new_nbytes):
+        # re-specify the data store of buffer (new_nbytes), its ranges moved (old byte offset, new byte offset, bytes)
+        # : through a temporary buffer, the name of the buffer (in the VAOs) does not change
+        temp = glGenBuffers(1)
+        glBindBuffer(GL_COPY_READ_BUFFER, buffer)
+        glBindBuffer(GL_COPY_WRITE_BUFFER, temp)
+        glBufferData(GL_COPY_WRITE_BUFFER, max(nbytes, 1), None, GL_STREAM_COPY)
+        glCopyBufferSubData(GL_COPY_READ_BUFFER, GL_COPY_WRITE_BUFFER, 0, 0, nbytes)
+
+        glBufferData(GL_COPY_READ_BUFFER, new_nbytes, None, GL_STATIC_DRAW)
+        for old_offset, new_offset, size in moves:
+            if size > 0:
+                glCopyBufferSubData(GL_COPY_WRITE_BUFFER, GL_COPY_READ_BUFFER, old_offset, new_offset, size)
+        glBindBuffer(GL_COPY_READ_BUFFER, 0)
+        glBindBuffer(GL_COPY_WRITE_BUFFER, 0)
+        glDeleteBuffers(1, [temp])
+        gl_state.invalidate()
+
+    def compact(self):
+        # pack the meshes at the start of the buffers (the free ranges merged in one at the end)
+        offsets = []     # : old offset -> new offset, of the vertices and of the indices
+        for ranges, buffer, element_size in ((self.vertices, self.VBO, self.layout.stride),
+                                             (self.indices,  self.EBO, self.index_size)):
+            moves  = ranges.pack()
+            nbytes = ranges.capacity * element_size
+            self.resize(buffer, nbytes, [(old * element_size, new * element_size, size * element_size)
+                                         for old, new, size in moves], nbytes)
+            offsets.append({old: new for old, new, _ in moves})
+
+        for mesh in self.meshes.values():
+            mesh.base_vertex = offsets[0][mesh.base_vertex]
+            mesh.first_index = offsets[1][mesh.first_index]
+        self.meshes = {mesh.base_vertex: mesh for mesh in self.meshes.values()}
+
+    def stats(self):
+        return {"meshes": len(self.meshes), "vertices": self.vertices.stats(), "indices": self.indices.stats(),
+                "bytes": self.vertices.capacity * self.layout.stride + self.indices.capacity * self.index_size}
+
+    def delete(self):
+        vertex_arrays.release_buffers(self.VBO, self.EBO)
+        glDeleteBuffers(2, [self.VBO, self.EBO])
+        gl_state.forget(self.VBO, self.EBO)
+        for mesh in self.meshes.values():
+            mesh.arena = None
+        self.meshes = {}
+
+
+class MeshArenas:
+    # the arenas of the meshes, one per (vertex layout, index type)
+    def __init__(self):
+        self.arenas = {}
+
+    def add(self, layout, vertices, indices):
+        # ArenaMesh of a mesh in the arena of its layout and index type
+        key = (layout.key, np.dtype(indices.dtype).str)
+        if key not in self.arenas:
+            self.arenas[key] = MeshArena(layout, indices.dtype)
+        return self.arenas[key].add(vertices, indices)
+
+    def stats(self):
+        # totals of all the arenas in bytes (fragmentation: the part of the free bytes outside the largest free range of their buffer)
+        stats = {"arenas": len(self.arenas), "meshes": 0, "bytes": 0, "used": 0, "free": 0, "fragmented": 0}
+        for arena in self.arenas.values():
+            stats["meshes"] += len(arena.meshes)
+            for ranges, element_size in ((arena.vertices, arena.layout.stride), (arena.indices, arena.index_size)):
+                range_stats = ranges.stats()
+                stats["bytes"]      += range_stats["capacity"] * element_size
+                stats["used"]       += range_stats["used"] * element_size
+                stats["free"]       += range_stats["free"] * element_size
+                stats["fragmented"] += (range_stats["free"] - range_stats["largest_free"]) * element_size
+        stats["utilization"]   = stats["used"] / stats["bytes"] if stats["bytes"] else 0.0
+        stats["fragmentation"] = stats["fragmented"] / stats["free"] if stats["free"] else 0.0
+        return stats
+
+    def compact(self):
+        for arena in self.arenas.values():
+            arena.compact()
+
+    def clear(self):
+        for arena in self.arenas.values():
+            arena.delete()
+        self.arenas = {}
+
+
+# arenas shared by the chapters (kept across chapter switches, cleared when the viewer closes)
+mesh_arenas = MeshArenas()
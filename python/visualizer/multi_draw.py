@@ -0,0 +1,157 @@
+import ctypes
+import numpy as np
+
+from OpenGL.GL import *
+
+from visualizer.gl_state      import gl_state, context_supports
+from visualizer.instancing    import point_model_matrices
+from visualizer.stream_buffer import StreamBuffer
+
+#################################################################
+# Multi-draw batching                                           #
+# - many objects (arena meshes, each with its model matrix)     #
+#   drawn by a program are drawn together: their matrices go to #
+#   a stream buffer, read by the mat4 attribute aModel (divisor #
+#   1) of the program's INSTANCED variant                       #
+# - indirect (GL 4.3 / GL_ARB_multi_draw_indirect): one         #
+#   glMultiDrawElementsIndirect() per mesh arena, a command per #
+#   mesh, its baseInstance selects the matrices of its objects  #
+# - GL 3.3 (no base instance, no draw id): one                  #
+#   glDrawElementsInstancedBaseVertex() per mesh, aModel moved  #
+#   to the matrices of its objects                              #
+#################################################################
+
+# counts since the last reset_batch_stats() (once per frame)
+batch_stats = {"objects": 0, "calls": 0}
+
+def reset_batch_stats():
+    # returns the counts of the frame and starts counting the next one
+    stats = dict(batch_stats)
+    batch_stats["objects"], batch_stats["calls"] = 0, 0
+    return stats
+
+def multi_draw_indirect_supported():
+    # (GL_ARB_base_instance, GL_ARB_draw_indirect come with it: both are core before 4.3)
+    return context_supports((4, 3), "GL_ARB_multi_draw_indirect") and context_supports((4, 2), "GL_ARB_base_instance")
+
+# DrawElementsIndirectCommand: count, instanceCount, firstIndex, baseVertex, baseInstance
+COMMAND_SIZE = 5 * 4
+MATRIX_SIZE  = 16 * 4
+
+class DrawBatcher:
+    def __init__(self, capacity, frames=3, indirect=None):
+        # capacity: objects drawn between two flush() calls
+        # frames  : flushes of data in the stream buffers (the GPU may be drawing the previous ones)
+        # indirect: None = when the context supports it
+        self.capacity = capacity
+        self.indirect = multi_draw_indirect_supported() if indirect is None else indirect
+        self.items    = []
+        self.vaos     = {}     # : (arena buffers, layout, attribute locations) -> (VAO, aModel location)
+
+        # : the matrices stay 64-byte aligned, their offset is a whole number of matrices (the baseInstance)
+        self.matrices = StreamBuffer(max(frames * capacity, 1) * MATRIX_SIZE, alignment=MATRIX_SIZE)
+        self.commands = None
+        if self.indirect:
+            self.commands = StreamBuffer(max(frames * capacity, 1) * COMMAND_SIZE, GL_DRAW_INDIRECT_BUFFER, alignment=4)
+
+    def submit(self, shader, meshes, model_mats, mesh_ids=None, textures=()):
+        # shader    : INSTANCED variant of a program (reads the mat4 attribute aModel)
+        # meshes    : ArenaMesh list (of one or more arenas)
+        # model_mats: (N, 4, 4) float32, one per object
+        # mesh_ids  : (N,) index in meshes of the mesh of every object (None: object i is meshes[i])
+        # textures  : ((texture unit, GL_TEXTURE_2D texture), ...)
+        model_mats = np.ascontiguousarray(model_mats, dtype=np.float32).reshape(-1, 4, 4)
+        mesh_ids   = np.arange(len(meshes)) if mesh_ids is None else np.asarray(mesh_ids, dtype=np.int64)
+        if len(mesh_ids) != len(model_mats):
+            raise TypeError("DrawBatcher: %d model matrices for %d objects" % (len(model_mats), len(mesh_ids)))
+        self.items.append((shader, list(meshes), model_mats, mesh_ids, tuple(textures)))
+
+    def vertex_array(self, program, arena):
+        # (VAO, aModel location) reading the meshes of the arena and the matrices of the stream buffer
+        location = int(glGetAttribLocation(program, "aModel"))
+        if location < 0:
+            raise RuntimeError("DrawBatcher: the program reads no 'aModel' attribute (use its INSTANCED variant)")
+        locations = tuple(int(glGetAttribLocation(program, name)) for name in arena.layout.names())
+        key = (arena.VBO, arena.EBO, arena.layout.key, locations, location)
+        if key not in self.vaos:
+            vao = glGenVertexArrays(1)
+            glBindVertexArray(vao)
+            glBindBuffer(GL_ARRAY_BUFFER, arena.VBO)
+            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, arena.EBO)
+            arena.layout.apply(locations)
+            glBindBuffer(GL_ARRAY_BUFFER, self.matrices.buffer)
+            point_model_matrices(location)     # : from the start of the buffer, the draws select their matrices
+            glBindVertexArray(0)
+            gl_state.invalidate()    # : set up with the plain GL calls (at resource creation)
+            self.vaos[key] = (vao, location)
+        return self.vaos[key]
+
+    def flush(self):
+        # draw the submitted objects, grouped by program, arena and mesh (the submission order inside a mesh)
+        if self.items:
+            self.matrices.next_frame()
+            if self.indirect:
+                self.commands.next_frame()
+
+        calls = 0
+        for shader, meshes, model_mats, mesh_ids, textures in self.items:
+            shader.use()
+            for unit, texture in textures:
+                gl_state.bind_texture(unit, GL_TEXTURE_2D, texture)
+
+            # objects sorted by arena, then by mesh: a run of objects per mesh
+            arenas       = list(dict.fromkeys(mesh.arena for mesh in meshes))
+            mesh_arena   = np.array([arenas.index(mesh.arena) for mesh in meshes], dtype=np.int64)
+            order        = np.argsort(mesh_arena[mesh_ids] * len(meshes) + mesh_ids, kind="stable")
+            ids          = mesh_ids[order]
+            starts       = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+            counts       = np.diff(np.r_[starts, len(ids)])
+            run_arenas   = mesh_arena[ids[starts]]
+
+            for arena_index, arena in enumerate(arenas):
+                runs = np.flatnonzero(run_arenas == arena_index)
+                if len(runs) == 0:
+                    continue
+                first, last = starts[runs[0]], starts[runs[-1]] + counts[runs[-1]]
+
+                matrices = self.matrices.map((last - first) * MATRIX_SIZE).view(np.float32).reshape(-1, 4, 4)
+                np.take(model_mats, order[first:last], axis=0, out=matrices)
+                offset = self.matrices.unmap()
+
+                vao, location = self.vertex_array(shader.id, arena)
+                gl_state.bind_vertex_array(vao)
+                run_meshes = [meshes[i] for i in ids[starts[runs]]]
+                if self.indirect:
+                    commands = np.empty((len(runs), 5), dtype=np.uint32)
+                    commands[:, 0] = [mesh.index_count for mesh in run_meshes]
+                    commands[:, 1] = counts[runs]
+                    commands[:, 2] = [mesh.first_index for mesh in run_meshes]
+                    commands[:, 3] = [mesh.base_vertex for mesh in run_meshes]
+                    commands[:, 4] = offset // MATRIX_SIZE + starts[runs] - first
+                    command_offset = self.commands.write(commands)
+                    gl_state.bind_buffer(GL_DRAW_INDIRECT_BUFFER, self.commands.buffer)
+                    glMultiDrawElementsIndirect(GL_TRIANGLES, arena.index_type, ctypes.c_void_p(command_offset), len(runs), 0)
+                    calls += 1
+                else:
+                    gl_state.bind_buffer(GL_ARRAY_BUFFER, self.matrices.buffer)
+                    for mesh, start, count in zip(run_meshes, starts[runs], counts[runs]):
+                        for i in range(4):
+                            glVertexAttribPointer(location + i, 4, GL_FLOAT, GL_FALSE, MATRIX_SIZE,
+                                                  ctypes.c_void_p(int(offset + (start - first) * MATRIX_SIZE + 16 * i)))
+                        mesh.draw(int(count))
+                        calls += 1
+            batch_stats["objects"] += len(mesh_ids)
+
+        batch_stats["calls"] += calls
+        self.items = []
+
+    def delete(self):
+        # (before the OpenGL context is destroyed)
+        for vao, _ in self.vaos.values():
+            glDeleteVertexArrays(1, [vao])
+            gl_state.forget(vao)
+        self.vaos = {}
+        self.matrices.delete()
+        if self.commands is not None:
+            self.commands.delete()
+        self.items = []
@@ -1,19 +1,77 @@
 import numpy as np
+from OpenGL.GL import GL_FLOAT
+
+from visualizer.geometry      import shared_mesh, weld, index_dtype
+from visualizer.vertex_layout import VertexLayout
+from visualizer.vertex_format import compact_vertices
+
+# vertex formats of the shapes (attribute names of the chapters' vertex shaders)
+POSITION_TEXCOORD        = VertexLayout([("aPos",      3, GL_FLOAT, False, 0),
+                                         ("aTexCoord", 2, GL_FLOAT, False, 3 * 4)])
+POSITION_NORMAL_TEXCOORD = VertexLayout([("aPos",      3, GL_FLOAT, False, 0),
+                                         ("aNormal",   3, GL_FLOAT, False, 3 * 4),
+                                         ("aTexCoord", 2, GL_FLOAT, False, 6 * 4)])
 
 class Primitive:
+    # (vertices, indices) of the shapes: unique vertices (float32) and indices (uint16) to draw with glDrawElements()
+    # : built on the first call and shared by every caller (read-only arrays)
+    SHAPES  = ["triangle", "rectangle", "box"]     # : order of the chapters' primitive setting
+    LAYOUTS = {"triangle": POSITION_TEXCOORD, "rectangle": POSITION_TEXCOORD, "box": POSITION_NORMAL_TEXCOORD}
+    COMPACT_LAYOUTS = {}                            # : shape -> layout of its compact vertices (chosen per mesh)
+    COMPACT = True                                  # : geometry() in the compact formats (False: float32, to compare)
+
+    @staticmethod
+    def mesh(shape):
+        # (vertices, indices) of a shape by name
+        return getattr(Primitive, shape)()
+
+    @staticmethod
+    def layout(shape):
+        # vertex layout of a shape by name
+        return Primitive.LAYOUTS[shape]
+
+    @staticmethod
+    def compact(shape):
+        # (vertices, indices, layout) of a shape in its compact vertex format (visualizer.vertex_format)
+        # : the shapes fit in half floats and packed normals without error
+        def build():
+            vertices, indices = Primitive.mesh(shape)
+            data, Primitive.COMPACT_LAYOUTS[shape], _ = compact_vertices(vertices, Primitive.layout(shape))
+            return data, indices
+        vertices, indices = shared_mesh(shape + ".compact", build)
+        return vertices, indices, Primitive.COMPACT_LAYOUTS[shape]
+
+    @staticmethod
+    def geometry(shape):
+        # (vertices, indices, layout) of a shape as the chapters upload it: compact, float32 when COMPACT is off
+        if Primitive.COMPACT:
+            return Primitive.compact(shape)
+        vertices, indices = Primitive.mesh(shape)
+        return vertices, indices, Primitive.layout(shape)
+
     @staticmethod
     def triangle():
+        return shared_mesh("triangle", Primitive.build_triangle)
+
+    @staticmethod
+    def rectangle():
+        return shared_mesh("rectangle", Primitive.build_rectangle)
+
+    @staticmethod
+    def box():
+        return shared_mesh("box", Primitive.build_box)
+
+    @staticmethod
+    def build_triangle():
         vertices = [# positions        # texture coords
                     -0.5, -0.5,  0.0,   0.0, 0.0,
                      0.5, -0.5,  0.0,   1.0, 0.0,
                      0.0,  0.5,  0.0,   0.5, 1.0
                    ]
-        vertices = np.array(vertices, dtype=np.float32)
-
-        return vertices, None
+        return weld(vertices, 5)
 
     @staticmethod
-    def rectangle():
+    def build_rectangle():
         vertices = [# positions        # texture coords
                      0.5,  0.5,  0.0,   1.0, 1.0,   # top right
                      0.5, -0.5,  0.0,   1.0, 0.0,   # bottom right
@@ -24,12 +82,13 @@ class Primitive:
 
         indices = [ 0, 1, 3,
                     1, 2, 3 ]
-        indices = np.array(indices, dtype=np.uint32)
+        indices = np.array(indices, dtype=index_dtype(4))
 
         return vertices, indices
 
     @staticmethod
-    def box():
+    def build_box():
+        # expanded (the 6 corners of every face), welded to the 4 corners of every face
         vertices = [# positions        # normal         # texture coords
                     -0.5, -0.5, -0.5,   0.0, 0.0, -1.0,   0.0, 0.0,
                      0.5, -0.5, -0.5,   0.0, 0.0, -1.0,   1.0, 0.0, 
@@ -74,6 +133,4 @@ class Primitive:
                     -0.5,  0.5, -0.5,   0.0, 1.0, 0.0,    0.0, 1.0,
                     ]
 
-        vertices = np.array(vertices, dtype=np.float32)
-
-        return vertices, None
\ No newline at end of file
+        return weld(vertices, 8)
@@ -0,0 +1,37 @@
+from OpenGL.GL import *
+
+#################################################################
+# GPU queries                                                   #
+# - a query around a part of the frame: GL_SAMPLES_PASSED       #
+#   (fragments that passed the depth test) or GL_TIME_ELAPSED   #
+#   (nanoseconds of GPU time)                                   #
+# - the results are read a few frames later, when available,    #
+#   so the CPU never waits for the GPU                          #
+#################################################################
+
+class FrameQuery:
+    def __init__(self, target, latency=3):
+        self.target  = target
+        self.ids     = list(glGenQueries(latency))
+        self.pending = [False] * latency    # : issued, result not read yet
+        self.index   = 0
+        self.result  = None                 # : of the latest available query (None before the first one)
+
+    def begin(self):
+        glBeginQuery(self.target, self.ids[self.index])
+
+    def end(self):
+        glEndQuery(self.target)
+        self.pending[self.index] = True
+        self.index = (self.index + 1) % len(self.ids)
+
+        # the oldest query: the next one to be reused
+        query = self.ids[self.index]
+        if self.pending[self.index] and glGetQueryObjectuiv(query, GL_QUERY_RESULT_AVAILABLE):
+            # (32 bits: up to 4.2 s of GPU time, PyOpenGL cannot return the 64 bit results)
+            self.result = int(glGetQueryObjectuiv(query, GL_QUERY_RESULT))
+            self.pending[self.index] = False
+
+    def delete(self):
+        glDeleteQueries(len(self.ids), self.ids)
+        self.ids = []
@@ -0,0 +1,104 @@
+import struct
+
+import glm
+
+from OpenGL.GL import *
+
+from visualizer.gl_state import gl_state
+
+#################################################################
+# Render queue                                                  #
+# - the chapters submit draw items (program, VAO, textures,     #
+#   uniforms, depth) instead of drawing them right away         #
+# - flush() sorts them by a 64-bit key and draws them, binding  #
+#   a program / VAO / texture only when it changes              #
+#   key: program 12 bits | textures 12 | VAO 8 | depth 32       #
+#   (opaque: the nearest first inside a state group)            #
+#################################################################
+
+# binds since the last reset_queue_stats() (once per frame)
+# : 'saved' counts the binds an immediate loop (every bind before every draw) would have made on top
+queue_stats = {"draws": 0, "binds": 0, "saved": 0}
+
+def reset_queue_stats():
+    # returns the counts of the frame and starts counting the next one
+    stats = dict(queue_stats)
+    queue_stats["draws"], queue_stats["binds"], queue_stats["saved"] = 0, 0, 0
+    return stats
+
+# bits of each field of the sort key (from the most significant one)
+PROGRAM_BITS, TEXTURE_BITS, VAO_BITS, DEPTH_BITS = 12, 12, 8, 32
+
+def depth_bits(depth):
+    # the bits of a non-negative float32 sort like its value (the items behind the camera count as 0)
+    return struct.unpack("<I", struct.pack("<f", max(depth, 0.0)))[0]
+
+
+class RenderQueue:
+    def __init__(self):
+        self.items = []
+        self.ranks = {"program": {}, "textures": {}, "vao": {}}     # : state -> its number in the key (in the order seen)
+
+    def rank(self, kind, value, bits):
+        # small number of the state (wraps around after 2^bits states, which only costs a few extra binds)
+        ranks = self.ranks[kind]
+        return ranks.setdefault(value, len(ranks)) % (1 << bits)
+
+    def submit(self, shader, vao, draw, textures=(), uniforms=(), depth=0.0):
+        # draw    : (gl draw function, its arguments), e.g. (glDrawArrays, (GL_TRIANGLES, 0, 36))
+        # textures: ((texture unit, GL_TEXTURE_2D texture), ...)
+        # uniforms: ((shader setter name, uniform name, value...), ...), e.g. ("set_mat4", "model", model_mat)
+        # depth   : view space depth of the item (its distance along the view direction)
+        textures = tuple(textures)
+        key = (self.rank("program", shader.id, PROGRAM_BITS) << (TEXTURE_BITS + VAO_BITS + DEPTH_BITS)
+               | self.rank("textures", textures, TEXTURE_BITS) << (VAO_BITS + DEPTH_BITS)
+               | self.rank("vao", vao, VAO_BITS) << DEPTH_BITS
+               | depth_bits(depth))
+        self.items.append((key, len(self.items), shader, vao, textures, uniforms, draw))
+
+    def flush(self):
+        # draw the submitted items in key order (the submission order for equal keys)
+        # : binds counts the state changes between the items, the state already bound before the flush
+        #   is dropped by gl_state
+        self.items.sort(key=lambda item: item[:2])
+
+        program, vao, unit_textures = None, None, {}
+        binds, naive_binds = 0, 0
+        for _, _, shader, item_vao, textures, uniforms, draw in self.items:
+            naive_binds += 2 + len(textures)
+            if shader.id != program:
+                shader.use()
+                program = shader.id
+                binds  += 1
+            if item_vao != vao:
+                gl_state.bind_vertex_array(item_vao)
+                vao    = item_vao
+                binds += 1
+            for unit, texture in textures:
+                if unit_textures.get(unit) != texture:
+                    gl_state.bind_texture(unit, GL_TEXTURE_2D, texture)
+                    unit_textures[unit] = texture
+                    binds += 1
+
+            for setter, name, *value in uniforms:
+                getattr(shader, setter)(name, *value)
+            draw[0](*draw[1])
+
+        queue_stats["draws"] += len(self.items)
+        queue_stats["binds"] += binds
+        queue_stats["saved"] += naive_binds - binds
+        self.items = []
+
+    def clear(self):
+        # forget the states (e.g. when the chapter changes, the ids may be reused by other objects)
+        self.items = []
+        self.ranks = {kind: {} for kind in self.ranks}
+
+
+def view_depth(view_mat, position):
+    # depth of a world position in front of the camera of view_mat (glm)
+    return -(view_mat * glm.vec4(position, 1.0)).z
+
+
+# queue shared by the chapters (flushed by the chapter, once per pass)
+render_queue = RenderQueue()
@@ -1,36 +1,252 @@
 import os
+import ctypes
+import struct
+import hashlib
 from typing import overload
 import numpy as np
 
 import glm
 from OpenGL.GL import *
 
+from visualizer.gl_state import gl_state
+
 #################################################################
 # Shader class                                                  #
 # - reference: https://gist.github.com/deepankarsharma/3494203  #
 #################################################################
 
+# process-wide cache of the linked programs
+# : key (hash of the shader sources and defines) -> [program id, reference count, active uniforms, uniform values]
+#   a program is compiled and linked once per session, and deleted when no Shader uses it anymore
+program_cache = {}
+program_cache_stats = {"hits": 0, "misses": 0, "binary_loads": 0}
+
+# on-disk cache of the linked program binaries (glGetProgramBinary / glProgramBinary)
+# : a program linked in an earlier session by the same driver is loaded instead of compiled
+#   (set to None to disable)
+program_binary_dir = os.path.join(os.path.expanduser("~"), ".cache", "LearnOpenGLStudy", "programs")
+PROGRAM_BINARY_MAGIC = b"GLPB"
+
+# uniform uploads since the last reset_uniform_stats() (once per frame)
+# : 'skipped' counts the setter calls with the value the program already has
+uniform_stats = {"uploads": 0, "skipped": 0}
+
+# uniform block name -> binding point, the same in every program
+# : the buffer of a block is bound once to its binding point and every program reads it from there
+#   (GLSL 330 has no 'layout (binding = n)', so the blocks are bound with glUniformBlockBinding)
+UNIFORM_BLOCK_BINDINGS = {"Camera": 0, "MaterialBlock": 1, "LightBlock": 2, "LightArrayBlock": 3}
+
+# defines every program of the viewer is compiled with
+# : the standalone chapter scripts compile the same sources without them
+#   CAMERA_BLOCK    -> projection and view are read from the shared Camera block (visualizer.uniform_buffer)
+#   LIGHTING_BLOCKS -> the Material and Light structs are read from the MaterialBlock and LightBlock blocks
+shared_defines = {"CAMERA_BLOCK": 1, "LIGHTING_BLOCKS": 1}
+
+def reset_uniform_stats():
+    # returns the counts of the frame and starts counting the next one
+    stats = dict(uniform_stats)
+    uniform_stats["uploads"], uniform_stats["skipped"] = 0, 0
+    return stats
+
+def program_key(vtx_src_code, frag_src_code, defines=None):
+    key = hashlib.sha1()
+    key.update(vtx_src_code.encode())
+    key.update(b"\0")
+    key.update(frag_src_code.encode())
+    for name, value in sorted((defines or {}).items()):
+        key.update(("\0%s=%s" % (name, value)).encode())
+    return key.hexdigest()
+
+def program_binary_supported():
+    if program_binary_dir is None or not bool(glProgramBinary):
+        return False
+    return glGetIntegerv(GL_NUM_PROGRAM_BINARY_FORMATS) > 0
+
+def program_binary_path(key):
+    # the binary is only valid for the driver that produced it
+    driver = [glGetString(name).decode(errors="replace") for name in (GL_VENDOR, GL_RENDERER, GL_VERSION)]
+    file_name = hashlib.sha1("\0".join([key] + driver).encode()).hexdigest()
+    return os.path.join(program_binary_dir, file_name + ".bin")
+
+def discard_program_binary(file_path):
+    # a stale binary (the cache may be read-only, or another viewer may have removed it already)
+    try:
+        os.remove(file_path)
+    except OSError:
+        pass
+
+def load_program_binary(key):
+    # returns the linked program, or None when there is no valid binary for the key
+    if not program_binary_supported():
+        return None
+
+    file_path = program_binary_path(key)
+    try:
+        with open(file_path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+
+    # header: magic, binary format, binary length
+    header_size = struct.calcsize("<4sII")
+    if len(data) < header_size:
+        discard_program_binary(file_path)
+        return None
+    magic, binary_format, length = struct.unpack_from("<4sII", data)
+    binary = data[header_size:]
+    if magic != PROGRAM_BINARY_MAGIC or length != len(binary):
+        discard_program_binary(file_path)
+        return None
+
+    # the driver rejects binaries it can not use anymore (e.g. after a driver update)
+    program_id = glCreateProgram()
+    glProgramBinary(program_id, binary_format, binary, length)
+    if glGetProgramiv(program_id, GL_LINK_STATUS) != GL_TRUE:
+        glDeleteProgram(program_id)
+        discard_program_binary(file_path)
+        return None
+
+    return program_id
+
+def save_program_binary(key, program_id):
+    if not program_binary_supported():
+        return
+
+    length = glGetProgramiv(program_id, GL_PROGRAM_BINARY_LENGTH)
+    if length <= 0:
+        return
+
+    binary        = (ctypes.c_ubyte * length)()
+    binary_length = GLsizei(0)
+    binary_format = GLenum(0)
+    glGetProgramBinary(program_id, length, ctypes.byref(binary_length), ctypes.byref(binary_format), binary)
+
+    # write to a temporary file first so a crash never leaves a truncated binary behind
+    file_path = program_binary_path(key)
+    try:
+        os.makedirs(program_binary_dir, exist_ok=True)
+        with open(file_path + ".tmp", "wb") as f:
+            f.write(struct.pack("<4sII", PROGRAM_BINARY_MAGIC, binary_format.value, binary_length.value))
+            f.write(bytes(binary)[:binary_length.value])
+        os.replace(file_path + ".tmp", file_path)
+    except OSError as e:
+        print("Failed to save program binary: %s" % e)
+
+# uniform types accepted by each setter (glUniform1i also sets bools and samplers)
+SAMPLER_TYPES = {GL_SAMPLER_1D, GL_SAMPLER_2D, GL_SAMPLER_3D, GL_SAMPLER_CUBE,
+                 GL_SAMPLER_1D_SHADOW, GL_SAMPLER_2D_SHADOW, GL_SAMPLER_CUBE_SHADOW,
+                 GL_SAMPLER_1D_ARRAY, GL_SAMPLER_2D_ARRAY, GL_SAMPLER_2D_ARRAY_SHADOW,
+                 GL_SAMPLER_2D_MULTISAMPLE, GL_SAMPLER_BUFFER, GL_SAMPLER_2D_RECT,
+                 GL_INT_SAMPLER_2D, GL_INT_SAMPLER_BUFFER,
+                 GL_UNSIGNED_INT_SAMPLER_2D, GL_UNSIGNED_INT_SAMPLER_BUFFER}
+INT_TYPES     = {GL_INT, GL_BOOL} | SAMPLER_TYPES
+TYPE_NAMES    = {int(t): t.name for t in INT_TYPES | {GL_INT_VEC4, GL_FLOAT, GL_FLOAT_VEC2, GL_FLOAT_VEC3, GL_FLOAT_VEC4,
+                                                     GL_FLOAT_MAT2, GL_FLOAT_MAT3, GL_FLOAT_MAT4}}
+
+def reflect_uniforms(program_id):
+    # name -> (location, type, size) of every active uniform of the program
+    uniforms = {}
+    for index in range(glGetProgramiv(program_id, GL_ACTIVE_UNIFORMS)):
+        name, size, gl_type = glGetActiveUniform(program_id, index)
+        name     = name.decode()
+        location = glGetUniformLocation(program_id, name)
+        if location < 0:    # : members of uniform blocks have no location
+            continue
+        uniforms[name] = (location, int(gl_type), int(size))
+
+        # arrays are reported once as 'name[0]': register 'name' and every element too
+        if name.endswith("[0]"):
+            array_name = name[:-3]
+            uniforms[array_name] = (location, int(gl_type), int(size))
+            for i in range(1, size):
+                element_name = "%s[%d]" % (array_name, i)
+                uniforms[element_name] = (glGetUniformLocation(program_id, element_name), int(gl_type), int(size) - i)
+    return uniforms
+
+def array_aliases(uniforms):
+    # location -> locations of the same array values in the shadow values of a program
+    # : an array ('name', at the location of 'name[0]') and its elements 'name[i]' are separate entries,
+    #   uploading one of them makes the others stale
+    aliases = {}
+    for name, (location, _, size) in uniforms.items():
+        if name.endswith("[0]") and size > 1:
+            elements = [uniforms["%s[%d]" % (name[:-3], i)][0] for i in range(1, size)]
+            aliases[location] = [element for element in elements if element >= 0]
+            for element in aliases[location]:
+                aliases[element] = [location]
+    return aliases
+
+def bind_uniform_blocks(program_id):
+    # point the uniform blocks of the program to their binding points
+    # : after glLinkProgram and glProgramBinary alike, every block starts at binding point 0
+    for name, binding in UNIFORM_BLOCK_BINDINGS.items():
+        index = glGetUniformBlockIndex(program_id, name)
+        if index != GL_INVALID_INDEX:
+            glUniformBlockBinding(program_id, index, binding)
+
+def add_defines(code, defines):
+    # insert '#define name value' lines right after the '#version' line
+    if not defines:
+        return code
+
+    define_lines = "".join("#define %s %s\n" % (name, value) for name, value in sorted(defines.items()))
+    if code.lstrip().startswith("#version"):
+        version_line, _, body = code.lstrip().partition("\n")
+        return version_line + "\n" + define_lines + body
+    return define_lines + code
+
+
 class Shader:
-    def __init__(self, vertex_path, fragment_path):
+    def __init__(self, vertex_path, fragment_path, defines=None):
         # open vertex shader and fragment shader code files
-        abs_path = os.path.dirname(os.path.abspath(__file__))
-
         vtx_src_code   = open(vertex_path).read()
         frag_src_code  = open(fragment_path).read()
 
+        defines = dict(shared_defines, **(defines or {}))
+
+        # reuse the program if the same sources (and defines) are already linked
+        self.key = program_key(vtx_src_code, frag_src_code, defines)
+        if self.key in program_cache:
+            program_cache[self.key][1] += 1
+            program_cache_stats["hits"] += 1
+        else:
+            # otherwise load the binary linked in an earlier session, or compile and link the sources
+            program_id = load_program_binary(self.key)
+            if program_id is not None:
+                program_cache_stats["binary_loads"] += 1
+            else:
+                program_id = self.link_program(add_defines(vtx_src_code, defines),
+                                               add_defines(frag_src_code, defines))
+                save_program_binary(self.key, program_id)
+                program_cache_stats["misses"] += 1
+            bind_uniform_blocks(program_id)
+            program_cache[self.key] = [program_id, 1, reflect_uniforms(program_id), {}]
+
+        self.id = program_cache[self.key][0]
+        # name -> (location, type, size), reflected once when the program is linked
+        # : the setters use the cached location instead of calling glGetUniformLocation every time
+        self.uniforms = program_cache[self.key][2]
+        # location -> bytes of the last uploaded value (uniforms are state of the program, not of the Shader)
+        # : a value identical to the one the program already has is not uploaded again
+        self.values   = program_cache[self.key][3]
+        self.aliases  = array_aliases(self.uniforms)
+
+    def link_program(self, vtx_src_code, frag_src_code):
         # vertex shader and fragment shader
         vtx_shader   = self.add_shader(vtx_src_code, GL_VERTEX_SHADER)
         frag_shader  = self.add_shader(frag_src_code, GL_FRAGMENT_SHADER)
 
         # shader program
-        self.id = glCreateProgram()
-        glAttachShader(self.id, vtx_shader)
-        glAttachShader(self.id, frag_shader)
-        glLinkProgram(self.id)
+        program_id = glCreateProgram()
+        if program_binary_supported():
+            glProgramParameteri(program_id, GL_PROGRAM_BINARY_RETRIEVABLE_HINT, GL_TRUE)
+        glAttachShader(program_id, vtx_shader)
+        glAttachShader(program_id, frag_shader)
+        glLinkProgram(program_id)
 
-        if glGetProgramiv(self.id, GL_LINK_STATUS) != GL_TRUE:
-            info_log = glGetProgramInfoLog(self.id)
-            glDeleteProgram(self.id)
+        if glGetProgramiv(program_id, GL_LINK_STATUS) != GL_TRUE:
+            info_log = glGetProgramInfoLog(program_id)
+            glDeleteProgram(program_id)
             glDeleteShader(vtx_shader)
             glDeleteShader(frag_shader)
             raise RuntimeError("ERROR::SHADER::PROGRAM::LINKING_FAILED %s ", info_log)
@@ -39,6 +255,8 @@ class Shader:
         glDeleteShader(vtx_shader)
         glDeleteShader(frag_shader)
 
+        return program_id
+
     def add_shader(self, code, shader_type):
         try:
             shader_id = glCreateShader(shader_type)
@@ -53,47 +271,126 @@ class Shader:
             raise
 
     def use(self):
-        glUseProgram(self.id)
+        gl_state.use_program(self.id)
+
+    def release(self):
+        # the program is deleted when the last Shader using it is released
+        if self.key is None:
+            return
+
+        program_cache[self.key][1] -= 1
+        if program_cache[self.key][1] == 0:
+            glDeleteProgram(self.id)
+            gl_state.forget(self.id)
+            del program_cache[self.key]
+        self.key = None
+
+    def get_location(self, name, types):
+        # location of the uniform, -1 if it is not active (unused or optimized out, glUniform*() ignores -1)
+        uniform = self.uniforms.get(name)
+        if uniform is None:
+            return -1
+
+        location, gl_type, _ = uniform
+        if gl_type not in types:
+            raise TypeError("uniform '%s' is %s, not %s" % (name, TYPE_NAMES.get(gl_type, gl_type),
+                                                          " or ".join(sorted(TYPE_NAMES[t] for t in types))))
+        return location
+
+    def upload_location(self, name, types, value):
+        # location to upload the value to, -1 if the program already has the (bitwise) same value
+        location = self.get_location(name, types)
+        if location < 0:
+            return -1
+        if self.values.get(location) == value:
+            uniform_stats["skipped"] += 1
+            return -1
+
+        self.values[location] = value
+        for alias in self.aliases.get(location, ()):
+            self.values.pop(alias, None)
+        uniform_stats["uploads"] += 1
+        return location
+
+    def has_uniform(self, name):
+        return name in self.uniforms
 
     def set_bool(self, name, value):
-        glUniform1i(glGetUniformLocation(self.id, name), int(value))
+        location = self.upload_location(name, INT_TYPES, struct.pack("i", int(value)))
+        if location >= 0:
+            glUniform1i(location, int(value))
     
     def set_int(self, name, value):
-        glUniform1i(glGetUniformLocation(self.id, name), value)
+        location = self.upload_location(name, INT_TYPES, struct.pack("i", value))
+        if location >= 0:
+            glUniform1i(location, value)
     
     def set_float(self, name, value):
-        glUniform1f(glGetUniformLocation(self.id, name), value)
+        location = self.upload_location(name, {GL_FLOAT}, struct.pack("f", value))
+        if location >= 0:
+            glUniform1f(location, value)
 
     def set_vec2(self, name, *args):
         if len(args) == 1:
-            glUniform2fv(glGetUniformLocation(self.id, name), 1, glm.value_ptr(args[0]))
-        elif len(args) == 3:
-            glUniform2f(glGetUniformLocation(self.id, name), args[0], args[1])
+            location = self.upload_location(name, {GL_FLOAT_VEC2}, bytes(args[0]))
+            if location >= 0:
+                glUniform2fv(location, 1, glm.value_ptr(args[0]))
+        elif len(args) == 2:
+            location = self.upload_location(name, {GL_FLOAT_VEC2}, struct.pack("2f", *args))
+            if location >= 0:
+                glUniform2f(location, args[0], args[1])
         else:
             raise TypeError("set_vec2()::wrong positional arguments: glm.vec2() or x, y values")
 
     def set_vec3(self, name, *args):
         if len(args) == 1:
-            glUniform3fv(glGetUniformLocation(self.id, name), 1, glm.value_ptr(args[0]))
+            location = self.upload_location(name, {GL_FLOAT_VEC3}, bytes(args[0]))
+            if location >= 0:
+                glUniform3fv(location, 1, glm.value_ptr(args[0]))
         elif len(args) == 3:
-            glUniform3f(glGetUniformLocation(self.id, name), args[0], args[1], args[2])
+            location = self.upload_location(name, {GL_FLOAT_VEC3}, struct.pack("3f", *args))
+            if location >= 0:
+                glUniform3f(location, args[0], args[1], args[2])
         else:
             raise TypeError("set_vec3()::wrong positional arguments: glm.vec3() or x, y, z values")
     
     def set_vec4(self, name, *args):
         if len(args) == 1:
-            glUniform4fv(glGetUniformLocation(self.id, name), 1, glm.value_ptr(args[0]))
+            location = self.upload_location(name, {GL_FLOAT_VEC4}, bytes(args[0]))
+            if location >= 0:
+                glUniform4fv(location, 1, glm.value_ptr(args[0]))
         elif len(args) == 4:
-            glUniform4f(glGetUniformLocation(self.id, name), args[0], args[1], args[2], args[3])
+            location = self.upload_location(name, {GL_FLOAT_VEC4}, struct.pack("4f", *args))
+            if location >= 0:
+                glUniform4f(location, args[0], args[1], args[2], args[3])
         else:
             raise TypeError("set_vec4()::wrong positional arguments: glm.vec4() or x, y, z, w values")
 
+    def set_vec4_array(self, name, values):
+        # values: (N, 4) float32 array, uploaded to name[0] .. name[N-1] with one call
+        values   = np.ascontiguousarray(values, dtype=np.float32).reshape(-1, 4)
+        location = self.upload_location(name, {GL_FLOAT_VEC4}, values.tobytes())
+        if location >= 0:
+            glUniform4fv(location, len(values), values)
+
+    def set_ivec4_array(self, name, values):
+        # values: (N, 4) int32 array (or N * 4 ints), uploaded to name[0] .. name[N-1] with one call
+        values   = np.ascontiguousarray(values, dtype=np.int32).reshape(-1, 4)
+        location = self.upload_location(name, {GL_INT_VEC4}, values.tobytes())
+        if location >= 0:
+            glUniform4iv(location, len(values), values)
+
     def set_mat2(self, name, mat):
-        glUniformMatrix2fv(glGetUniformLocation(self.id, name), 1, GL_FALSE, glm.value_ptr(mat))
+        location = self.upload_location(name, {GL_FLOAT_MAT2}, bytes(mat))
+        if location >= 0:
+            glUniformMatrix2fv(location, 1, GL_FALSE, glm.value_ptr(mat))
     
     def set_mat3(self, name, mat):
-        glUniformMatrix3fv(glGetUniformLocation(self.id, name), 1, GL_FALSE, glm.value_ptr(mat))
+        location = self.upload_location(name, {GL_FLOAT_MAT3}, bytes(mat))
+        if location >= 0:
+            glUniformMatrix3fv(location, 1, GL_FALSE, glm.value_ptr(mat))
 
     def set_mat4(self, name, mat):
-        glUniformMatrix4fv(glGetUniformLocation(self.id, name), 1, GL_FALSE, glm.value_ptr(mat))
-    
\ No newline at end of file
+        location = self.upload_location(name, {GL_FLOAT_MAT4}, bytes(mat))
+        if location >= 0:
+            glUniformMatrix4fv(location, 1, GL_FALSE, glm.value_ptr(mat))
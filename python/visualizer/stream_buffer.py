@@ -0,0 +1,151 @@
+import ctypes
+from collections import deque
+import numpy as np
+
+from OpenGL.GL import *
+
+from visualizer.gl_state import gl_state, context_supports
+
+#################################################################
+# Stream buffers                                                #
+# - data rewritten every frame (e.g. the model matrices of      #
+#   moving instances) is written to a new range of one buffer,  #
+#   never over a range the GPU may still read: no stall, no     #
+#   reallocation per upload                                     #
+# - persistent (GL_ARB_buffer_storage, core in GL 4.4): mapped  #
+#   once, the ranges form a ring, a fence per frame guards the  #
+#   ranges of the frames in flight                              #
+# - orphaning (GL 3.3): the buffer gets new storage at the      #
+#   first write of a frame (the driver keeps the old one for    #
+#   the frames in flight), each write maps its range            #
+#   unsynchronized                                              #
+# - map() returns a NumPy view of the range, written in place   #
+#   (zero-copy in the persistent mode), unmap() its offset      #
+#################################################################
+
+# counts since the last reset_stream_stats() (once per frame)
+stream_stats = {"bytes": 0, "waits": 0, "orphans": 0}
+
+def reset_stream_stats():
+    # returns the counts of the frame and starts counting the next one
+    stats = dict(stream_stats)
+    for key in stream_stats:
+        stream_stats[key] = 0
+    return stats
+
+def persistent_mapping_supported():
+    return context_supports((4, 4), "GL_ARB_buffer_storage")
+
+PERSISTENT_FLAGS = GL_MAP_WRITE_BIT | GL_MAP_PERSISTENT_BIT | GL_MAP_COHERENT_BIT
+ORPHAN_MAP_FLAGS = GL_MAP_WRITE_BIT | GL_MAP_INVALIDATE_RANGE_BIT | GL_MAP_UNSYNCHRONIZED_BIT
+
+def byte_view(pointer, nbytes):
+    # uint8 NumPy array on mapped memory
+    return np.ctypeslib.as_array((ctypes.c_ubyte * nbytes).from_address(pointer))
+
+
+class StreamBuffer:
+    def __init__(self, size, target=GL_ARRAY_BUFFER, alignment=256, persistent=None):
+        # size     : bytes of the buffer, at least the bytes written in one frame (a few frames for the persistent ring)
+        # alignment: of the ranges (256 also serves glBindBufferRange of uniform blocks)
+        # persistent: None = when the driver supports it
+        self.size       = size
+        self.target     = target
+        self.alignment  = alignment
+        self.persistent = persistent_mapping_supported() if persistent is None else persistent
+        self.head       = 0          # : next free byte
+        self.frame      = []         # : (start, end) ranges written in the current frame
+        self.fences     = deque()    # : (sync, ranges) of the frames in flight (persistent)
+        self.mapped     = None       # : (offset, bytes) between map() and unmap()
+        self.memory     = None       # : view of the whole buffer (persistent)
+
+        self.buffer = int(glGenBuffers(1))
+        gl_state.bind_buffer(target, self.buffer)
+        if self.persistent:
+            glBufferStorage(target, size, None, PERSISTENT_FLAGS)
+            self.memory = byte_view(glMapBufferRange(target, 0, size, PERSISTENT_FLAGS), size)
+        else:
+            glBufferData(target, size, None, GL_STREAM_DRAW)
+
+    def next_frame(self):
+        # the ranges written so far are read by the commands issued so far (call once per frame, before its writes)
+        if self.persistent and self.frame:
+            self.fences.append((glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0), self.frame))
+        elif not self.persistent:
+            self.head = 0
+        self.frame = []
+
+    def reserve(self, nbytes):
+        # offset of nbytes not read by the frames in flight
+        offset = -(-self.head // self.alignment) * self.alignment
+        if offset + nbytes > self.size:
+            offset = 0       # : wrap around
+        end = offset + nbytes
+        if end > self.size or any(start < end and offset < stop for start, stop in self.frame):
+            raise TypeError("StreamBuffer: more than its %d bytes written in one frame" % self.size)
+
+        if self.persistent:
+            # wait for the oldest frames until none of them reads the range
+            while any(start < end and offset < stop for _, ranges in self.fences for start, stop in ranges):
+                self.wait(self.fences.popleft()[0])
+        elif not self.frame:
+            # first write of the frame: new storage, the frames in flight keep reading the old one
+            gl_state.bind_buffer(self.target, self.buffer)
+            glBufferData(self.target, self.size, None, GL_STREAM_DRAW)
+            stream_stats["orphans"] += 1
+
+        if self.frame and self.frame[-1][1] == offset:
+            self.frame[-1] = (self.frame[-1][0], end)
+        else:
+            self.frame.append((offset, end))
+        self.head = end
+        stream_stats["bytes"] += nbytes
+        return offset
+
+    def wait(self, sync):
+        status = glClientWaitSync(sync, GL_SYNC_FLUSH_COMMANDS_BIT, 0)
+        if status == GL_TIMEOUT_EXPIRED:
+            stream_stats["waits"] += 1     # : the GPU is a whole ring behind, a larger buffer would not stall
+            while glClientWaitSync(sync, GL_SYNC_FLUSH_COMMANDS_BIT, 1000000) == GL_TIMEOUT_EXPIRED:
+                pass
+        glDeleteSync(sync)
+
+    def map(self, nbytes):
+        # uint8 view of nbytes to write this frame's data in, valid until unmap()
+        offset = self.reserve(nbytes)
+        self.mapped = (offset, nbytes)
+        if self.persistent:
+            return self.memory[offset:offset + nbytes]
+        if nbytes == 0:
+            return np.empty(0, dtype=np.uint8)
+        gl_state.bind_buffer(self.target, self.buffer)
+        return byte_view(glMapBufferRange(self.target, offset, nbytes, ORPHAN_MAP_FLAGS), nbytes)
+
+    def unmap(self):
+        # byte offset of the mapped range in the buffer (e.g. for glVertexAttribPointer, glBindBufferRange)
+        offset, nbytes = self.mapped
+        if not self.persistent and nbytes > 0:
+            gl_state.bind_buffer(self.target, self.buffer)
+            glUnmapBuffer(self.target)
+        self.mapped = None
+        return offset
+
+    def write(self, array):
+        # byte offset of a copy of the array in the buffer
+        data = np.ascontiguousarray(array).view(np.uint8).ravel()
+        self.map(data.nbytes)[:] = data
+        return self.unmap()
+
+    def delete(self):
+        # (before the OpenGL context is destroyed)
+        if self.buffer is not None:
+            for sync, _ in self.fences:
+                glDeleteSync(sync)
+            self.fences.clear()
+            if self.persistent:
+                gl_state.bind_buffer(self.target, self.buffer)
+                glUnmapBuffer(self.target)
+                self.memory = None
+            glDeleteBuffers(1, [self.buffer])
+            gl_state.forget(self.buffer)
+            self.buffer = None
@@ -0,0 +1,253 @@
+import os
+import time
+import ctypes
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from OpenGL.GL import *
+from PIL import Image
+
+from visualizer.gl_state import gl_state
+
+#################################################################
+# Texture manager                                               #
+# - textures are shared by file path, mtime and sampling params #
+# - unused textures stay resident until the VRAM budget is hit  #
+# - images are decoded in worker threads, and uploaded by       #
+#   update() on the render thread (placeholder until then)      #
+# - uploads are streamed through a PBO in row bands, within a   #
+#   time budget per frame                                       #
+#################################################################
+
+class TextureManager:
+    def __init__(self, budget_bytes=256 * 1024 * 1024, workers=4, upload_budget_ms=4.0, band_bytes=1024 * 1024):
+        # key (path, mtime, wrap, min filter, mag filter) -> [texture id, bytes, reference count]
+        # : ordered from the least recently used to the most recently used
+        self.textures     = OrderedDict()
+        self.keys         = {}      # texture id -> key
+        self.budget_bytes = budget_bytes
+        self.used_bytes   = 0
+        self.stats        = {"hits": 0, "loads": 0, "evictions": 0, "uploaded_bytes": 0}
+
+        # texture id -> future of the decoded image (mip levels)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.pending  = {}
+
+        # texture id -> [mip levels left to upload (smallest first), row of the current level]
+        # : update() uploads bands of rows until upload_budget_ms is spent (at least one band per frame)
+        self.uploads          = OrderedDict()
+        self.upload_budget_ms = upload_budget_ms
+        self.band_bytes       = band_bytes
+        self.pbo              = None
+        self.frame_stats      = {"bytes": 0, "bands": 0, "ms": 0.0}    # : of the last update()
+
+    def load(self, file_path, wrap=GL_REPEAT, min_filter=GL_LINEAR, mag_filter=GL_LINEAR):
+        # returns the shared texture of the image, decoded and uploaded only if it is not resident
+        # : a new texture shows the placeholder until update() uploads the decoded image
+        file_path = os.path.abspath(file_path)
+        key = (file_path, os.path.getmtime(file_path), int(wrap), int(min_filter), int(mag_filter))
+
+        if key in self.textures:
+            self.textures.move_to_end(key)
+            self.textures[key][2] += 1
+            self.stats["hits"] += 1
+            return self.textures[key][0]
+
+        texture, size = self.create_placeholder(wrap, min_filter, mag_filter)
+        self.pending[texture] = self.executor.submit(decode_image, file_path)
+        self.textures[key] = [texture, size, 1]
+        self.keys[texture] = key
+        self.used_bytes   += size
+        self.stats["loads"] += 1
+
+        self.evict()
+        return texture
+
+    def release(self, texture):
+        # the texture stays resident (and can be evicted) when nothing uses it anymore
+        key = self.keys.get(texture)
+        if key is not None and self.textures[key][2] > 0:
+            self.textures[key][2] -= 1
+
+    def evict(self):
+        # delete the least recently used textures nothing uses until the budget is met
+        # : textures in use are never deleted, even over the budget
+        for key in list(self.textures.keys()):
+            if self.used_bytes <= self.budget_bytes:
+                break
+            texture, size, ref_count = self.textures[key]
+            if ref_count > 0:
+                continue
+            if texture in self.pending:
+                self.pending.pop(texture).cancel()
+            self.uploads.pop(texture, None)
+            glDeleteTextures(1, texture)
+            gl_state.forget(texture)     # : a new texture may get its name
+            del self.textures[key]
+            del self.keys[texture]
+            self.used_bytes -= size
+            self.stats["evictions"] += 1
+
+    def set_budget(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self.evict()
+
+    def loading_count(self):
+        # textures still decoding or streaming
+        return len(self.pending) + len(self.uploads)
+
+    def update(self):
+        # once per frame, on the render thread
+        start = time.perf_counter()
+        self.frame_stats = {"bytes": 0, "bands": 0, "ms": 0.0}
+
+        # queue the images decoded since the last call
+        # : queuing a texture can evict other textures, so the pending ones are popped one by one
+        decoded = [texture for texture, future in self.pending.items() if future.done()]
+        for texture in decoded:
+            if texture in self.pending:
+                self.start_upload(texture, self.pending.pop(texture))
+
+        # stream the queued images until the time budget is spent
+        while self.uploads:
+            self.upload_band()
+            if (time.perf_counter() - start) * 1000.0 >= self.upload_budget_ms:
+                break
+
+        # the uploads bind with the plain GL calls
+        if decoded or self.frame_stats["bands"]:
+            gl_state.invalidate()
+        self.frame_stats["ms"] = (time.perf_counter() - start) * 1000.0
+
+    def wait(self):
+        # block until every pending image is decoded and uploaded (no time budget)
+        while self.pending:
+            texture = next(iter(self.pending))
+            self.start_upload(texture, self.pending.pop(texture))
+        while self.uploads:
+            self.upload_band()
+        gl_state.invalidate()
+
+    def clear(self):
+        # delete every texture (before the OpenGL context is destroyed)
+        for future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+        self.uploads.clear()
+        for texture, _, _ in self.textures.values():
+            glDeleteTextures(1, texture)
+            gl_state.forget(texture)
+        self.textures.clear()
+        self.keys.clear()
+        self.used_bytes = 0
+
+        if self.pbo is not None:
+            glDeleteBuffers(1, [self.pbo])
+            gl_state.forget(self.pbo)
+            self.pbo = None
+
+    def create_placeholder(self, wrap, min_filter, mag_filter):
+        texture = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D, texture)
+
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, wrap)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, wrap)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, min_filter)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, mag_filter)
+
+        # 1x1 grey (complete even with a mipmap min filter)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, 1, 1, 0, GL_RGBA, GL_UNSIGNED_BYTE, PLACEHOLDER_PIXEL)
+
+        return texture, texture_bytes(1, 1)
+
+    def start_upload(self, texture, future):
+        try:
+            levels = future.result()
+        except Exception as e:
+            print("Failed to load texture: %s" % e)
+            return
+
+        # the levels are uploaded from the smallest to the largest and the base level follows them,
+        # so the texture is always complete and gets sharper while it streams in
+        # (the placeholder is shown until the 1x1 level is uploaded)
+        self.uploads[texture] = [levels[::-1], 0]
+
+        # the placeholder's size -> the image's size
+        entry = self.textures[self.keys[texture]]
+        self.used_bytes += texture_bytes(levels[0][1], levels[0][2]) - entry[1]
+        entry[1] = texture_bytes(levels[0][1], levels[0][2])
+        self.evict()
+
+    def upload_band(self):
+        # upload the next band of rows of the first queued texture through the PBO
+        texture, job = next(iter(self.uploads.items()))
+        levels, row = job
+        level, img_w, img_h, pixels = levels[0]
+
+        row_bytes = img_w * 4
+        rows      = min(max(self.band_bytes // row_bytes, 1), img_h - row)
+        size      = rows * row_bytes
+
+        glBindTexture(GL_TEXTURE_2D, texture)
+        # a level is allocated only when it starts streaming (spreads the allocation over the frames)
+        if row == 0:
+            glTexImage2D(GL_TEXTURE_2D, level, GL_RGBA, img_w, img_h, 0, GL_RGBA, GL_UNSIGNED_BYTE, None)
+
+        if self.pbo is None:
+            self.pbo = glGenBuffers(1)
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, self.pbo)
+        # orphan the previous band (the driver may still be reading it) and copy the rows into the new storage
+        glBufferData(GL_PIXEL_UNPACK_BUFFER, size, None, GL_STREAM_DRAW)
+        buffer_ptr = glMapBufferRange(GL_PIXEL_UNPACK_BUFFER, 0, size, GL_MAP_WRITE_BIT | GL_MAP_INVALIDATE_BUFFER_BIT)
+        ctypes.memmove(buffer_ptr, pixels.ctypes.data + row * row_bytes, size)
+        glUnmapBuffer(GL_PIXEL_UNPACK_BUFFER)
+
+        glTexSubImage2D(GL_TEXTURE_2D, level, 0, row, img_w, rows, GL_RGBA, GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+        # unbind, or the next glTexImage2D with client memory would read from the PBO
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
+
+        self.frame_stats["bytes"] += size
+        self.frame_stats["bands"] += 1
+        self.stats["uploaded_bytes"] += size
+
+        job[1] = row + rows
+        if job[1] < img_h:
+            return
+
+        # the level is complete: sample from it (levels base..max are all uploaded)
+        if img_w == 1 and img_h == 1:
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAX_LEVEL, level)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_BASE_LEVEL, level)
+        levels.pop(0)
+        job[1] = 0
+        if not levels:
+            del self.uploads[texture]
+
+
+PLACEHOLDER_PIXEL = bytes([128, 128, 128, 255])
+
+def decode_image(file_path):
+    # runs in a worker thread: decode, flip (OpenGL expects the first row at the bottom) and build the mip chain
+    # returns [(level, width, height, RGBA pixels), ...] from level 0 down to 1x1
+    img = Image.open(file_path).convert("RGBA").transpose(Image.FLIP_TOP_BOTTOM)
+
+    levels = []
+    while True:
+        levels.append((len(levels), img.size[0], img.size[1], np.frombuffer(img.tobytes(), dtype=np.uint8)))
+        if img.size == (1, 1):
+            return levels
+        img = img.resize((max(img.size[0] // 2, 1), max(img.size[1] // 2, 1)), Image.BOX)
+
+def texture_bytes(width, height, bytes_per_pixel=4):
+    # approximate GPU memory of an RGBA8 texture with its full mip chain
+    size = 0
+    while True:
+        size += width * height * bytes_per_pixel
+        if width == 1 and height == 1:
+            return size
+        width, height = max(width // 2, 1), max(height // 2, 1)
+
+
+# textures shared by every chapter (they stay resident when the chapter is switched)
+texture_manager = TextureManager()
@@ -0,0 +1,64 @@
+import numpy as np
+
+#################################################################
+# Vectorized transforms                                         #
+# - builds the model matrices of N objects in one NumPy pass    #
+#   (N, 4, 4) float32, column-major like glm, ready to upload   #
+#################################################################
+
+def axis_angle_to_quat(axes, angles):
+    # axes: (N, 3) or (3,), angles: (N,) in radians -> (N, 4) unit quaternions (w, x, y, z, like glm.quat)
+    angles = np.asarray(angles, dtype=np.float32).reshape(-1)
+    axes   = np.broadcast_to(np.asarray(axes, dtype=np.float32), (len(angles), 3))
+    axes   = axes / np.linalg.norm(axes, axis=1, keepdims=True)
+
+    quats = np.empty((len(angles), 4), dtype=np.float32)
+    quats[:, 0]  = np.cos(angles / 2)
+    quats[:, 1:] = axes * np.sin(angles / 2)[:, None]
+    return quats
+
+def model_matrices(positions, quats=None, scales=None, out=None):
+    # translate(position) * rotate(quat) * scale(scale) of every object
+    # positions: (N, 3), quats: (N, 4) unit quaternions (w, x, y, z), scales: (N, 3) or (N,)
+    # out: optional (N, 4, 4) float32 array to fill (e.g. reused every frame) -> (N, 4, 4) float32, out[i][column][row]
+    positions = np.asarray(positions, dtype=np.float32).reshape(-1, 3)
+    count     = len(positions)
+    if out is None:
+        out = np.empty((count, 4, 4), dtype=np.float32)
+
+    # built as m[column][row][object] so that every element is a contiguous array over the objects,
+    # then transposed into out in one copy (writing out[:, col, row] directly is a strided write per element)
+    m = np.zeros((4, 4, count), dtype=np.float32)
+
+    # rotation part
+    if quats is None:
+        m[0, 0] = m[1, 1] = m[2, 2] = 1.0
+    else:
+        w, x, y, z = np.ascontiguousarray(np.asarray(quats, dtype=np.float32).reshape(-1, 4).T)
+        x2, y2, z2 = x + x, y + y, z + z
+        xx, yy, zz = x * x2, y * y2, z * z2
+        xy, xz, yz = x * y2, x * z2, y * z2
+        wx, wy, wz = w * x2, w * y2, w * z2
+
+        m[0, 0] = 1 - (yy + zz)
+        m[0, 1] = xy + wz
+        m[0, 2] = xz - wy
+        m[1, 0] = xy - wz
+        m[1, 1] = 1 - (xx + zz)
+        m[1, 2] = yz + wx
+        m[2, 0] = xz + wy
+        m[2, 1] = yz - wx
+        m[2, 2] = 1 - (xx + yy)
+
+    # scale part: column i of the rotation is scaled by scale i
+    if scales is not None:
+        scales = np.asarray(scales, dtype=np.float32)
+        scales = scales.reshape(1, -1) if scales.ndim == 1 else scales.reshape(-1, 3).T
+        m[:3, :3] *= np.broadcast_to(scales, (3, count))[:, None, :]
+
+    # translation part
+    m[3, :3] = positions.T
+    m[3, 3]  = 1.0
+
+    out[:] = m.transpose(2, 0, 1)
+    return out
@@ -12,6 +12,15 @@ from imgui.integrations.glfw import GlfwRenderer
 from camera import *
 from utils import *
 from func import *
+from visualizer.shader import reset_uniform_stats
+from visualizer.gl_state import gl_state, reset_state_stats
+from visualizer.render_queue import render_queue, reset_queue_stats
+from visualizer.mesh_arena import mesh_arenas
+from visualizer.primitives import Primitive
+from visualizer.stream_buffer import reset_stream_stats
+from visualizer.multi_draw import reset_batch_stats
+from visualizer.texture import texture_manager
+from visualizer.uniform_buffer import camera_buffer, material_buffer, light_buffer
 
 
 def main(args):
@@ -35,6 +44,18 @@ def main(args):
 
     # visualize
     wire_mode = False
+    uniform_stats = reset_uniform_stats()    # uniform uploads of the last frame
+    queue_stats   = reset_queue_stats()      # draws and binds of the render queue in the last frame
+    state_stats   = reset_state_stats()      # state calls issued / dropped by gl_state in the last frame
+    stream_stats  = reset_stream_stats()     # bytes written to the stream buffers in the last frame
+    batch_stats   = reset_batch_stats()      # objects and draw calls of the draw batchers in the last frame
+
+    # textures stay resident across chapter switches up to the budget
+    texture_manager.set_budget(args.texture_budget * 1024 * 1024)
+    texture_manager.upload_budget_ms = args.upload_budget
+
+    # vertex formats of the chapters' meshes (float32 to compare with the compact ones)
+    Primitive.COMPACT = not args.float_vertices
 
     # tutorial file list and currently rendered file
     file_dir_list, file_chap_list = get_tutorial_file_list()
@@ -51,8 +72,8 @@ def main(args):
         process_input(window)
         impl.process_inputs()
         
-        glViewport(args.window_size[0] - 300, 0, 300, args.window_size[1])
-        glScissor(args.window_size[0] - 300, 0, 300, args.window_size[1])
+        gl_state.viewport(args.window_size[0] - 300, 0, 300, args.window_size[1])
+        gl_state.scissor(args.window_size[0] - 300, 0, 300, args.window_size[1])
         # imgui setting
         imgui.new_frame()
 
@@ -133,6 +154,27 @@ def main(args):
         imgui.dummy(0, 5)
         imgui.text("Visual setting")
         _, wire_mode = imgui.checkbox("Wire mode", wire_mode)
+        imgui.text("Uniform uploads: %d (skipped %d)" % (uniform_stats["uploads"], uniform_stats["skipped"]))
+        if queue_stats["draws"]:
+            imgui.text("Queued draws: %d, binds: %d (saved %d)" % (queue_stats["draws"], queue_stats["binds"],
+                                                                   queue_stats["saved"]))
+        imgui.text("GL state calls: %d (skipped %d)" % (state_stats["calls"], state_stats["skipped"]))
+        if batch_stats["objects"]:
+            imgui.text("Batched: %d objects in %d draw calls" % (batch_stats["objects"], batch_stats["calls"]))
+        if stream_stats["bytes"]:
+            imgui.text("Streamed: %.1f KB, waits: %d, orphans: %d" % (stream_stats["bytes"] / 1024, stream_stats["waits"],
+                                                                     stream_stats["orphans"]))
+        imgui.text("Textures: %d (%.1f / %d MB)" % (len(texture_manager.textures), texture_manager.used_bytes / 1024 / 1024,
+                                                   args.texture_budget))
+        arena_stats = mesh_arenas.stats()
+        if arena_stats["meshes"]:
+            imgui.text("Mesh arenas: %d meshes, %.1f / %.1f KB" % (arena_stats["meshes"], arena_stats["used"] / 1024,
+                                                                   arena_stats["bytes"] / 1024))
+            imgui.text("Arena fragmentation: %.0f%%" % (100.0 * arena_stats["fragmentation"]))
+        if texture_manager.loading_count():
+            imgui.text("Loading textures: %d" % texture_manager.loading_count())
+            imgui.text("Texture upload: %.1f KB, %.2f ms" % (texture_manager.frame_stats["bytes"] / 1024,
+                                                            texture_manager.frame_stats["ms"]))
 
         imgui.end_group()
         
@@ -153,6 +195,10 @@ def main(args):
             chapter_name = file_chap_list[chapter].split('/')
             file_dir     = file_dir_list[chapter]
 
+            # free the GPU resources of the previous chapter
+            cur_file.destroy()
+            render_queue.clear()
+
             file_module = '{}.{}.{}'.format(chapter_name[0], chapter_name[1], "content")
             cur_file     = importlib.import_module(file_module)
             cur_file     = getattr(cur_file, 'Content')(window, viewport_size, cam, file_dir)
@@ -171,23 +217,35 @@ def main(args):
 
         imgui.end()
 
-        glViewport(0, 0, viewport_size[0], viewport_size[1])
-        glScissor(0, 0, viewport_size[0], viewport_size[1])
-
-        
         # opengl render
-        gl.glEnable(GL_DEPTH_TEST)
-        
-        glPolygonMode(GL_FRONT_AND_BACK, GL_LINE if wire_mode else GL_FILL)
+        # : the uploads and the resource creation first, they leave the state unknown to gl_state
+        texture_manager.update()    # stream the images decoded in the background (within the upload budget)
+        cur_file.prepare()      # create (or re-create) the GPU resources only when needed
+
+        gl_state.viewport(0, 0, viewport_size[0], viewport_size[1])
+        gl_state.scissor(0, 0, viewport_size[0], viewport_size[1])
+        gl_state.enable(GL_DEPTH_TEST)
+        gl_state.polygon_mode(GL_LINE if wire_mode else GL_FILL)
+        camera_buffer.set_camera(cam, viewport_size[0] / viewport_size[1])    # projection / view of every program
         cur_file.render()
+        uniform_stats = reset_uniform_stats()
+        queue_stats   = reset_queue_stats()
+        state_stats   = reset_state_stats()
+        stream_stats  = reset_stream_stats()
+        batch_stats   = reset_batch_stats()
 
         # render and swap buffers
-        glPolygonMode(GL_FRONT_AND_BACK, GL_FILL)
+        gl_state.polygon_mode(GL_FILL)
         imgui.render()
         impl.render(imgui.get_draw_data())
+        gl_state.invalidate()       # : imgui binds its own program, VAO, texture and state with the plain GL calls
         glfw.swap_buffers(window)
 
     cur_file.destroy()
+    texture_manager.clear()
+    mesh_arenas.clear()
+    for uniform_buffer in (camera_buffer, material_buffer, light_buffer):
+        uniform_buffer.delete()
 
     impl.shutdown()
     glfw.terminate()
@@ -196,6 +254,9 @@ def main(args):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("-w", "--window_size",  dest="window_size", default=[1280, 720])
+    parser.add_argument("--texture_budget", dest="texture_budget", type=int, default=256, help="VRAM budget of the textures (MB)")
+    parser.add_argument("--upload_budget",  dest="upload_budget",  type=float, default=4.0, help="texture upload time per frame (ms)")
+    parser.add_argument("--float_vertices", dest="float_vertices", action="store_true", help="upload the meshes as float32 (no compact vertex formats)")
 
     args = parser.parse_args()
 
@@ -0,0 +1,131 @@
+import numpy as np
+import glm
+from OpenGL.GL import *
+
+from visualizer.shader   import UNIFORM_BLOCK_BINDINGS, uniform_stats
+from visualizer.gl_state import gl_state
+
+#################################################################
+# Uniform buffers                                               #
+# - std140 uniform blocks shared by every program, bound once   #
+#   to the binding point of the block                           #
+# - a block is uploaded once per frame, not once per program    #
+# - structs are kept in NumPy structured arrays with the std140 #
+#   layout, and a whole struct is uploaded with one call        #
+#################################################################
+
+# glsl type -> (numpy format, std140 base alignment, size in bytes)
+STD140_TYPES = {
+    "float": ("<f4",           4,  4),
+    "int"  : ("<i4",           4,  4),
+    "vec2" : (("<f4", 2),      8,  8),
+    "vec3" : (("<f4", 3),      16, 12),
+    "vec4" : (("<f4", 4),      16, 16),
+    "mat4" : (("<f4", (4, 4)), 16, 64),
+}
+
+def std140_dtype(members):
+    # members: [(glsl type, name), ...] in the declaration order of a glsl struct
+    # -> structured dtype with the std140 offsets (a struct is padded to a multiple of 16 bytes,
+    #    which is also the stride of an array of them)
+    names, formats, offsets, offset = [], [], [], 0
+    for glsl_type, name in members:
+        np_format, alignment, size = STD140_TYPES[glsl_type]
+        offset = (offset + alignment - 1) // alignment * alignment
+        names.append(name)
+        formats.append(np_format)
+        offsets.append(offset)
+        offset += size
+    return np.dtype({"names": names, "formats": formats, "offsets": offsets, "itemsize": (offset + 15) // 16 * 16})
+
+# struct Material / struct Light of the lighting chapters (GLSL declarations in the same order)
+# : a float right after a vec3 fills the vec3's padding
+MATERIAL_DTYPE = std140_dtype([("vec3", "ambient"),   ("float", "shininess"),
+                               ("vec3", "diffuse"),
+                               ("vec3", "specular")])
+LIGHT_DTYPE    = std140_dtype([("vec3", "position"),  ("float", "constant"),
+                               ("vec3", "direction"), ("float", "linear"),
+                               ("vec3", "ambient"),   ("float", "quadratic"),
+                               ("vec3", "diffuse"),   ("float", "cutOff"),
+                               ("vec3", "specular"),  ("float", "outerCutOff")])
+
+class UniformBuffer:
+    def __init__(self, block_name, size):
+        # size: bytes of the block in the std140 layout
+        self.block_name = block_name
+        self.binding    = UNIFORM_BLOCK_BINDINGS[block_name]
+        self.size       = size
+        self.UBO        = None
+        self.data       = None      # : bytes of the last upload (an identical block is not uploaded again)
+
+    def update(self, data):
+        # data: bytes of the block in the std140 layout (or of its beginning, e.g. the used part of an array)
+        # : the buffer is created on the first update (needs the OpenGL context)
+        if len(data) > self.size:
+            raise TypeError("%d bytes of data for the %d bytes of uniform block '%s'" % (len(data), self.size, self.block_name))
+
+        if self.UBO is None:
+            self.UBO = glGenBuffers(1)
+            gl_state.bind_buffer(GL_UNIFORM_BUFFER, self.UBO)
+            glBufferData(GL_UNIFORM_BUFFER, self.size, None, GL_DYNAMIC_DRAW)
+            gl_state.bind_buffer_base(GL_UNIFORM_BUFFER, self.binding, self.UBO)
+        elif data == self.data:
+            uniform_stats["skipped"] += 1
+            return
+
+        gl_state.bind_buffer(GL_UNIFORM_BUFFER, self.UBO)
+        glBufferSubData(GL_UNIFORM_BUFFER, 0, len(data), data)
+        self.data = data
+        uniform_stats["uploads"] += 1
+
+    def delete(self):
+        # (before the OpenGL context is destroyed)
+        if self.UBO is not None:
+            glDeleteBuffers(1, [self.UBO])
+            gl_state.forget(self.UBO)
+            self.UBO  = None
+            self.data = None
+
+
+class CameraBuffer(UniformBuffer):
+    # layout (std140) uniform Camera {
+    #     mat4 projection;    // offset 0
+    #     mat4 view;          // offset 64
+    # };
+    def __init__(self):
+        super().__init__("Camera", 2 * 64)
+        self.proj_mat, self.view_mat = glm.mat4(1.0), glm.mat4(1.0)     # : of the last set (e.g. light clustering)
+
+    def set_matrices(self, proj_mat, view_mat):
+        # to_bytes() is the column-major layout of the matrix (std140 mat4 = 4 column vec4s)
+        self.proj_mat, self.view_mat = glm.mat4(proj_mat), glm.mat4(view_mat)
+        self.update(proj_mat.to_bytes() + view_mat.to_bytes())
+
+    def set_camera(self, camera, aspect, near=0.1, far=100.0):
+        self.set_matrices(glm.perspective(glm.radians(camera.fov), aspect, near, far), camera.get_view_matrix())
+
+
+class StructBuffer(UniformBuffer):
+    # a block holding a struct (or an array of structs), e.g. layout (std140) uniform LightBlock { Light light; };
+    def __init__(self, block_name, dtype, count=1):
+        super().__init__(block_name, dtype.itemsize * count)
+        self.values = np.zeros(count, dtype=dtype)     # : the structs on the CPU side, in the std140 layout
+
+    def set(self, index=0, **fields):
+        # set members of struct 'index' (the others keep their value), upload() sends them
+        for name, value in fields.items():
+            self.values[name][index] = value
+
+    def upload(self):
+        # the whole block with one glBufferSubData (not one glUniform* per member)
+        self.update(self.values.tobytes())
+
+
+# camera block shared by every chapter
+# : the viewer sets it from its camera once per frame, before the chapter renders
+#   (a chapter with its own view, e.g. 06_coordinate_systems, sets its matrices in render())
+camera_buffer = CameraBuffer()
+
+# material and light of the lighting chapters (set by the chapter before it draws)
+material_buffer = StructBuffer("MaterialBlock", MATERIAL_DTYPE)
+light_buffer    = StructBuffer("LightBlock", LIGHT_DTYPE)
@@ -7,6 +7,8 @@ import imgui
 from OpenGL.GL import *
 from PIL import Image
 
+from visualizer.texture import texture_manager
+
 ### functions
 # whenever the window size changed (by OS or user) this callback function executes
 def framebuffer_size_callback(window, width, height):
@@ -77,8 +79,9 @@ def get_img_list(file_path):
     return img_path_list, img_name_list
 
 def get_texture_list(img_file_path):
+    # shared textures of the texture manager (give them back with texture_manager.release())
     img_path_list, img_name_list = get_img_list(img_file_path)
-    texture_list = [load_texture(img) for img in img_path_list]
+    texture_list = [texture_manager.load(img) for img in img_path_list]
 
     return texture_list, img_name_list
 
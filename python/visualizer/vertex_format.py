@@ -0,0 +1,89 @@
+import numpy as np
+
+from OpenGL.GL import *
+
+from visualizer.vertex_layout import VertexLayout, attribute_bytes
+
+#################################################################
+# Compact vertex formats                                        #
+# - compact_vertices() stores every float attribute of a mesh   #
+#   in the smallest format reproducing it within an error bound #
+#   unit vectors: GL_INT_2_10_10_10_REV, 4 bytes                #
+#   others      : GL_HALF_FLOAT, 2 bytes per component          #
+#   scaled      : int16 normalized to the bounds of the mesh    #
+#                 (optional: the caller applies scale/offset)   #
+#   else        : float32                                       #
+# - the attributes stay 4-byte aligned, the vertex shaders read #
+#   them as floats as before (no shader change)                 #
+# - every chapter uploads the built-in shapes through           #
+#   Primitive.geometry(): compact, float32 with the viewer's    #
+#   --float_vertices option (to compare)                        #
+#################################################################
+
+# default error bound: absolute, in the units of the attribute (the texel of a 1024 texture, ~0.06 degree of a normal)
+MAX_ERROR = 1e-3
+
+def pack_snorm_10_10_10(vectors):
+    # (N, 3) in [-1, 1] -> GL_INT_2_10_10_10_REV words (x in the low bits, w = 0)
+    q = np.round(np.clip(vectors, -1.0, 1.0) * 511.0).astype(np.int64) & 0x3FF
+    return (q[:, 0] | q[:, 1] << 10 | q[:, 2] << 20).astype(np.uint32)
+
+def unpack_snorm_10_10_10(packed):
+    # the vectors OpenGL reads from the words (GL 4.2+ rule: c / 511, clamped to -1)
+    # : GL 3.3 drivers use (2c + 1) / 1023 instead, at most 1/1023 away
+    words = packed.astype(np.int64)
+    q = np.stack([(words >> shift) & 0x3FF for shift in (0, 10, 20)], axis=1)
+    q = np.where(q >= 512, q - 1024, q)
+    return np.maximum(q / 511.0, -1.0)
+
+def encode_attribute(values, max_error, scaled=False):
+    # (numpy format, GL type, normalized, components, encoded values, (scale, offset) or None) of the (N, size) values
+    # : the first format within max_error, the smallest first
+    size = values.shape[1]
+    if size == 3 and np.abs(np.linalg.norm(values, axis=1) - 1.0).max() <= max_error:
+        packed = pack_snorm_10_10_10(values)
+        if np.abs(unpack_snorm_10_10_10(packed) - values).max() <= max_error:
+            return "<u4", GL_INT_2_10_10_10_REV, True, 4, packed, None
+
+    half = values.astype(np.float16)
+    if np.isfinite(half).all() and np.abs(half.astype(np.float32) - values).max() <= max_error:
+        return ("<f2", (size,)), GL_HALF_FLOAT, False, size, half, None
+
+    if scaled:
+        # value = q / 32767 * scale + offset (the bounds of the mesh map to [-1, 1])
+        low, high = values.min(axis=0), values.max(axis=0)
+        offset    = (low + high) / 2.0
+        scale     = np.maximum((high - low) / 2.0, np.finfo(np.float32).tiny)
+        q         = np.round((values - offset) / scale * 32767.0).astype(np.int16)
+        if np.abs(q / 32767.0 * scale + offset - values).max() <= max_error:
+            return ("<i2", (size,)), GL_SHORT, True, size, q, (scale.astype(np.float32), offset.astype(np.float32))
+
+    return ("<f4", (size,)), GL_FLOAT, False, size, values, None
+
+def compact_vertices(vertices, layout, max_error=MAX_ERROR, scaled=()):
+    # (vertex bytes, layout, {attribute name: (scale, offset)}) of float vertices interleaved as 'layout' (float attributes)
+    # scaled: names of the attributes that may be normalized to the mesh bounds (e.g. "aPos" of a large mesh),
+    #         the caller applies the returned (scale, offset) of the ones that were (e.g. in the model matrix)
+    rows = np.ascontiguousarray(vertices, dtype=np.float32).reshape(-1, layout.stride // 4)
+
+    fields, attributes, decodes, offset = [], [], {}, 0
+    for name, size, gl_type, _, attribute_offset in layout.attributes:
+        if gl_type != GL_FLOAT:
+            raise TypeError("compact_vertices() reads float attributes, {} is not".format(name))
+        values = rows[:, attribute_offset // 4 : attribute_offset // 4 + size]
+        fmt, gl_type, normalized, components, encoded, decode = encode_attribute(values, max_error, name in scaled)
+
+        fields.append((name, fmt, offset, encoded))
+        attributes.append((name, components, gl_type, normalized, offset))
+        if decode is not None:
+            decodes[name] = decode
+        offset += -(-attribute_bytes(components, gl_type) // 4) * 4     # : next 4-byte boundary
+
+    dtype = np.dtype({"names":   [field[0] for field in fields],
+                      "formats": [field[1] for field in fields],
+                      "offsets": [field[2] for field in fields],
+                      "itemsize": offset})
+    data = np.zeros(len(rows), dtype=dtype)
+    for name, _, _, encoded in fields:
+        data[name] = encoded
+    return data.view(np.uint8), VertexLayout(attributes, offset), decodes
@@ -0,0 +1,90 @@
+import ctypes
+
+from OpenGL.GL import *
+
+from visualizer.gl_state import gl_state
+
+#################################################################
+# Vertex layouts                                                #
+# - a layout declares the interleaved attributes of a vertex    #
+#   once: shader attribute name, components, GL type,           #
+#   normalized, byte offset (and the stride)                    #
+# - vertex_arrays.get() returns the VAO of (buffers, layout,    #
+#   attribute locations of the program): created on the first   #
+#   request, shared by the identical configurations after it    #
+# - the VAOs live as long as their buffers: release_buffers()   #
+#   deletes the VAOs reading them                               #
+#################################################################
+
+# bytes of one component
+TYPE_SIZES = {GL_FLOAT: 4, GL_HALF_FLOAT: 2, GL_INT: 4, GL_UNSIGNED_INT: 4,
+              GL_SHORT: 2, GL_UNSIGNED_SHORT: 2, GL_BYTE: 1, GL_UNSIGNED_BYTE: 1}
+# bytes of the 4 components of a packed type (its attributes have 4 components)
+PACKED_SIZES = {GL_INT_2_10_10_10_REV: 4, GL_UNSIGNED_INT_2_10_10_10_REV: 4}
+
+def attribute_bytes(size, gl_type):
+    # bytes of an attribute of 'size' components
+    if gl_type in PACKED_SIZES:
+        return PACKED_SIZES[gl_type]
+    return size * TYPE_SIZES[gl_type]
+
+class VertexLayout:
+    def __init__(self, attributes, stride=None):
+        # attributes: ((shader attribute name, components, GL type, normalized, byte offset), ...)
+        # stride    : bytes per vertex (default: the end of the last attribute, no padding)
+        self.attributes = tuple((name, size, int(gl_type), bool(normalized), offset)
+                                for name, size, gl_type, normalized, offset in attributes)
+        self.stride = stride or max(offset + attribute_bytes(size, gl_type) for _, size, gl_type, _, offset in self.attributes)
+        self.key    = (self.attributes, self.stride)
+
+    def names(self):
+        return [attribute[0] for attribute in self.attributes]
+
+    def apply(self, locations):
+        # point the attributes the program reads (location >= 0) into the bound VBO
+        for (_, size, gl_type, normalized, offset), location in zip(self.attributes, locations):
+            if location < 0:
+                continue
+            glVertexAttribPointer(location, size, gl_type, GL_TRUE if normalized else GL_FALSE, self.stride, ctypes.c_void_p(offset))
+            glEnableVertexAttribArray(location)
+
+
+class VertexArrayCache:
+    def __init__(self):
+        # (VBO, EBO, layout key, attribute locations) -> VAO
+        self.vaos  = {}
+        self.stats = {"hits": 0, "creates": 0}
+
+    def get(self, program, layout, VBO, EBO=None):
+        # VAO reading the layout from VBO (indices from EBO) for the attribute locations of program (id)
+        # : programs with the same locations share it (e.g. the variants of a shader, a rebuilt shader)
+        locations = tuple(int(glGetAttribLocation(program, name)) for name in layout.names())
+        key = (int(VBO), int(EBO) if EBO is not None else 0, layout.key, locations)
+        if key in self.vaos:
+            self.stats["hits"] += 1
+            return self.vaos[key]
+
+        vao = glGenVertexArrays(1)
+        glBindVertexArray(vao)
+        glBindBuffer(GL_ARRAY_BUFFER, VBO)
+        if EBO is not None:
+            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, EBO)     # (the element buffer binding is stored in the VAO)
+        layout.apply(locations)
+        glBindVertexArray(0)
+        gl_state.invalidate()    # : set up with the plain GL calls (at resource creation)
+
+        self.vaos[key] = vao
+        self.stats["creates"] += 1
+        return vao
+
+    def release_buffers(self, *buffers):
+        # delete the VAOs reading any of the buffers (before the buffers themselves are deleted)
+        buffers = set(int(buffer) for buffer in buffers if buffer is not None)
+        for key in [key for key in self.vaos if key[0] in buffers or key[1] in buffers]:
+            vao = self.vaos.pop(key)
+            glDeleteVertexArrays(1, [vao])
+            gl_state.forget(vao)
+
+
+# VAOs shared by the chapters
+vertex_arrays = VertexArrayCache()